@@ -1,21 +1,75 @@
+import copy
+import html
 import os
-import json
 import random
 import string
+import time
 from datetime import datetime
 
-from flask import Flask, send_from_directory, request, jsonify, Response, stream_with_context
-import threading
-import queue
-import time
+from flask import Flask, request, jsonify, Response, stream_with_context
+
+import board_ops
+import board_render
+import dashboard
+import draw_engine
+import grading
+import metrics
+import puzzle_index
+import room_bus
+import room_timeline
+import static_assets
+from deck_index import DeckIndex
+from room_store import JournalBackend, JsonDirBackend, RoomNotFound, RoomStore, SqliteBackend
 
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-SAVES_DIR = os.path.join(BASE_DIR, "saves")
+SAVES_DIR = os.environ.get("SAVES_DIR") or os.path.join(BASE_DIR, "saves")
 DECK_PATH = os.path.join(BASE_DIR, "deck.json")
 
 os.makedirs(SAVES_DIR, exist_ok=True)
 
+# ROOM_BUS=sqlite lets several Gunicorn workers share rooms (events, presence, state)
+_multiprocess = os.environ.get("ROOM_BUS", "local") == "sqlite"
+
+# Hot rooms live in memory; dirty ones are written to saves/ by a background thread.
+# ROOM_STORAGE=json keeps plain whole-file snapshots, without the journal;
+# ROOM_STORAGE=sqlite keeps one row per room in saves/.rooms.sqlite3 (or ROOM_DB_PATH).
+_compress_saves = os.environ.get("ROOM_SNAPSHOT_GZIP", "0") == "1"
+_room_storage = os.environ.get("ROOM_STORAGE", "journal")
+if _room_storage == "json":
+    _room_backend = JsonDirBackend(SAVES_DIR, compress=_compress_saves)
+elif _room_storage == "sqlite":
+    _room_backend = SqliteBackend(
+        os.environ.get("ROOM_DB_PATH") or os.path.join(SAVES_DIR, ".rooms.sqlite3"),
+        compress=_compress_saves,
+    )
+else:
+    _room_backend = JournalBackend(
+        SAVES_DIR,
+        compress=_compress_saves,
+        compact_every=int(os.environ.get("ROOM_JOURNAL_COMPACT", "50")),
+    )
+# ROOM_RETENTION_DAYS archives rooms left untouched that long (ROOM_RETENTION=purge deletes them)
+_retention_days = float(os.environ.get("ROOM_RETENTION_DAYS", "0"))
+rooms = RoomStore(
+    _room_backend,
+    flush_interval=float(os.environ.get("ROOM_FLUSH_INTERVAL", "1.0")),
+    shared=_multiprocess,
+    retention=_retention_days * 86400 or None,
+    archive=os.environ.get("ROOM_RETENTION", "archive") != "purge",
+)
+rooms.start()
+
+
+# deck.json compiled once, recompiled when the file changes
+decks = DeckIndex(DECK_PATH)
+# Answer key for server-side grading, same rules as the client score
+grader = grading.Grader(os.path.join(BASE_DIR, "static", "corrige.json"))
+# Server-side SVG of room boards, cached per room version
+renderer = board_render.Renderer()
+# Filterable, paginated puzzle catalogue behind /api/puzzles
+puzzles = puzzle_index.PuzzleIndex(os.path.join(BASE_DIR, "static", "puzzles.json"), decks.get)
+
 
 def gen_room_code(length: int = 6) -> str:
     alphabet = string.ascii_uppercase + string.digits
@@ -23,179 +77,172 @@ def gen_room_code(length: int = 6) -> str:
 
 
 app = Flask(__name__, static_folder="static", static_url_path="")
+# Fingerprinted, precompressed app.js/styles.css/JSON files and the index.html pointing at them
+assets = static_assets.StaticAssets(app.static_folder)
 
 # --- Simple in-memory pub/sub per room for SSE ---
-_room_lock = threading.Lock()
-_room_subs: dict[str, list[queue.Queue]] = {}
-_room_clients: dict[str, dict[str, dict]] = {}
+_sse_queue_size = int(os.environ.get("SSE_QUEUE_SIZE", "256"))
+# Joins/leaves are sent as one presence_delta per room and window; clients that
+# stop sending heartbeats are dropped after PRESENCE_TTL seconds
+_presence = {
+    "presence_window": float(os.environ.get("PRESENCE_WINDOW", "0.25")),
+    "presence_ttl": float(os.environ.get("PRESENCE_TTL", "60")),
+    # Drag/pointer updates are merged per client and sent every LIVE_WINDOW seconds
+    "live_window": float(os.environ.get("LIVE_WINDOW", "0.05")),
+}
+if _multiprocess:
+    bus = room_bus.SqliteBus(
+        os.environ.get("ROOM_BUS_PATH") or os.path.join(SAVES_DIR, ".events.sqlite3"),
+        queue_size=_sse_queue_size,
+        **_presence,
+    )
+else:
+    # Last SSE_REPLAY_SIZE events per room are kept for reconnecting streams
+    bus = room_bus.RoomBus(
+        queue_size=_sse_queue_size,
+        replay_size=int(os.environ.get("SSE_REPLAY_SIZE", "512")),
+        **_presence,
+    )
+bus.start()
+
+# METRICS=1 serves Prometheus metrics at /metrics; off, nothing is instrumented
+if metrics.ENABLED:
+    metrics.install(app, bus, rooms)
+
+
+# Teacher sessions and the per-room summaries of their dashboard stream
+sessions = dashboard.SessionStore(os.path.join(SAVES_DIR, ".sessions"))
+summaries = dashboard.Summaries(bus, grader, interval=float(os.environ.get("DASHBOARD_INTERVAL", "1.0")))
+summaries.start()
+
+
+# Edit history of every room: keyframes plus deltas, replayable at any time or version.
+# TIMELINE_RETENTION_DAYS and TIMELINE_MAX_VERSIONS bound it (0 keeps everything)
+timeline = room_timeline.Timeline(
+    os.environ.get("ROOM_TIMELINE_PATH") or os.path.join(SAVES_DIR, ".timeline.sqlite3"),
+    interval=float(os.environ.get("TIMELINE_INTERVAL", "2.0")),
+    keyframe_every=int(os.environ.get("TIMELINE_KEYFRAME_EVERY", "32")),
+    retention=float(os.environ.get("TIMELINE_RETENTION_DAYS", "90")) * 86400 or None,
+    max_versions=int(os.environ.get("TIMELINE_MAX_VERSIONS", "10000")) or None,
+)
+timeline.start()
+
+
+def _publish(room_id: str, event: dict, envelope: dict | None = None):
+    bus.publish(room_id, event)
+    if envelope is not None:
+        summaries.note(room_id, envelope)
+        timeline.note(room_id, envelope)
 
 
-def _publish(room_id: str, event: dict):
-    with _room_lock:
-        subs = list(_room_subs.get(room_id, []))
-    for q in subs:
-        try:
-            q.put_nowait(event)
-        except Exception:
-            pass
+def _presence_snapshot(room_id: str) -> list[dict]:
+    return bus.roster(room_id)
 
 
-def _sse_format(event: dict) -> str:
-    etype = event.get("type", "message")
-    data = json.dumps(event.get("data", {}), ensure_ascii=False)
-    return f"event: {etype}\n" + "data: " + data + "\n\n"
+def _blank_room(code: str, team=None) -> dict:
+    return {"roomId": code, "team": team, "state": {"blocks": [], "links": [], "draws": []}, "meta": {}}
 
 
-def _presence_snapshot(room_id: str) -> list[dict]:
-    with _room_lock:
-        clients = _room_clients.get(room_id, {})
-        return [{"id": cid, "name": info.get("name") or "Invité"} for cid, info in clients.items()]
+def _stamp(old: dict) -> int:
+    """Mark a room envelope as modified now and return its new version."""
+    old["savedAt"] = datetime.utcnow().isoformat() + "Z"
+    old["version"] = old.get("version", 0) + 1
+    return old["version"]
 
 
 @app.get("/")
 def index():
-    return send_from_directory(app.static_folder, "index.html")
+    return _asset_response(assets.index(), "no-cache")
 
 
-def _load_deck():
-    with open(DECK_PATH, "r", encoding="utf-8") as f:
-        return json.load(f)
+@app.get("/assets/<name>")
+def hashed_asset(name: str):
+    asset = assets.hashed(name)
+    if asset is None:
+        return jsonify({"error": "Fichier introuvable"}), 404
+    # The name changes with the content: cache for good
+    return _asset_response(asset, "public, max-age=31536000, immutable")
 
 
-def _slugify(label: str) -> str:
-    s = label.lower()
-    repl = {
-        "é": "e", "è": "e", "ê": "e", "à": "a", "â": "a", "ô": "o", "ù": "u", "û": "u",
-        "ï": "i", "î": "i", "ç": "c",
-    }
-    for k, v in repl.items():
-        s = s.replace(k, v)
-    allowed = string.ascii_lowercase + string.digits + "- "
-    s = "".join(ch if ch in allowed else "-" for ch in s)
-    s = s.replace(" ", "-").replace("--", "-").strip("-")
-    return s
-
-
-def _card_id(prefix: str, label: str) -> str:
-    return f"{prefix}:{_slugify(label)}"
-
-
-def _build_cards(deck: dict) -> dict:
-    # Returns mapping category -> list of cards {id,label,category}
-    mapping = {
-        "Sources": "src",
-        "Traitement": "trt",
-        "Communication": "com",
-        "CapteursActionneurs": "cap",
-        "Usages": "use",
-    }
-    cards = {}
-    for cat, items in deck.get("categories", {}).items():
-        if cat not in mapping:
-            continue
-        pref = mapping[cat]
-        cards[cat] = [{
-            "id": _card_id(pref, label),
-            "label": label,
-            "category": cat,
-        } for label in items]
-    return cards
-
-
-def _alea_preferences(deck: dict) -> dict[str, set[str]]:
-    """Map each alea/problématique to a set of preferred card ids."""
-    # Helper to build card id quickly
-    def cid(cat_label: str, item_label: str) -> str:
-        mapping = {
-            "Sources": "src",
-            "Traitement": "trt",
-            "Communication": "com",
-            "CapteursActionneurs": "cap",
-            "Usages": "use",
-        }
-        pref = mapping.get(cat_label)
-        return f"{pref}:{_slugify(item_label)}"
-
-    prefs: dict[str, set[str]] = {}
-
-    def add(alea_label: str, pairs: list[tuple[str, str]]):
-        s = prefs.setdefault(alea_label, set())
-        for cat, item in pairs:
-            s.add(cid(cat, item))
-
-    # Define simple heuristic preferences per problématique
-    add("Ombre", [
-        ("Sources", "Batterie 12 V"), ("Sources", "Prise murale"), ("Sources", "Dynamo (vélo)"),
-        ("Traitement", "Régulateur (stabilise)"), ("Traitement", "Convertisseur DC/DC"), ("Traitement", "Onduleur (DC→AC)"),
-    ])
-    add("Panne de batterie", [
-        ("Sources", "Prise murale"), ("Sources", "Soleil (panneau)"), ("Sources", "Vent (éolienne)"), ("Sources", "Dynamo (vélo)"),
-        ("Traitement", "Régulateur (stabilise)"), ("Traitement", "Disjoncteur/Fusible"),
-    ])
-    add("Câble trop long (perte)", [
-        ("Communication", "Routeur Wi-Fi"), ("Communication", "Point d’accès"), ("Communication", "Antenne tour"), ("Communication", "Satellite"),
-        ("Traitement", "Convertisseur DC/DC"), ("Usages", "Répéteur d’urgence"),
-    ])
-    add("Polarité inversée", [
-        ("Traitement", "Régulateur (stabilise)"), ("Traitement", "Disjoncteur/Fusible"),
-    ])
-    add("Surcharge", [
-        ("Traitement", "Disjoncteur/Fusible"), ("Traitement", "Régulateur (stabilise)"),
-    ])
-    add("Température élevée", [
-        ("CapteursActionneurs", "Capteur température"), ("CapteursActionneurs", "Ventilateur"),
-    ])
-
-    # Ensure only items that exist in the deck are kept (robustness)
-    valid_ids = set()
-    for cat, items in deck.get("categories", {}).items():
-        for label in items:
-            valid_ids.add(_card_id({
-                "Sources": "src", "Traitement": "trt", "Communication": "com",
-                "CapteursActionneurs": "cap", "Usages": "use",
-            }[cat], label))
-    for k, s in list(prefs.items()):
-        prefs[k] = {i for i in s if i in valid_ids}
-    return prefs
+@app.get("/<any(app.js, styles.css, puzzles.json, corrige.json):name>")
+def plain_asset(name: str):
+    return _asset_response(assets.plain(name), "no-cache")
 
 
-@app.get("/deck")
-def get_deck():
+def _asset_response(asset: static_assets.Asset, cache_control: str):
+    encoding = static_assets.pick_encoding(request.headers.get("Accept-Encoding", ""), asset.variants)
+    resp = Response(asset.variants[encoding] if encoding else asset.body, content_type=asset.mimetype)
+    if encoding:
+        resp.headers["Content-Encoding"] = encoding
+    resp.headers["Vary"] = "Accept-Encoding"
+    resp.set_etag(f"{asset.etag}-{encoding}" if encoding else asset.etag)
+    resp.headers["Cache-Control"] = cache_control
+    return resp.make_conditional(request)
+
+
+def _json_conditional(payload):
+    """JSON response with an ETag of its body; 304 when the client has it already."""
+    resp = jsonify(payload)
+    resp.add_etag()
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp.make_conditional(request)
+
+
+def _deck_response():
     try:
-        deck = _load_deck()
-        return jsonify(deck)
+        deck = decks.get()
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+    resp = Response(deck.body, mimetype="application/json")
+    resp.set_etag(deck.etag)
+    # Revalidate every time so an edited deck.json shows up at once
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp.make_conditional(request)
+
+
+@app.get("/deck")
+def get_deck():
+    return _deck_response()
 
 
 @app.get("/api/deck")
 def api_deck():
+    return _deck_response()
+
+
+@app.get("/api/puzzles")
+def api_puzzles():
     try:
-        deck = _load_deck()
-        return jsonify(deck)
+        body, etag = puzzles.query({name: request.args.getlist(name) for name in request.args})
+    except puzzle_index.QueryError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+    resp = Response(body, mimetype="application/json")
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp.make_conditional(request)
 
 
 @app.post("/create")
 def create_room():
     data = request.get_json(silent=True) or {}
     team = data.get("team", "")
-    code = gen_room_code()
-    save_path = os.path.join(SAVES_DIR, f"{code}.json")
-    payload = {
-        "roomId": code,
-        "team": team,
-        "createdAt": datetime.utcnow().isoformat() + "Z",
-        "state": {
-            "blocks": [],
-            "links": [],
-            "draws": [],
-        },
-        "meta": {},
-    }
-    with open(save_path, "w", encoding="utf-8") as f:
-        json.dump(payload, f, ensure_ascii=False, indent=2)
+    while True:
+        code = gen_room_code()
+        payload = {
+            "roomId": code,
+            "team": team,
+            "createdAt": datetime.utcnow().isoformat() + "Z",
+            "state": {
+                "blocks": [],
+                "links": [],
+                "draws": [],
+            },
+            "meta": {},
+        }
+        if rooms.create(code, payload):
+            break
     return jsonify({"roomId": code})
 
 
@@ -203,10 +250,9 @@ def create_room():
 def join_room():
     data = request.get_json(silent=True) or {}
     code = (data.get("roomId") or "").upper()
-    path = os.path.join(SAVES_DIR, f"{code}.json")
     if not code:
         return jsonify({"error": "roomId requis"}), 400
-    if not os.path.exists(path):
+    if not rooms.exists(code):
         return jsonify({"error": "Salle introuvable"}), 404
     return jsonify({"roomId": code})
 
@@ -217,19 +263,26 @@ def save_state():
     code = (data.get("roomId") or "").upper()
     if not code:
         return jsonify({"error": "roomId requis"}), 400
-    path = os.path.join(SAVES_DIR, f"{code}.json")
     envelope = {
         "roomId": code,
         "team": data.get("team"),
-        "savedAt": datetime.utcnow().isoformat() + "Z",
         "state": data.get("state", {}),
         "meta": data.get("meta", {}),
     }
     try:
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(envelope, f, ensure_ascii=False, indent=2)
-        # Broadcast to room subscribers if any
-        _publish(code, {"type": "state_sync", "data": envelope})
+        board_ops.check_state(envelope["state"])
+    except board_ops.PatchError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        def replace(old: dict):
+            version = old.get("version", 0)
+            old.clear()
+            old.update(envelope, version=version)
+            _stamp(old)
+            # Broadcast to room subscribers if any
+            _publish(code, {"type": "state_sync", "data": dict(old)}, old)
+
+        rooms.mutate(code, replace, create=dict)
         return jsonify({"ok": True})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -238,126 +291,107 @@ def save_state():
 @app.get("/load/<room_id>")
 def load_state(room_id: str):
     code = (room_id or "").upper()
-    path = os.path.join(SAVES_DIR, f"{code}.json")
-    if not os.path.exists(path):
+    payload = rooms.get(code)
+    if payload is None:
         return jsonify({"error": "Salle introuvable"}), 404
-    with open(path, "r", encoding="utf-8") as f:
-        payload = json.load(f)
-    return jsonify(payload)
+    return _json_conditional(payload)
+
+
+def _draw_seed(data: dict):
+    seed = data.get("seed")
+    return seed if isinstance(seed, (int, str)) else None
+
+
+def _draw_limit(engine: draw_engine.DrawEngine, count: int, sequences: int, hands: list, exact: bool = False) -> dict:
+    """Extra response fields when the hand space holds fewer proposals than asked.
+
+    ``exact``: the hands come from a known space even if ``possible`` cannot tell (puzzle draws).
+    """
+    if len(hands) >= max(1, sequences) or (not exact and engine.possible(count) is None):
+        return {}
+    return {"possible": len(hands), "message": f"Seulement {len(hands)} séquence(s) possible(s) avec {count} cartes"}
+
+
+# Proposals one room draw may ask for
+MAX_DRAW_SEQUENCES = 100
+
+
+def _draw_size(engine: draw_engine.DrawEngine, data: dict, max_sequences: int = MAX_DRAW_SEQUENCES) -> tuple[int, int]:
+    """``count`` and ``sequences`` of a draw; raises ValueError with a message for the client."""
+    try:
+        count = int(data.get("count") or 4)
+        sequences = int(data.get("sequences") or 1)
+    except (TypeError, ValueError):
+        raise ValueError("count et sequences doivent être des entiers")
+    if not 1 <= count <= len(engine.cards):
+        raise ValueError(f"count doit être entre 1 et {len(engine.cards)}")
+    if not 1 <= sequences <= max_sequences:
+        raise ValueError(f"sequences doit être entre 1 et {max_sequences}")
+    return count, sequences
+
+
+def _draw_options(engine: draw_engine.DrawEngine, data: dict,
+                  max_sequences: int = MAX_DRAW_SEQUENCES) -> tuple[int, int, list | None, int, dict]:
+    """``count``, ``sequences``, required cards, ``missing`` and extra response fields of a room draw.
+
+    Raises ValueError with a message for the client on an unknown puzzle or
+    an out-of-range ``count``, ``sequences`` or ``missing``.
+    """
+    count, sequences = _draw_size(engine, data, max_sequences)
+    puzzle_id = data.get("puzzleId") or None
+    required, missing, extra = None, 0, {}
+    if puzzle_id is not None:
+        # Hands built around the puzzle's corrigé: all its cards, or all but `missing` of them
+        required = engine.required_cards(grader.puzzles()).get(puzzle_id)
+        if required is None:
+            raise ValueError("Puzzle inconnu ou incompatible avec le jeu de cartes")
+        try:
+            missing = int(data.get("missing") or 0)
+        except (TypeError, ValueError):
+            raise ValueError("missing invalide")
+        if not 0 <= missing <= len(required):
+            raise ValueError("missing invalide")
+        least = len(required) - missing
+        if engine.puzzle_space(required, least, missing).size <= 1 and least < len(engine.cards):
+            # Only one card set: every proposal, and every team of a class, would get
+            # the same cards, so at least one card from outside the corrigé is added
+            least += 1
+        if count < least:
+            count = least
+            extra = {"count": count, "message": f"Ce puzzle demande au moins {count} cartes"}
+        extra = {**extra, "puzzleId": puzzle_id, "missing": missing}
+    return count, sequences, required, missing, extra
 
 
 @app.post("/api/draw")
 def api_draw():
     try:
-        deck = _load_deck()
-        cards_by_cat = _build_cards(deck)
-        aleas = deck.get("aleas", [])
-        pref_map = _alea_preferences(deck)
+        engine = draw_engine.for_deck(decks.get())
         data = request.get_json(silent=True) or {}
         room_id = (data.get("roomId") or "").upper()
 
         # Parameters for realism and options
-        count = int(data.get("count") or 4)
-        sequences = int(data.get("sequences") or 1)
-
-        # Helper: build a single realistic hand biased by alea preferences
-        def draw_hand(rng: random.Random, n_cards: int, alea_label: str | None) -> list:
-            # Ensure diversity: try to include core categories, then fill from pools
-            picks = []
-            seen_ids = set()
-            prefer = pref_map.get(alea_label or "", set())
-            def pick_from(pool: list):
-                if not pool:
-                    return None
-                # Prefer items that help address the problématique
-                preferred = [c for c in pool if c["id"] in prefer and c["id"] not in seen_ids]
-                if preferred:
-                    choices = preferred
-                else:
-                    choices = [c for c in pool if c["id"] not in seen_ids]
-                if not choices:
-                    choices = pool
-                c = rng.choice(choices)
-                seen_ids.add(c["id"])
-                return c
-
-            # Core categories (if available)
-            if n_cards >= 1:
-                p = pick_from(cards_by_cat.get("Sources", []))
-                if p: picks.append(p)
-            if n_cards >= 2:
-                p = pick_from(cards_by_cat.get("Traitement", []))
-                if p: picks.append(p)
-            if n_cards >= 3:
-                p = pick_from(cards_by_cat.get("Usages", []))
-                if p: picks.append(p)
-            if n_cards >= 4:
-                pool_comcap = (cards_by_cat.get("Communication", []) +
-                               cards_by_cat.get("CapteursActionneurs", []))
-                p = pick_from(pool_comcap)
-                if p: picks.append(p)
-            # Fill remaining with a balanced pool (favoring Communication/Capteurs/Usages)
-            pool_balanced = (cards_by_cat.get("Communication", []) +
-                             cards_by_cat.get("CapteursActionneurs", []) +
-                             cards_by_cat.get("Usages", []))
-            while len(picks) < n_cards and pool_balanced:
-                p = pick_from(pool_balanced)
-                if p:
-                    picks.append(p)
-                else:
-                    break
-            return picks
+        try:
+            count, sequences = _draw_size(engine, data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-        # Build one or multiple sequences
-        rng = random.Random()
-        proposals = []
         last_sig = None
         # Optional avoid-repeat: compare to last draw in save
         if room_id:
-            save_path = os.path.join(SAVES_DIR, f"{room_id}.json")
-            if os.path.exists(save_path):
-                try:
-                    with open(save_path, "r", encoding="utf-8") as f:
-                        prev = json.load(f)
-                    last_sig = prev.get("lastDrawSig")
-                except Exception:
-                    last_sig = None
-
-        def sig(vals, alea_obj):
-            return "+".join(sorted(v["id"] for v in vals) + ([alea_obj["id"]] if alea_obj else []))
-
-        # Generate sequences, ensuring uniqueness and biasing picks to solve the problématique
-        safety = max(200, sequences * 5)
-        tries = 0
-        while len(proposals) < max(1, sequences) and tries < safety:
-            tries += 1
-            alea_label = rng.choice(aleas) if aleas else None
-            elems = draw_hand(rng, count, alea_label)
-            alea_obj = {"id": _card_id("alea", alea_label), "label": alea_label} if alea_label else None
-            s = sig(elems, alea_obj)
-            if last_sig and s == last_sig:
-                continue
-            if any(sig([*p.get("elements", [])], p.get("alea")) == s for p in proposals):
-                continue
-            proposals.append({
-                "elements": [{**c, "name": c.get("label"), "cat": c.get("category")} for c in elems],
-                "alea": alea_obj,
-            })
+            try:
+                last_sig = rooms.view(room_id, lambda env: env.get("lastDrawSig"))
+            except Exception:
+                last_sig = None
+
+        hands = engine.draw(count, sequences, seed=_draw_seed(data), avoid=last_sig)
+        proposals = [engine.proposal(hand, alea) for hand, alea in hands]
 
         # Save last signature of first proposal for repeat-avoidance
-        if room_id and proposals:
+        if room_id and hands:
             try:
-                save_path = os.path.join(SAVES_DIR, f"{room_id}.json")
-                env = {"lastDrawSig": sig([*proposals[0]["elements"]], proposals[0]["alea"]) }
-                if os.path.exists(save_path):
-                    with open(save_path, "r", encoding="utf-8") as f:
-                        old = json.load(f)
-                    old.update(env)
-                    with open(save_path, "w", encoding="utf-8") as f:
-                        json.dump(old, f, ensure_ascii=False, indent=2)
-                else:
-                    with open(save_path, "w", encoding="utf-8") as f:
-                        json.dump(env, f, ensure_ascii=False, indent=2)
+                env = {"lastDrawSig": engine.signature(*hands[0])}
+                rooms.mutate(room_id, lambda old: old.update(env), create=dict)
             except Exception:
                 pass
 
@@ -366,59 +400,37 @@ def api_draw():
             p0 = proposals[0] if proposals else {"elements": [], "alea": None}
             return jsonify({"elements": p0.get("elements", []), "alea": p0.get("alea")})
         else:
-            return jsonify({"proposals": proposals})
+            return jsonify({"proposals": proposals, **_draw_limit(engine, count, sequences, hands)})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
-# --- SSE endpoints for room sync ---
 @app.get("/api/room/<room_id>/events")
 def room_events(room_id: str):
     room_id = (room_id or "").upper()
-    q: queue.Queue = queue.Queue()
+    sub = room_bus.Subscriber(bus.queue_size)
     client_id = request.args.get("client") or gen_room_code(8)
     name = request.args.get("name") or "Invité"
-    with _room_lock:
-        _room_subs.setdefault(room_id, []).append(q)
-        # register client
-        _room_clients.setdefault(room_id, {})[client_id] = {"name": name, "ts": time.time()}
-    # broadcast presence
-    _publish(room_id, {"type": "presence", "data": {"clients": _presence_snapshot(room_id)}})
+    initial = open_room_stream(room_id, sub, client_id, name, request.headers.get("Last-Event-ID"))
 
     def gen():
         # Send initial snapshot if available
-        path = os.path.join(SAVES_DIR, f"{room_id}.json")
-        if os.path.exists(path):
-            try:
-                with open(path, "r", encoding="utf-8") as f:
-                    snapshot = json.load(f)
-                yield _sse_format({"type": "state_sync", "data": snapshot})
-            except Exception:
-                pass
-        last_heartbeat = time.time()
+        if initial:
+            yield initial
         try:
             while True:
-                try:
-                    evt = q.get(timeout=15)
-                    yield _sse_format(evt)
-                except queue.Empty:
+                frame = sub.get(timeout=15)
+                if frame is None:
                     # heartbeat comment to keep connection alive
-                    yield ": ping\n\n"
-                # rate limit heartbeats
-                if time.time() - last_heartbeat > 30:
-                    last_heartbeat = time.time()
+                    yield room_bus.PING
+                elif frame is room_bus.RESYNC:
+                    yield from resync_room_stream(room_id, sub)
+                else:
+                    yield frame.data
         except GeneratorExit:
             pass
         finally:
-            with _room_lock:
-                subs = _room_subs.get(room_id, [])
-                if q in subs:
-                    subs.remove(q)
-                # remove client
-                clients = _room_clients.get(room_id, {})
-                if client_id in clients:
-                    clients.pop(client_id, None)
-            _publish(room_id, {"type": "presence", "data": {"clients": _presence_snapshot(room_id)}})
+            close_room_stream(room_id, sub, client_id)
 
     resp = Response(stream_with_context(gen()), mimetype="text/event-stream")
     # Hint reverse proxies (nginx, cloudflare) not to buffer SSE
@@ -428,125 +440,593 @@ def room_events(room_id: str):
     return resp
 
 
-@app.post("/api/room/<room_id>/sync")
-def room_sync(room_id: str):
+# Stream lifecycle shared by the WSGI route above and the asyncio one in asgi.py
+def open_room_stream(room_id: str, sub: room_bus.Subscriber, client_id: str, name: str,
+                     last_event_id: str | None = None) -> bytes:
+    """Subscribe ``sub``, register the client and return the initial frames.
+
+    A reconnecting ``EventSource`` (``last_event_id``) gets the events it
+    missed when the bus still has them; otherwise the stream starts with the
+    snapshot and the full roster. The others learn about the client from the
+    next presence delta.
+    """
+    bus.subscribe(room_id, sub, client_id)
+    # register client
+    bus.join(room_id, client_id, name)
+    if last_event_id:
+        missed = bus.resume(room_id, sub, last_event_id)
+        if missed is not None:
+            return b"".join(frame.data for frame in missed)
+    return b"".join(resync_room_stream(room_id, sub))
+
+
+def resync_room_stream(room_id: str, sub: room_bus.Subscriber) -> list[bytes]:
+    """Frames that restart a stream which fell too far behind."""
+    frames = []
+    snapshot = _snapshot_frame(room_id, sub)
+    if snapshot:
+        frames.append(snapshot)
+    frames.append(room_bus.encode({"type": "presence", "data": {"clients": _presence_snapshot(room_id)}}).data)
+    return frames
+
+
+def close_room_stream(room_id: str, sub: room_bus.Subscriber, client_id: str):
+    bus.unsubscribe(room_id, sub)
+    # remove client (announced with the next presence delta)
+    bus.leave(room_id, client_id)
+
+
+def _snapshot_frame(room_id: str, sub: room_bus.Subscriber) -> bytes | None:
+    """Encode the room as a state_sync frame and drop what ``sub`` had queued.
+
+    Both happen under the room lock, so every frame queued afterwards is newer
+    than the snapshot.
+    """
+    def snap(env: dict) -> bytes:
+        sub.reset()
+        # Carries the id of the last event it includes, for Last-Event-ID on reconnect
+        return room_bus.encode({"type": "state_sync", "data": env}, bus.last_id(room_id)).data
+
+    try:
+        return rooms.view(room_id, snap)
+    except RoomNotFound:
+        sub.reset()
+        return None
+    except Exception:
+        return None
+
+
+def _timeline_target(args) -> tuple[float | None, int | None]:
+    """``at`` and ``version`` query arguments; raises ValueError with a message for the client."""
+    at, version = args.get("at"), args.get("version")
+    try:
+        at = room_timeline.parse_time(at) if at else None
+    except ValueError:
+        raise ValueError("at invalide (date ISO ou secondes epoch)")
+    try:
+        version = int(version) if version else None
+    except ValueError:
+        raise ValueError("version invalide")
+    return at, version
+
+
+@app.get("/api/room/<room_id>/timeline")
+def room_timeline_at(room_id: str):
+    """The room as of ``at`` or ``version``; without either, the list of recorded frames."""
+    room_id = (room_id or "").upper()
+    try:
+        at, version = _timeline_target(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if at is None and version is None:
+        return _json_conditional({"roomId": room_id, "frames": timeline.frames(room_id)})
+    board = timeline.board_at(room_id, at, version)
+    if board is None:
+        return jsonify({"error": "Aucun historique pour cette salle à ce moment"}), 404
+    return _json_conditional({"roomId": room_id, **board})
+
+
+def timeline_replay(room_id: str, args):
+    """SSE frames replaying a room's history, as ``(pause in seconds, frame)``.
+
+    Starts at ``at``/``version`` (or the beginning); ``speed`` divides the real
+    pauses between versions, which are capped at ``maxGap`` seconds. Arguments
+    are checked right away (ValueError with a message for the client); the
+    timeline is read as the frames are consumed.
+    """
+    at, version = _timeline_target(args)
+    try:
+        speed = float(args.get("speed") or 1)
+        max_gap = float(args.get("maxGap") or 5)
+    except ValueError:
+        raise ValueError("speed ou maxGap invalide")
+    if not 0 < speed <= 1000 or max_gap < 0:
+        raise ValueError("speed ou maxGap invalide")
+
+    def frames():
+        previous = None
+        for stamp, board in timeline.play(room_id, at, version):
+            pause = 0.0 if previous is None else min(max(stamp - previous, 0) / speed, max_gap)
+            previous = stamp
+            yield pause, room_bus.encode({"type": "state_sync", "data": board}).data
+        yield 0.0, room_bus.encode({"type": "timeline_end", "data": {"roomId": room_id}}).data
+
+    return frames()
+
+
+@app.get("/api/room/<room_id>/timeline/play")
+def room_timeline_play(room_id: str):
+    """SSE replay of the room's history: one ``state_sync`` per recorded version.
+
+    Each pause holds a worker thread; ``asgi.py`` serves this route with
+    ``asyncio.sleep`` instead.
+    """
+    room_id = (room_id or "").upper()
+    try:
+        frames = timeline_replay(room_id, request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def gen():
+        try:
+            for pause, data in frames:
+                if pause:
+                    time.sleep(pause)
+                yield data
+        except GeneratorExit:
+            pass
+
+    resp = Response(stream_with_context(gen()), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+
+@app.post("/api/room/<room_id>/heartbeat")
+def room_heartbeat(room_id: str):
+    """Keep a client in the roster; clients silent for PRESENCE_TTL seconds are dropped."""
     room_id = (room_id or "").upper()
     data = request.get_json(silent=True) or {}
-    path = os.path.join(SAVES_DIR, f"{room_id}.json")
+    client_id = data.get("client")
+    if not isinstance(client_id, str) or not client_id:
+        return jsonify({"error": "client manquant"}), 400
+    if not bus.touch(room_id, client_id):
+        # Evicted (or stream on another host): list it again
+        bus.join(room_id, client_id, str(data.get("name") or "Invité"))
+    return jsonify({"ok": True})
+
+
+@app.post("/api/room/<room_id>/live")
+def room_live(room_id: str):
+    payload, status = live_update((room_id or "").upper(), request.get_json(silent=True) or {})
+    return jsonify(payload), status
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def live_update(room_id: str, data: dict) -> tuple[dict, int]:
+    """Relay a drag in progress / pointer position to the room; nothing is stored."""
+    client_id = data.get("client")
+    if not isinstance(client_id, str) or not client_id:
+        return {"error": "client manquant"}, 400
+    update = {"name": str(data.get("name") or "Invité")[:60]}
+    cursor = data.get("cursor")
+    if isinstance(cursor, dict) and _is_number(cursor.get("x")) and _is_number(cursor.get("y")):
+        update["cursor"] = {"x": cursor["x"], "y": cursor["y"]}
+    blocks = data.get("blocks")
+    if isinstance(blocks, list):
+        update["blocks"] = [{"id": b["id"], "x": b["x"], "y": b["y"]} for b in blocks[:200]
+                            if isinstance(b, dict) and isinstance(b.get("id"), str)
+                            and _is_number(b.get("x")) and _is_number(b.get("y"))]
+    update["done"] = bool(data.get("done"))
+    bus.live(room_id, client_id, update)
+    return {"ok": True}, 200
+
+
+@app.get("/api/room/<room_id>/stats")
+def room_stats(room_id: str):
+    return jsonify(bus.stats((room_id or "").upper()))
+
+
+@app.get("/api/room/<room_id>/grade")
+def room_grade(room_id: str):
+    room_id = (room_id or "").upper()
+    puzzle_id = request.args.get("puzzle") or None
     try:
-        if os.path.exists(path):
-            with open(path, "r", encoding="utf-8") as f:
-                old = json.load(f)
-        else:
-            old = {"roomId": room_id, "team": data.get("team"), "state": {"blocks": [], "links": [], "draws": []}, "meta": {}}
-        # Merge
-        if "team" in data:
-            old["team"] = data["team"]
-        if "state" in data:
-            old["state"] = data["state"]
-        if "meta" in data:
-            m = old.get("meta", {})
-            m.update(data["meta"])
-            old["meta"] = m
-        old["savedAt"] = datetime.utcnow().isoformat() + "Z"
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(old, f, ensure_ascii=False, indent=2)
-        _publish(room_id, {"type": "state_sync", "data": old})
-        return jsonify({"ok": True})
+        return _json_conditional(rooms.view(room_id, lambda env: grader.grade(room_id, env, puzzle_id)))
+    except RoomNotFound:
+        return jsonify({"error": "Salle introuvable"}), 404
+
+
+def _selected_rooms() -> tuple[list[str], bool]:
+    """Rooms in ``rooms=A,B,…``, else every active room (``all=1``: every saved room); True if listed."""
+    listed = [c.strip().upper() for c in (request.args.get("rooms") or "").split(",") if c.strip()]
+    if listed:
+        return listed, True
+    if request.args.get("all") == "1":
+        return sorted(set(rooms.active()) | set(rooms.backend.codes())), False
+    return rooms.active(), False
+
+
+@app.get("/api/grades")
+def grade_rooms():
+    """Grades of the rooms selected by ``rooms=`` / ``all=1`` (see ``_selected_rooms``)."""
+    codes, listed = _selected_rooms()
+    puzzle_id = request.args.get("puzzle") or None
+    grades = []
+    for code in codes:
+        try:
+            grades.append(rooms.view(code, lambda env: grader.grade(code, env, puzzle_id)))
+        except RoomNotFound:
+            if listed:
+                grades.append({"roomId": code, "error": "Salle introuvable"})
+    return _json_conditional({"rooms": grades})
+
+
+# --- Teacher sessions: one dashboard stream for a group of rooms ---
+def _codes(value) -> list[str] | None:
+    if value is None:
+        return []
+    if not isinstance(value, list) or not all(isinstance(c, str) for c in value):
+        return None
+    return [c.strip().upper() for c in value if c.strip()]
+
+
+@app.post("/api/session")
+def create_session():
+    data = request.get_json(silent=True) or {}
+    codes = _codes(data.get("rooms"))
+    if codes is None:
+        return jsonify({"error": "rooms invalide"}), 400
+    return jsonify(sessions.create(str(data.get("name") or "Session"), codes))
+
+
+@app.get("/api/session/<session_id>")
+def get_session(session_id: str):
+    """The session and a summary of each of its rooms."""
+    session = sessions.get((session_id or "").upper())
+    if session is None:
+        return jsonify({"error": "Session introuvable"}), 404
+    return _json_conditional({**session, "summaries": session_summaries(session["rooms"])})
+
+
+@app.post("/api/session/<session_id>/rooms")
+def update_session(session_id: str):
+    data = request.get_json(silent=True) or {}
+    add, remove = _codes(data.get("add")), _codes(data.get("remove"))
+    if add is None or remove is None:
+        return jsonify({"error": "add/remove invalides"}), 400
+    name = data.get("name")
+    session = sessions.update((session_id or "").upper(), add, remove, str(name) if name is not None else None)
+    if session is None:
+        return jsonify({"error": "Session introuvable"}), 404
+    return jsonify(session)
+
+
+# --- Class provisioning: every team's room in one call ---
+# Rooms per call, and pre-drawn proposals per room: at most 1,000 proposals per request
+CLASS_MAX_TEAMS = 100
+CLASS_MAX_SEQUENCES = 10
+
+
+def _class_room(code: str, team: str, created_at: str, draws: dict | None) -> dict:
+    room = _blank_room(code, team)
+    room["createdAt"] = created_at
+    if draws is not None:
+        room["state"]["draws"] = draws
+        if "puzzleId" in draws:
+            room["meta"]["puzzleId"] = draws["puzzleId"]
+    return room
+
+
+def _class_draws(options: dict, n: int) -> tuple[list[dict], dict]:
+    """Proposals of ``n`` rooms for the ``draw`` options of a class, and the extra fields to report."""
+    engine = draw_engine.for_deck(decks.get())
+    count, sequences, required, missing, extra = _draw_options(engine, options, CLASS_MAX_SEQUENCES)
+    seed = _draw_seed(options)
+    draws = []
+    for i in range(n):
+        # One seed per room: reproducible, but not the same hands everywhere
+        hands = engine.draw(count, sequences, seed=None if seed is None else f"{seed}/{i}",
+                            required=required, missing=missing)
+        room_draws = {"proposals": [engine.proposal(hand, alea) for hand, alea in hands], "chosenIndex": None}
+        if required is not None:
+            room_draws.update(puzzleId=extra["puzzleId"], missing=missing)
+        draws.append(room_draws)
+    return draws, extra
+
+
+@app.post("/api/class")
+def provision_class():
+    """Create one room per team, written in one batch, and a session grouping them.
+
+    With ``draw`` (the options of a room draw) every room starts with its proposals.
+    """
+    data = request.get_json(silent=True) or {}
+    teams = data.get("teams")
+    if not isinstance(teams, list) or not teams or not all(isinstance(t, str) and t.strip() for t in teams):
+        return jsonify({"error": "teams doit être une liste de noms d’équipe"}), 400
+    if len(teams) > CLASS_MAX_TEAMS:
+        return jsonify({"error": f"Au plus {CLASS_MAX_TEAMS} équipes"}), 400
+    teams = [t.strip() for t in teams]
+    options = data.get("draw")
+    draws, extra = [None] * len(teams), {}
+    if options is not None:
+        if not isinstance(options, dict):
+            return jsonify({"error": "draw invalide"}), 400
+        try:
+            draws, extra = _class_draws(options, len(teams))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    # Codes drawn against one listing of the rooms in use; create_many still
+    # refuses a code taken meanwhile (or archived), which then gets a new one
+    created_at = datetime.utcnow().isoformat() + "Z"
+    taken = rooms.codes()
+    codes: list[str | None] = [None] * len(teams)
+    pending = list(range(len(teams)))
+    while pending:
+        batch = {}
+        for i in pending:
+            code = gen_room_code()
+            while code in taken:
+                code = gen_room_code()
+            taken.add(code)
+            batch[code] = i
+        created = set(rooms.create_many({code: _class_room(code, teams[i], created_at, draws[i]) for code, i in batch.items()}))
+        for code, i in batch.items():
+            if code in created:
+                codes[i] = code
+        pending = [i for code, i in batch.items() if code not in created]
+
+    session = sessions.create(str(data.get("name") or "Classe"), codes)
+    roster = [{"team": team, "roomId": code} for team, code in zip(teams, codes)]
+    return jsonify({"session": session, "rooms": roster, "roster": f"/api/session/{session['id']}/roster", **extra})
+
+
+@app.get("/api/session/<session_id>/roster")
+def session_roster(session_id: str):
+    """Printable page: one line per room of the session, team and code."""
+    session = sessions.get((session_id or "").upper())
+    if session is None:
+        return jsonify({"error": "Session introuvable"}), 404
+    lines = []
+    for code in session["rooms"]:
+        try:
+            team = rooms.peek(code, lambda env: env.get("team"))
+        except RoomNotFound:
+            continue
+        lines.append(f"<tr><td>{html.escape(str(team or ''))}</td><td class=\"code\">{html.escape(code)}</td></tr>")
+    title = html.escape(session["name"])
+    page = (
+        f"<!doctype html><html lang=\"fr\"><head><meta charset=\"utf-8\"><title>{title}</title><style>"
+        "body{font-family:system-ui,Segoe UI,Roboto,Helvetica,Arial;margin:2em}"
+        "table{border-collapse:collapse;width:100%}td,th{border:1px solid #9ca3af;padding:.6em 1em;text-align:left}"
+        ".code{font:700 1.4em ui-monospace,Menlo,Consolas,monospace;letter-spacing:.15em}"
+        f"</style></head><body><h1>{title}</h1><p>Session {html.escape(session['id'])}</p>"
+        "<table><thead><tr><th>Équipe</th><th>Code de salle</th></tr></thead><tbody>"
+        + "".join(lines) + "</tbody></table></body></html>\n"
+    )
+    return Response(page, mimetype="text/html")
+
+
+@app.get("/api/session/<session_id>/events")
+def session_events(session_id: str):
+    try:
+        session, focus = dashboard_target(session_id, request.args.get("focus"))
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    sub = room_bus.Subscriber(bus.queue_size)
+    initial = open_dashboard_stream(session, sub, focus)
+
+    def gen():
+        yield initial
+        try:
+            while True:
+                frame = sub.get(timeout=15)
+                if frame is None:
+                    yield room_bus.PING
+                elif frame is room_bus.RESYNC:
+                    yield from resync_dashboard_stream(session, sub, focus)
+                else:
+                    yield frame.data
+        except GeneratorExit:
+            pass
+        finally:
+            close_dashboard_stream(session, sub, focus)
+
+    resp = Response(stream_with_context(gen()), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    resp.headers["Connection"] = "keep-alive"
+    return resp
+
+
+def session_summaries(codes: list[str]) -> list[dict]:
+    counts = bus.presence_counts(codes)
+    out = []
+    for code in codes:
+        try:
+            summary = rooms.peek(code, lambda env: summaries.summary(code, env))
+        except RoomNotFound:
+            summary = {"roomId": code, "missing": True}
+        out.append({**summary, "presence": counts.get(code, 0)})
+    return out
+
+
+# Dashboard stream lifecycle, shared with asgi.py
+def dashboard_target(session_id: str, focus: str | None) -> tuple[dict, str | None]:
+    """Session and drill-down room of a dashboard stream; LookupError/ValueError if invalid."""
+    session = sessions.get((session_id or "").upper())
+    if session is None:
+        raise LookupError("Session introuvable")
+    focus = (focus or "").upper() or None
+    if focus is not None and focus not in session["rooms"]:
+        raise ValueError("focus invalide")
+    return session, focus
+
+
+def open_dashboard_stream(session: dict, sub: room_bus.Subscriber, focus: str | None) -> bytes:
+    """Subscribe ``sub`` to the summaries of the session's rooms (and every event of ``focus``).
+
+    The stream starts with a ``summaries`` event listing every room, then
+    the snapshot and roster of ``focus``; then ``summary`` events carry only
+    the fields of one room, at most one per room and ``DASHBOARD_INTERVAL``.
+    """
+    for code in session["rooms"]:
+        bus.subscribe(dashboard.channel(code), sub)
+    if focus is not None:
+        bus.subscribe(focus, sub)
+    summaries.watch(session["rooms"])
+    return b"".join(resync_dashboard_stream(session, sub, focus))
+
+
+def resync_dashboard_stream(session: dict, sub: room_bus.Subscriber, focus: str | None) -> list[bytes]:
+    # The focus snapshot empties the queue; summaries read after it are at least as
+    # new as anything that was dropped
+    if focus is not None:
+        frames = resync_room_stream(focus, sub)
+    else:
+        sub.reset()
+        frames = []
+    listing = room_bus.encode({"type": "summaries", "data": {"rooms": session_summaries(session["rooms"])}})
+    return [listing.data, *frames]
+
+
+def close_dashboard_stream(session: dict, sub: room_bus.Subscriber, focus: str | None):
+    for code in session["rooms"]:
+        bus.unsubscribe(dashboard.channel(code), sub)
+    if focus is not None:
+        bus.unsubscribe(focus, sub)
+    summaries.unwatch(session["rooms"])
+
+
+@app.get("/api/room/<room_id>/export.svg")
+def room_export_svg(room_id: str):
+    room_id = (room_id or "").upper()
+    try:
+        data = rooms.peek(room_id, lambda env: renderer.svg(room_id, env))
+    except RoomNotFound:
+        return jsonify({"error": "Salle introuvable"}), 404
+    return Response(data, mimetype="image/svg+xml")
+
+
+@app.get("/api/export.zip")
+def export_rooms_zip():
+    """ZIP of one SVG per room selected by ``rooms=`` / ``all=1``, streamed as it renders."""
+    codes, _ = _selected_rooms()
+
+    def members():
+        for code in codes:
+            try:
+                yield f"{code}.svg", rooms.peek(code, lambda env: renderer.svg(code, env))
+            except RoomNotFound:
+                continue
+
+    stamp = datetime.utcnow().strftime("%Y%m%d-%H%M")
+    return Response(
+        stream_with_context(board_render.zip_stream(members())),
+        mimetype="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="schema-bloc_{stamp}.zip"'},
+    )
+
+
+@app.get("/api/rooms")
+def list_rooms():
+    """Saved rooms created in ``[since, until)`` (ISO dates or prefixes), optionally for one ``team``."""
+    try:
+        limit = max(1, min(5000, int(request.args.get("limit") or 500)))
+    except ValueError:
+        return jsonify({"error": "limit invalide"}), 400
+    found = rooms.query(
+        since=request.args.get("since") or None,
+        until=request.args.get("until") or None,
+        team=request.args.get("team"),
+        limit=limit,
+    )
+    return _json_conditional({"rooms": found})
+
+
+@app.post("/api/room/<room_id>/sync")
+def room_sync(room_id: str):
+    payload, status = sync_room((room_id or "").upper(), request.get_json(silent=True) or {})
+    return jsonify(payload), status
+
+
+def sync_room(room_id: str, data: dict) -> tuple[dict, int]:
+    """Apply a full or delta sync to ``room_id``; returns the JSON body and status."""
+    ops = data.get("ops")
+    try:
+        if ops is None and "state" in data:
+            board_ops.check_state(data["state"])
+
+        def merge(old: dict) -> int:
+            # Replace nested values instead of updating them in place so the
+            # shallow copy handed to subscribers never changes under them.
+            if ops is not None:
+                if data.get("baseVersion") != old.get("version", 0):
+                    raise board_ops.VersionConflict(copy.deepcopy(old))
+                old["state"] = board_ops.apply_ops(old.get("state") or {}, ops)
+            elif "state" in data:
+                old["state"] = data["state"]
+            if "team" in data:
+                old["team"] = data["team"]
+            if "meta" in data:
+                old["meta"] = {**old.get("meta", {}), **data["meta"]}
+            version = _stamp(old)
+            # Publish under the room lock so subscribers see versions in order
+            if ops is None:
+                _publish(room_id, {"type": "state_sync", "data": dict(old)}, old)
+            else:
+                patch = {"version": version, "baseVersion": version - 1, "ops": ops, "origin": data.get("client")}
+                for key in ("team", "meta"):
+                    if key in data:
+                        patch[key] = old[key]
+                _publish(room_id, {"type": "state_patch", "data": patch}, old)
+            return version
+
+        version = rooms.mutate(room_id, merge, create=lambda: _blank_room(room_id, data.get("team")))
+        return {"ok": True, "version": version}, 200
+    except board_ops.VersionConflict as conflict:
+        return {"error": "Version obsolète", "version": conflict.snapshot.get("version", 0), "snapshot": conflict.snapshot}, 409
+    except board_ops.PatchError as e:
+        return {"error": str(e)}, 400
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return {"error": str(e)}, 500
 
 
 @app.post("/api/room/<room_id>/draw")
 def room_draw(room_id: str):
     room_id = (room_id or "").upper()
     try:
-        deck = _load_deck()
-        cards_by_cat = _build_cards(deck)
-        aleas = deck.get("aleas", [])
-        pref_map = _alea_preferences(deck)
+        engine = draw_engine.for_deck(decks.get())
         data = request.get_json(silent=True) or {}
-        count = int(data.get("count") or 4)
-        sequences = int(data.get("sequences") or 1)
-        rng = random.Random()
-
-        def draw_hand(n_cards: int, alea_label: str | None) -> list:
-            picks = []
-            seen_ids = set()
-            prefer = pref_map.get(alea_label or "", set())
-            def pick_from(pool: list):
-                if not pool:
-                    return None
-                preferred = [c for c in pool if c["id"] in prefer and c["id"] not in seen_ids]
-                if preferred:
-                    choices = preferred
-                else:
-                    choices = [c for c in pool if c["id"] not in seen_ids]
-                if not choices:
-                    choices = pool
-                c = rng.choice(choices)
-                seen_ids.add(c["id"])
-                return c
-            if n_cards >= 1:
-                p = pick_from(cards_by_cat.get("Sources", []))
-                if p: picks.append(p)
-            if n_cards >= 2:
-                p = pick_from(cards_by_cat.get("Traitement", []))
-                if p: picks.append(p)
-            if n_cards >= 3:
-                p = pick_from(cards_by_cat.get("Usages", []))
-                if p: picks.append(p)
-            if n_cards >= 4:
-                pool_comcap = (cards_by_cat.get("Communication", []) +
-                               cards_by_cat.get("CapteursActionneurs", []))
-                p = pick_from(pool_comcap)
-                if p: picks.append(p)
-            pool_balanced = (cards_by_cat.get("Communication", []) +
-                             cards_by_cat.get("CapteursActionneurs", []) +
-                             cards_by_cat.get("Usages", []))
-            while len(picks) < n_cards and pool_balanced:
-                p = pick_from(pool_balanced)
-                if p:
-                    picks.append(p)
-                else:
-                    break
-            return picks
-
-        def sig(vals, alea_obj):
-            return "+".join(sorted(v["id"] for v in vals) + ([alea_obj["id"]] if alea_obj else []))
-
-        proposals = []
-        safety = max(200, sequences * 5)
-        attempts = 0
-        while len(proposals) < max(1, sequences) and attempts < safety:
-            attempts += 1
-            alea_label = rng.choice(aleas) if aleas else None
-            elems = draw_hand(count, alea_label)
-            alea_obj = {"id": _card_id("alea", alea_label), "label": alea_label} if alea_label else None
-            s = sig(elems, alea_obj)
-            if any(sig(p.get("elements", []), p.get("alea")) == s for p in proposals):
-                continue
-            proposals.append({
-                "elements": [{**c, "name": c.get("label"), "cat": c.get("category")} for c in elems],
-                "alea": alea_obj,
-            })
-
-        # Persist in room save
-        path = os.path.join(SAVES_DIR, f"{room_id}.json")
-        if os.path.exists(path):
-            with open(path, "r", encoding="utf-8") as f:
-                old = json.load(f)
-        else:
-            old = {"roomId": room_id, "team": data.get("team"), "state": {"blocks": [], "links": [], "draws": []}, "meta": {}}
-        old.setdefault("state", {})
-        old["state"]["draws"] = {"proposals": proposals, "chosenIndex": None}
-        old["savedAt"] = datetime.utcnow().isoformat() + "Z"
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(old, f, ensure_ascii=False, indent=2)
+        try:
+            count, sequences, required, missing, extra = _draw_options(engine, data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        puzzle_id = extra.get("puzzleId")
+        hands = engine.draw(count, sequences, seed=_draw_seed(data), required=required, missing=missing)
+        proposals = [engine.proposal(hand, alea) for hand, alea in hands]
 
         payload = {"proposals": proposals}
-        _publish(room_id, {"type": "draws_updated", "data": payload})
-        return jsonify({"ok": True, **payload})
+
+        # Persist in room save
+        def store_draws(old: dict):
+            draws = {"proposals": proposals, "chosenIndex": None}
+            if puzzle_id is not None:
+                draws.update(puzzleId=puzzle_id, missing=missing)
+            old["state"] = {**old.get("state", {}), "draws": draws}
+            version = _stamp(old)
+            _publish(room_id, {"type": "draws_updated", "data": {**payload, "version": version, "baseVersion": version - 1}}, old)
+
+        rooms.mutate(room_id, store_draws, create=lambda: _blank_room(room_id, data.get("team")))
+        limit = _draw_limit(engine, count, sequences, hands, required is not None)
+        return jsonify({"ok": True, **payload, **extra, **limit})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -557,23 +1037,25 @@ def room_choose_draw(room_id: str):
     data = request.get_json(silent=True) or {}
     try:
         idx = int(data.get("index"))
-        path = os.path.join(SAVES_DIR, f"{room_id}.json")
-        if not os.path.exists(path):
-            return jsonify({"error": "Salle introuvable"}), 404
-        with open(path, "r", encoding="utf-8") as f:
-            old = json.load(f)
-        draws = (old.get("state") or {}).get("draws") or {}
-        proposals = draws.get("proposals") or []
-        if not (0 <= idx < len(proposals)):
-            return jsonify({"error": "Index invalide"}), 400
-        draws["chosenIndex"] = idx
-        old.setdefault("state", {})["draws"] = draws
-        old.setdefault("meta", {})["alea"] = proposals[idx].get("alea", {}).get("label")
-        old["savedAt"] = datetime.utcnow().isoformat() + "Z"
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(old, f, ensure_ascii=False, indent=2)
-        _publish(room_id, {"type": "draw_chosen", "data": {"index": idx, "proposal": proposals[idx]}})
+
+        def choose(old: dict) -> dict:
+            draws = (old.get("state") or {}).get("draws") or {}
+            proposals = draws.get("proposals") or []
+            if not (0 <= idx < len(proposals)):
+                raise IndexError(idx)
+            old["state"] = {**(old.get("state") or {}), "draws": {**draws, "chosenIndex": idx}}
+            old["meta"] = {**old.get("meta", {}), "alea": (proposals[idx].get("alea") or {}).get("label")}
+            version = _stamp(old)
+            _publish(room_id, {"type": "draw_chosen", "data": {
+                "index": idx, "proposal": proposals[idx], "version": version, "baseVersion": version - 1,
+            }}, old)
+
+        rooms.mutate(room_id, choose)
         return jsonify({"ok": True})
+    except RoomNotFound:
+        return jsonify({"error": "Salle introuvable"}), 404
+    except IndexError:
+        return jsonify({"error": "Index invalide"}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
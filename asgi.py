@@ -0,0 +1,282 @@
+"""ASGI entry point: room event streams and syncs served by asyncio.
+
+Under Gunicorn's gthread workers every open ``/api/room/<id>/events`` stream
+pins a thread, so a worker with 16 threads serves at most 16 students and
+sync POSTs queue behind the streams. Here an idle stream is a coroutine
+parked on an ``asyncio.Event``; one timer sends heartbeats to all of them.
+Room logic is shared with the Flask app (``app.py``): blocking store and bus
+calls run in the default thread pool, and every other route is handed to
+Flask through ``WsgiToAsgi``. Teacher dashboard streams
+(``/api/session/<id>/events``) are served the same way, and timeline
+replays (``/api/room/<id>/timeline/play``) wait between versions with
+``asyncio.sleep``.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+Capacity target: 5,000 concurrent idle streams per core, checked by
+``bench/sse_capacity.py``. Raise the open-file limit (``ulimit -n``)
+accordingly.
+"""
+import asyncio
+import itertools
+import json
+import os
+import re
+from urllib.parse import parse_qs
+
+from asgiref.sync import ThreadSensitiveContext
+from asgiref.wsgi import WsgiToAsgi
+
+import metrics
+import room_bus
+from app import (
+    app as flask_app, bus, close_dashboard_stream, close_room_stream, dashboard_target, gen_room_code, live_update,
+    open_dashboard_stream, open_room_stream, resync_dashboard_stream, resync_room_stream, rooms, summaries, sync_room,
+    timeline, timeline_replay,
+)
+
+
+HEARTBEAT_INTERVAL = float(os.environ.get("SSE_HEARTBEAT", "15"))
+
+_ROOM_ROUTE = re.compile(r"^/api/room/([^/]+)/(events|sync|live|timeline/play)$")
+_SESSION_ROUTE = re.compile(r"^/api/session/([^/]+)/events$")
+
+# Timeline frames read per trip to the thread pool
+_REPLAY_BATCH = 64
+
+_SSE_HEADERS = [
+    (b"content-type", b"text/event-stream; charset=utf-8"),
+    # Hint reverse proxies (nginx, cloudflare) not to buffer SSE
+    (b"cache-control", b"no-cache"),
+    (b"x-accel-buffering", b"no"),
+]
+
+_wsgi = WsgiToAsgi(flask_app)
+_streams: set[room_bus.AsyncSubscriber] = set()
+_ticker: asyncio.Task | None = None
+
+
+async def _heartbeat():
+    while True:
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        for sub in list(_streams):
+            sub.ping()
+
+
+def _ensure_ticker():
+    # Started here too for servers that do not send lifespan events
+    global _ticker
+    if _ticker is None or _ticker.done():
+        _ticker = asyncio.get_running_loop().create_task(_heartbeat())
+
+
+async def _send_json(send, payload: dict, status: int):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def room_events(scope, receive, send, room_id: str):
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    client_id = (query.get("client") or [""])[0] or gen_room_code(8)
+    name = (query.get("name") or [""])[0] or "Invité"
+    last_event_id = dict(scope.get("headers") or []).get(b"last-event-id", b"").decode("latin-1") or None
+    sub = room_bus.AsyncSubscriber(bus.queue_size, asyncio.get_running_loop())
+    initial = await asyncio.to_thread(open_room_stream, room_id, sub, client_id, name, last_event_id)
+    await _stream(
+        receive, send, sub, initial,
+        resync=lambda: resync_room_stream(room_id, sub),
+        close=lambda: close_room_stream(room_id, sub, client_id),
+    )
+
+
+async def session_events(scope, receive, send, session_id: str):
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    try:
+        session, focus = await asyncio.to_thread(dashboard_target, session_id, (query.get("focus") or [""])[0])
+    except LookupError as e:
+        return await _send_json(send, {"error": str(e)}, 404)
+    except ValueError as e:
+        return await _send_json(send, {"error": str(e)}, 400)
+    sub = room_bus.AsyncSubscriber(bus.queue_size, asyncio.get_running_loop())
+    initial = await asyncio.to_thread(open_dashboard_stream, session, sub, focus)
+    await _stream(
+        receive, send, sub, initial,
+        resync=lambda: resync_dashboard_stream(session, sub, focus),
+        close=lambda: close_dashboard_stream(session, sub, focus),
+    )
+
+
+async def _stream(receive, send, sub: room_bus.AsyncSubscriber, initial: bytes | None, resync, close):
+    """Send ``initial``, then ``sub``'s frames until the client leaves.
+
+    ``resync()`` (frames restarting a stream that fell behind) and ``close()``
+    block, so they run in the thread pool.
+    """
+    _ensure_ticker()
+    _streams.add(sub)
+    disconnected = False
+
+    async def watch():
+        nonlocal disconnected
+        while (await receive())["type"] != "http.disconnect":
+            pass
+        disconnected = True
+        sub.ping()
+
+    watcher = asyncio.create_task(watch())
+    try:
+        await send({"type": "http.response.start", "status": 200, "headers": _SSE_HEADERS})
+        # Send initial snapshot if available (an empty chunk flushes the headers)
+        await send({"type": "http.response.body", "body": initial or b"", "more_body": True})
+        while True:
+            frame = await sub.next()
+            if disconnected:
+                break
+            if frame is None:
+                data = room_bus.PING
+            elif frame is room_bus.RESYNC:
+                # Fell too far behind: start over from a fresh snapshot
+                data = b"".join(await asyncio.to_thread(resync))
+            else:
+                data = frame.data
+            await send({"type": "http.response.body", "body": data, "more_body": True})
+    except OSError:
+        pass
+    finally:
+        _streams.discard(sub)
+        watcher.cancel()
+        await asyncio.to_thread(close)
+
+
+async def _read_json(receive) -> dict | None:
+    """Request body as a dict ({} if it is not one), or None if the client went away."""
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    try:
+        data = json.loads(b"".join(chunks) or b"null")
+    except ValueError:
+        data = None
+    return data if isinstance(data, dict) else {}
+
+
+async def room_sync(scope, receive, send, room_id: str):
+    data = await _read_json(receive)
+    if data is None:
+        return
+    payload, status = await asyncio.to_thread(sync_room, room_id, data)
+    await _send_json(send, payload, status)
+
+
+async def room_live(scope, receive, send, room_id: str):
+    data = await _read_json(receive)
+    if data is None:
+        return
+    # Only touches the bus's pending dict: cheap enough to run on the loop
+    payload, status = live_update(room_id, data)
+    await _send_json(send, payload, status)
+
+
+async def room_timeline_play(scope, receive, send, room_id: str):
+    """Replay a room's history like the Flask route, without holding a thread between versions."""
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    try:
+        frames = timeline_replay(room_id, {key: values[0] for key, values in query.items()})
+    except ValueError as e:
+        return await _send_json(send, {"error": str(e)}, 400)
+    disconnected = asyncio.Event()
+
+    async def watch():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+        disconnected.set()
+
+    watcher = asyncio.create_task(watch())
+    try:
+        await send({"type": "http.response.start", "status": 200, "headers": _SSE_HEADERS})
+        await send({"type": "http.response.body", "body": b"", "more_body": True})
+        while not disconnected.is_set():
+            batch = await asyncio.to_thread(list, itertools.islice(frames, _REPLAY_BATCH))
+            if not batch:
+                break
+            for pause, data in batch:
+                if pause:
+                    try:
+                        await asyncio.wait_for(disconnected.wait(), pause)
+                    except asyncio.TimeoutError:
+                        pass
+                if disconnected.is_set():
+                    break
+                await send({"type": "http.response.body", "body": data, "more_body": True})
+        if not disconnected.is_set():
+            await send({"type": "http.response.body", "body": b""})
+    except OSError:
+        pass
+    finally:
+        watcher.cancel()
+
+
+if metrics.ENABLED:
+    # Flask times the routes it serves; these two never reach it
+    room_sync = metrics.asgi_timer(room_sync, "/api/room/<room_id>/sync")
+    room_live = metrics.asgi_timer(room_live, "/api/room/<room_id>/live")
+
+
+async def wsgi_request(scope, receive, send):
+    """Hand a request to the Flask app on a thread of its own.
+
+    WsgiToAsgi runs the app through ``sync_to_async(thread_sensitive=True)``:
+    outside a context of their own, all requests would share one thread and
+    a slow one (an export, a timeline replay) would hold up every other.
+    """
+    async with ThreadSensitiveContext():
+        await _wsgi(scope, receive, send)
+
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            _ensure_ticker()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if _ticker is not None:
+                _ticker.cancel()
+            await asyncio.to_thread(rooms.close)
+            summaries.close()
+            await asyncio.to_thread(timeline.close)
+            bus.close()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(scope, receive, send)
+    if scope["type"] == "http":
+        match = _ROOM_ROUTE.match(scope["path"])
+        if match:
+            room_id, action = match.group(1).upper(), match.group(2)
+            if action == "events" and scope["method"] == "GET":
+                return await room_events(scope, receive, send, room_id)
+            if action == "sync" and scope["method"] == "POST":
+                return await room_sync(scope, receive, send, room_id)
+            if action == "live" and scope["method"] == "POST":
+                return await room_live(scope, receive, send, room_id)
+            if action == "timeline/play" and scope["method"] == "GET":
+                return await room_timeline_play(scope, receive, send, room_id)
+        match = _SESSION_ROUTE.match(scope["path"])
+        if match and scope["method"] == "GET":
+            return await session_events(scope, receive, send, match.group(1).upper())
+    return await wsgi_request(scope, receive, send)
+
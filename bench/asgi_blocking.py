@@ -0,0 +1,88 @@
+"""Check that a slow Flask route served by ``asgi.py`` does not hold up the others.
+
+Calls the ASGI application in-process: starts ``--slow`` concurrent requests
+to a route that sleeps ``--hold`` seconds (a stand-in for a ZIP export or a
+timeline replay), then times ``GET /deck`` while they run. Exits with status
+1 when ``/deck`` waits for the slow requests.
+
+    python bench/asgi_blocking.py [--slow 4] [--hold 2] [--json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Keep events in this process and every file out of the checkout
+os.environ["ROOM_BUS"] = "local"
+os.environ["SAVES_DIR"] = tempfile.mkdtemp(prefix="asgi-blocking-")
+
+import asgi  # noqa: E402
+from app import app as flask_app  # noqa: E402
+
+MAX_FAST_SECONDS = 0.5
+
+
+async def call(path: str) -> tuple[int, float]:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 0), "server": ("bench", 80),
+    }
+    status = 0
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    start = time.perf_counter()
+    await asgi.app(scope, receive, send)
+    return status, time.perf_counter() - start
+
+
+async def run(slow: int, hold: float) -> dict:
+    status, _ = await call("/deck")  # warm up: deck compiled, routes loaded
+    slow_calls = [asyncio.create_task(call("/__bench/slow")) for _ in range(slow)]
+    await asyncio.sleep(0.1)
+    status, fast = await call("/deck")
+    done = await asyncio.gather(*slow_calls)
+    return {"slow_requests": slow, "hold_seconds": hold, "deck_status": status, "deck_seconds": fast,
+            "slow_seconds": max(seconds for _, seconds in done)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--slow", type=int, default=4)
+    parser.add_argument("--hold", type=float, default=2.0)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    flask_app.add_url_rule("/__bench/slow", "bench_slow", lambda: time.sleep(args.hold) or "ok")
+    results = asyncio.run(run(args.slow, args.hold))
+    results["ok"] = results["deck_status"] == 200 and results["deck_seconds"] < MAX_FAST_SECONDS
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{args.slow} slow request(s) holding {args.hold:.1f} s; GET /deck answered "
+              f"{results['deck_status']} in {results['deck_seconds'] * 1000:.1f} ms "
+              f"(limit {MAX_FAST_SECONDS * 1000:.0f} ms): {'ok' if results['ok'] else 'BLOCKED'}")
+    sys.exit(0 if results["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Time of a 100-sequence draw, legacy per-request loop vs ``DrawEngine``.
+
+The legacy row reproduces the draw code that used to live in both draw
+endpoints: filtered list comprehensions on every pick and a duplicate check
+that recomputes every earlier signature. Deck compilation is excluded from
+both rows (see ``deck_index``).
+
+    python bench/draw_engine.py [--sequences 100] [--rounds 50] [--json]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import draw_engine  # noqa: E402
+from deck_index import DeckIndex  # noqa: E402
+
+
+def legacy_draw(deck, count: int, sequences: int) -> list[dict]:
+    cards_by_cat = {cat: list(pool) for cat, pool in deck.pools.items()}
+    aleas = list(deck.aleas)
+    pref_map = {k: set(v) for k, v in deck.preferences.items()}
+    rng = random.Random()
+
+    def draw_hand(n_cards: int, alea_label: str | None) -> list:
+        picks = []
+        seen_ids = set()
+        prefer = pref_map.get(alea_label or "", set())
+
+        def pick_from(pool: list):
+            if not pool:
+                return None
+            preferred = [c for c in pool if c["id"] in prefer and c["id"] not in seen_ids]
+            if preferred:
+                choices = preferred
+            else:
+                choices = [c for c in pool if c["id"] not in seen_ids]
+            if not choices:
+                choices = pool
+            c = rng.choice(choices)
+            seen_ids.add(c["id"])
+            return c
+        if n_cards >= 1:
+            p = pick_from(cards_by_cat.get("Sources", []))
+            if p: picks.append(p)
+        if n_cards >= 2:
+            p = pick_from(cards_by_cat.get("Traitement", []))
+            if p: picks.append(p)
+        if n_cards >= 3:
+            p = pick_from(cards_by_cat.get("Usages", []))
+            if p: picks.append(p)
+        if n_cards >= 4:
+            pool_comcap = (cards_by_cat.get("Communication", []) +
+                           cards_by_cat.get("CapteursActionneurs", []))
+            p = pick_from(pool_comcap)
+            if p: picks.append(p)
+        pool_balanced = (cards_by_cat.get("Communication", []) +
+                         cards_by_cat.get("CapteursActionneurs", []) +
+                         cards_by_cat.get("Usages", []))
+        while len(picks) < n_cards and pool_balanced:
+            p = pick_from(pool_balanced)
+            if p:
+                picks.append(p)
+            else:
+                break
+        return picks
+
+    def sig(vals, alea_obj):
+        return "+".join(sorted(v["id"] for v in vals) + ([alea_obj["id"]] if alea_obj else []))
+
+    proposals = []
+    safety = max(200, sequences * 5)
+    attempts = 0
+    while len(proposals) < max(1, sequences) and attempts < safety:
+        attempts += 1
+        alea_label = rng.choice(aleas) if aleas else None
+        elems = draw_hand(count, alea_label)
+        alea_obj = {"id": f"alea:{alea_label}", "label": alea_label} if alea_label else None
+        s = sig(elems, alea_obj)
+        if any(sig(p.get("elements", []), p.get("alea")) == s for p in proposals):
+            continue
+        proposals.append({
+            "elements": [{**c, "name": c.get("label"), "cat": c.get("category")} for c in elems],
+            "alea": alea_obj,
+        })
+    return proposals
+
+
+def engine_draw(deck, count: int, sequences: int) -> list[dict]:
+    engine = draw_engine.for_deck(deck)
+    return [engine.proposal(hand, alea) for hand, alea in engine.draw(count, sequences)]
+
+
+def timed(fn, deck, count: int, sequences: int, rounds: int) -> dict:
+    got = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        got += len(fn(deck, count, sequences))
+    elapsed = time.perf_counter() - start
+    return {"ms": elapsed / rounds * 1000, "proposals": got / rounds}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sequences", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    deck = DeckIndex(os.path.join(ROOT, "deck.json")).get()
+    draw_engine.for_deck(deck)
+    results = {}
+    for count in (3, 4, 8, 12):
+        results[count] = {
+            "legacy": timed(legacy_draw, deck, count, args.sequences, args.rounds),
+            "engine": timed(engine_draw, deck, count, args.sequences, args.rounds),
+        }
+
+    if args.json:
+        print(json.dumps({"sequences": args.sequences, "rounds": args.rounds, "results": results}, indent=2))
+        return
+    print(f"{args.sequences} sequences per draw, {args.rounds} rounds")
+    for count, r in results.items():
+        legacy, engine = r["legacy"], r["engine"]
+        print(f"count={count:2d}  legacy {legacy['ms']:7.2f} ms ({legacy['proposals']:5.1f} proposals)  "
+              f"engine {engine['ms']:6.2f} ms ({engine['proposals']:5.1f} proposals)  x{legacy['ms'] / engine['ms']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
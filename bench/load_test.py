@@ -0,0 +1,446 @@
+"""Load test of a locally started server: rooms, syncs, draws and SSE fan-out.
+
+Starts the app (uvicorn ``asgi:app`` or Gunicorn gthread ``wsgi:app``) on a
+free port with an empty temporary ``SAVES_DIR``, creates ``--rooms`` rooms
+holding boards built from ``static/corrige.json``, opens ``--clients`` SSE
+subscribers per room, then for ``--duration`` seconds sends block moves to
+``/sync`` and draws to ``/draw`` and ``/choose_draw`` at the given rates.
+
+Reported, as JSON with ``--json`` / ``--out`` so runs can be compared across
+commits:
+
+- p50/p95/p99 latency and error count per endpoint;
+- publish-to-receive latency (sync sent -> its ``state_patch`` read by every
+  subscriber of the room) and events delivered per second;
+- server memory per SSE connection (RSS of the server processes);
+- bytes the server wrote to storage (``/proc/<pid>/io``) and size of saves.
+
+Clients are plain asyncio sockets, so nothing beyond the app's requirements
+is needed. Linux only (``/proc``).
+
+    python bench/load_test.py [--rooms 20] [--clients 25] [--duration 20] \\
+        [--sync-rate 50] [--draw-rate 2] [--choose-rate 2] \\
+        [--server uvicorn|gunicorn] [--workers 1] [--json] [--out run.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from storage_bytes import build_boards  # noqa: E402
+
+_ORIGIN = re.compile(rb'"origin": "(m\d+)"')
+
+
+def percentiles(samples: list[float]) -> dict:
+    if not samples:
+        return {"count": 0}
+    s = sorted(samples)
+
+    def pick(q: float) -> float:
+        return round(s[min(len(s) - 1, int(len(s) * q))] * 1000, 2)
+
+    return {"count": len(s), "p50Ms": pick(0.50), "p95Ms": pick(0.95), "p99Ms": pick(0.99), "maxMs": round(s[-1] * 1000, 2)}
+
+
+# --- server process ---
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def process_tree(pid: int) -> list[int]:
+    pids = [pid]
+    for p in pids:
+        try:
+            for task in os.listdir(f"/proc/{p}/task"):
+                with open(f"/proc/{p}/task/{task}/children") as f:
+                    pids.extend(int(c) for c in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def tree_rss(pid: int) -> int:
+    total = 0
+    for p in process_tree(pid):
+        try:
+            with open(f"/proc/{p}/statm") as f:
+                total += int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except OSError:
+            pass
+    return total
+
+
+def tree_write_bytes(pid: int) -> int:
+    total = 0
+    for p in process_tree(pid):
+        try:
+            with open(f"/proc/{p}/io") as f:
+                total += int(next(line for line in f if line.startswith("write_bytes:")).split()[1])
+        except (OSError, StopIteration):
+            pass
+    return total
+
+
+def dir_size(path: str) -> int:
+    total = 0
+    for dirpath, _, names in os.walk(path):
+        for name in names:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+def start_server(args, port: int, saves: str) -> subprocess.Popen:
+    env = {**os.environ, "SAVES_DIR": saves}
+    if args.workers > 1:
+        env["ROOM_BUS"] = "sqlite"
+    if args.server == "gunicorn":
+        cmd = [sys.executable, "-m", "gunicorn", "-w", str(args.workers), "--worker-class", "gthread",
+               "--threads", str(args.threads), "--timeout", "0", "-b", f"127.0.0.1:{port}", "wsgi:app"]
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "asgi:app", "--host", "127.0.0.1", "--port", str(port),
+               "--workers", str(args.workers), "--log-level", "warning"]
+    return subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+# --- HTTP over asyncio streams ---
+class Http:
+    def __init__(self, port: int):
+        self.port = port
+
+    async def request(self, method: str, path: str, body: dict | None = None) -> tuple[int, dict | None]:
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        try:
+            data = json.dumps(body).encode() if body is not None else b""
+            writer.write(
+                f"{method} {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n".encode() + data
+            )
+            await writer.drain()
+            raw = await reader.read(-1)
+        finally:
+            writer.close()
+        head, _, payload = raw.partition(b"\r\n\r\n")
+        status = int(head.split(b" ", 2)[1])
+        if b"transfer-encoding: chunked" in head.lower():
+            payload = dechunk(payload)
+        try:
+            return status, json.loads(payload)
+        except ValueError:
+            return status, None
+
+
+def dechunk(data: bytes) -> bytes:
+    out = []
+    while data:
+        size, _, rest = data.partition(b"\r\n")
+        n = int(size.split(b";")[0] or b"0", 16)
+        if not n:
+            break
+        out.append(rest[:n])
+        data = rest[n + 2:]
+    return b"".join(out)
+
+
+class Subscriber:
+    """One SSE connection; records when each sync marker arrives."""
+
+    def __init__(self, stats: "Stats"):
+        self.stats = stats
+        self.ready = asyncio.Event()
+        self.task: asyncio.Task | None = None
+
+    async def run(self, port: int, room: str, n: int):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET /api/room/{room}/events?client=b{n}&name=Bench{n} HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n".encode())
+        await writer.drain()
+        buf = b""
+        try:
+            while b"\r\n\r\n" not in buf:
+                chunk = await reader.read(65536)
+                if not chunk:
+                    return
+                buf += chunk
+            buf = buf.split(b"\r\n\r\n", 1)[1]
+            self.ready.set()
+            while True:
+                # Chunk-size lines end up between frames and are ignored
+                *frames, buf = buf.split(b"\n\n")
+                self.stats.frames(frames)
+                chunk = await reader.read(65536)
+                if not chunk:
+                    return
+                buf += chunk
+        finally:
+            writer.close()
+
+
+class Stats:
+    def __init__(self):
+        self.latency: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+        self.conflicts = 0
+        self.sent: dict[bytes, float] = {}
+        self.delivery: list[float] = []
+        self.events = 0
+        self.counting = False
+
+    def frames(self, frames: list[bytes]):
+        now = time.perf_counter()
+        for frame in frames:
+            if b"event: " not in frame:
+                continue
+            if self.counting:
+                self.events += 1
+            m = _ORIGIN.search(frame)
+            if m and m.group(1) in self.sent:
+                self.delivery.append(now - self.sent[m.group(1)])
+
+    def record(self, endpoint: str, seconds: float, ok: bool):
+        self.latency.setdefault(endpoint, []).append(seconds)
+        if not ok:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+
+# --- load ---
+class Room:
+    def __init__(self, code: str, board: dict):
+        self.code = code
+        self.board = board
+        self.version = 0
+        self.lock = asyncio.Lock()
+
+
+async def timed(stats: Stats, http: Http, endpoint: str, path: str, body: dict) -> tuple[int, dict | None]:
+    start = time.perf_counter()
+    try:
+        status, data = await http.request("POST", path, body)
+    except OSError:
+        stats.record(endpoint, time.perf_counter() - start, False)
+        return 0, None
+    stats.record(endpoint, time.perf_counter() - start, status == 200)
+    return status, data
+
+
+async def do_sync(stats: Stats, http: Http, room: Room, rng: random.Random, seq: int):
+    block = rng.choice(room.board["blocks"])
+    block["x"] = rng.randrange(0, 1400, 10)
+    block["y"] = rng.randrange(0, 900, 10)
+    marker = f"m{seq}"
+    async with room.lock:
+        for _ in range(3):
+            body = {"client": marker, "baseVersion": room.version,
+                    "ops": [{"op": "move_block", "id": block["id"], "x": block["x"], "y": block["y"]}]}
+            stats.sent[marker.encode()] = time.perf_counter()
+            status, data = await timed(stats, http, "sync", f"/api/room/{room.code}/sync", body)
+            if status == 409 and data:
+                # A draw bumped the version first
+                stats.conflicts += 1
+                room.version = data.get("version", room.version)
+                continue
+            if status == 200 and data:
+                room.version = data["version"]
+            return
+
+
+async def do_draw(stats: Stats, http: Http, room: Room):
+    async with room.lock:
+        status, _ = await timed(stats, http, "draw", f"/api/room/{room.code}/draw", {"count": 4, "sequences": 3})
+        if status == 200:
+            room.version += 1
+
+
+async def do_choose(stats: Stats, http: Http, room: Room):
+    async with room.lock:
+        status, _ = await timed(stats, http, "choose_draw", f"/api/room/{room.code}/choose_draw", {"index": 0})
+        if status == 200:
+            room.version += 1
+
+
+async def drive(rate: float, duration: float, action):
+    """Call ``action(i)`` ``rate`` times per second for ``duration`` seconds, without waiting for replies."""
+    if rate <= 0:
+        return
+    pending = set()
+    start = time.perf_counter()
+    i = 0
+    while True:
+        due = start + i / rate
+        if due - start >= duration:
+            break
+        await asyncio.sleep(max(0.0, due - time.perf_counter()))
+        task = asyncio.create_task(action(i))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+        i += 1
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def wait_ready(http: Http, proc: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited: {proc.stderr.read().decode(errors='replace')[-2000:]}")
+        try:
+            status, _ = await http.request("GET", "/api/deck")
+            if status == 200:
+                return
+        except OSError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+async def run(args, port: int, proc: subprocess.Popen, saves: str) -> dict:
+    http = Http(port)
+    await wait_ready(http, proc)
+    rng = random.Random(args.seed)
+    stats = Stats()
+
+    boards = build_boards()
+    rooms = []
+    for r in range(args.rooms):
+        board = boards[r % len(boards)]
+        state = {"blocks": [dict(b) for b in board["blocks"]], "links": [dict(L) for L in board["links"]], "draws": []}
+        _, created = await http.request("POST", "/create", {"team": f"Bench {r}"})
+        room = Room(created["roomId"], state)
+        _, synced = await http.request("POST", f"/api/room/{room.code}/sync",
+                                       {"state": state, "meta": {"puzzleId": board["puzzle"]}})
+        room.version = synced["version"]
+        rooms.append(room)
+    # Give every room a draw so choose_draw has proposals
+    for room in rooms:
+        await do_draw(Stats(), http, room)
+
+    rss_before = tree_rss(proc.pid)
+    subs = []
+    for n in range(args.rooms * args.clients):
+        sub = Subscriber(stats)
+        sub.task = asyncio.create_task(sub.run(port, rooms[n % args.rooms].code, n))
+        subs.append(sub)
+    await asyncio.wait_for(asyncio.gather(*(s.ready.wait() for s in subs)), 120)
+    await asyncio.sleep(1.0)  # initial snapshots and presence deltas
+    rss_open = tree_rss(proc.pid)
+
+    written_before = tree_write_bytes(proc.pid)
+    stats.counting = True
+    started = time.perf_counter()
+    await asyncio.gather(
+        drive(args.sync_rate, args.duration, lambda i: do_sync(stats, http, rng.choice(rooms), rng, i)),
+        drive(args.draw_rate, args.duration, lambda i: do_draw(stats, http, rng.choice(rooms))),
+        drive(args.choose_rate, args.duration, lambda i: do_choose(stats, http, rng.choice(rooms))),
+    )
+    await asyncio.sleep(1.0)  # last events, and one write-behind flush
+    elapsed = time.perf_counter() - started
+    stats.counting = False
+    written = tree_write_bytes(proc.pid) - written_before
+
+    for sub in subs:
+        sub.task.cancel()
+    await asyncio.gather(*(s.task for s in subs), return_exceptions=True)
+
+    expected = sum(len(v) for k, v in stats.latency.items() if k == "sync") * args.clients
+    return {
+        "requests": {
+            name: {**percentiles(samples), "errors": stats.errors.get(name, 0)}
+            for name, samples in sorted(stats.latency.items())
+        },
+        "syncConflicts": stats.conflicts,
+        "publishToReceive": {**percentiles(stats.delivery), "expected": expected},
+        "eventsDelivered": stats.events,
+        "eventsPerSecond": round(stats.events / elapsed, 1),
+        "connections": len(subs),
+        "serverRssBeforeBytes": rss_before,
+        "memoryPerConnectionBytes": int((rss_open - rss_before) / max(1, len(subs))),
+        "bytesWritten": written,
+        "bytesWrittenPerSync": int(written / max(1, len(stats.latency.get("sync", [])))),
+        "savesBytes": dir_size(saves),
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rooms", type=int, default=20)
+    parser.add_argument("--clients", type=int, default=25, help="SSE subscribers per room")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of load")
+    parser.add_argument("--sync-rate", type=float, default=50.0, help="/sync requests per second (all rooms)")
+    parser.add_argument("--draw-rate", type=float, default=2.0, help="/draw requests per second")
+    parser.add_argument("--choose-rate", type=float, default=2.0, help="/choose_draw requests per second")
+    parser.add_argument("--server", choices=("uvicorn", "gunicorn"), default="uvicorn")
+    parser.add_argument("--workers", type=int, default=1, help="more than 1 implies ROOM_BUS=sqlite")
+    parser.add_argument("--threads", type=int, default=16, help="gthread threads per worker")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--out", help="also write the JSON results to this file")
+    args = parser.parse_args()
+
+    if args.server == "gunicorn" and args.rooms * args.clients > args.workers * args.threads:
+        print(f"warning: {args.rooms * args.clients} streams for {args.workers * args.threads} gthread threads; "
+              "requests will queue behind them", file=sys.stderr)
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    port = free_port()
+    saves = tempfile.mkdtemp(prefix="bench-saves-")
+    proc = start_server(args, port, saves)
+    try:
+        result = asyncio.run(run(args, port, proc, saves))
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        shutil.rmtree(saves, ignore_errors=True)
+
+    report = {
+        "commit": git_commit(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("json", "out")},
+        **result,
+    }
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{args.server} x{args.workers}, {args.rooms} rooms x {args.clients} subscribers, "
+          f"{args.duration:g} s (commit {report['commit']})")
+    for name, r in report["requests"].items():
+        print(f"  {name:12s} n={r['count']:5d}  p50 {r.get('p50Ms', 0):7.2f}  p95 {r.get('p95Ms', 0):7.2f}  "
+              f"p99 {r.get('p99Ms', 0):7.2f} ms  errors {r['errors']}")
+    d = report["publishToReceive"]
+    print(f"  publish->receive n={d['count']}/{d['expected']}  p50 {d.get('p50Ms', 0)}  p95 {d.get('p95Ms', 0)}  "
+          f"p99 {d.get('p99Ms', 0)} ms")
+    print(f"  {report['eventsPerSecond']} events/s delivered, {report['memoryPerConnectionBytes']} B/connection, "
+          f"{report['bytesWritten']} B written ({report['bytesWrittenPerSync']} B/sync), saves {report['savesBytes']} B")
+
+
+if __name__ == "__main__":
+    main()
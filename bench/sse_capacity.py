@@ -0,0 +1,199 @@
+"""Concurrent SSE streams held by the ASGI app (``asgi.py``) on one core.
+
+Opens ``--streams`` room event streams spread over ``--rooms`` rooms by
+calling the ASGI application in-process (no sockets: the fake clients cost
+memory too, so the per-connection figure is an upper bound). Then checks:
+
+- every stream got its headers and a heartbeat from the shared timer;
+- the thread count stays flat (a stream does not hold a thread);
+- fan-out latency, one event published in one room and in every room;
+- every subscription is released after the clients disconnect.
+
+The process is pinned to one CPU when the platform allows it. Exits with
+status 1 when the capacity target (5,000 streams per core) is not met.
+
+    python bench/sse_capacity.py [--streams 5000] [--rooms 50] [--json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Keep events in this process, and the files app.py creates (sessions,
+# timeline, rooms) out of the checkout
+os.environ["ROOM_BUS"] = "local"
+os.environ["SAVES_DIR"] = tempfile.mkdtemp(prefix="sse-capacity-")
+
+TARGET_STREAMS = 5000
+MAX_BYTES_PER_STREAM = 32 * 1024
+MAX_ROOM_FANOUT_P95 = 0.05
+MAX_BROADCAST = 1.0
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Client:
+    """Fake HTTP connection: records what the app sends, disconnects on demand."""
+
+    def __init__(self):
+        self.status = None
+        self.pings = 0
+        self.marks: dict[bytes, float] = {}
+        self.gone = asyncio.Event()
+
+    async def receive(self):
+        await self.gone.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            self.status = message["status"]
+            return
+        body = message.get("body", b"")
+        if body == b": ping\n\n":
+            self.pings += 1
+        elif b'"mark": "' in body:
+            mark = body.split(b'"mark": "', 1)[1].split(b'"', 1)[0]
+            self.marks[mark] = time.perf_counter()
+
+
+async def wait_until(predicate, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(0.01)
+    return True
+
+
+async def publish_and_wait(bus, clients: list, rooms: list[str], mark: str) -> float:
+    """Publish ``mark`` in ``rooms``; return seconds until every client in them had it."""
+    key = mark.encode()
+    start = time.perf_counter()
+    for room in rooms:
+        await asyncio.to_thread(bus.publish, room, {"type": "bench", "data": {"mark": mark}})
+    if not await wait_until(lambda: all(key in c.marks for c in clients), 30):
+        return float("inf")
+    return max(c.marks[key] for c in clients) - start
+
+
+async def run(args) -> dict:
+    import asgi
+    from app import bus
+
+    asgi.HEARTBEAT_INTERVAL = args.heartbeat
+    room_ids = [f"BENCH{r:03d}" for r in range(args.rooms)]
+    by_room: dict[str, list[Client]] = {r: [] for r in room_ids}
+    threads_before = threading.active_count()
+    rss_before = rss_bytes()
+
+    tasks = []
+    opened = time.perf_counter()
+    for i in range(args.streams):
+        room = room_ids[i % args.rooms]
+        client = Client()
+        by_room[room].append(client)
+        scope = {
+            "type": "http", "method": "GET", "path": f"/api/room/{room}/events",
+            "query_string": f"client=c{i}&name=Bench{i}".encode(), "headers": [],
+        }
+        tasks.append(asyncio.create_task(asgi.app(scope, client.receive, client.send)))
+    clients = [c for cs in by_room.values() for c in cs]
+    ok_open = await wait_until(lambda: all(c.status == 200 for c in clients), 120)
+    open_seconds = time.perf_counter() - opened
+    # Let the presence storm of the joins drain before measuring
+    await wait_until(lambda: all(s.depth() == 0 for s in list(asgi._streams)), 30)
+    await asyncio.sleep(0.2)
+    rss_open = rss_bytes()
+    threads_open = threading.active_count()
+
+    pings_before = [c.pings for c in clients]
+    await asyncio.sleep(args.heartbeat * 2.5)
+    heartbeats_ok = all(c.pings > p for c, p in zip(clients, pings_before))
+
+    room_latencies = []
+    for k in range(args.samples):
+        room = room_ids[k % args.rooms]
+        room_latencies.append(await publish_and_wait(bus, by_room[room], [room], f"r{k}"))
+    broadcast = await publish_and_wait(bus, clients, room_ids, "all")
+
+    for c in clients:
+        c.gone.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    released = all(bus.stats(r)["subscribers"] == 0 for r in room_ids) and not asgi._streams
+
+    room_latencies.sort()
+    p95 = room_latencies[min(len(room_latencies) - 1, int(len(room_latencies) * 0.95))]
+    per_stream = (rss_open - rss_before) / max(1, args.streams)
+    return {
+        "streams": args.streams,
+        "rooms": args.rooms,
+        "cpus": len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count(),
+        "opened": ok_open,
+        "openSeconds": round(open_seconds, 3),
+        "bytesPerStream": int(per_stream),
+        "threadsBefore": threads_before,
+        "threadsOpen": threads_open,
+        "heartbeats": heartbeats_ok,
+        "roomFanoutP50Ms": round(statistics.median(room_latencies) * 1000, 2),
+        "roomFanoutP95Ms": round(p95 * 1000, 2),
+        "broadcastMs": round(broadcast * 1000, 2),
+        "released": released,
+        "checks": {
+            "streams": ok_open and args.streams >= TARGET_STREAMS,
+            "memory": per_stream <= MAX_BYTES_PER_STREAM,
+            "threads": threads_open - threads_before <= 40,
+            "heartbeats": heartbeats_ok,
+            "roomFanout": p95 <= MAX_ROOM_FANOUT_P95,
+            "broadcast": broadcast <= MAX_BROADCAST,
+            "released": released,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--streams", type=int, default=TARGET_STREAMS)
+    parser.add_argument("--rooms", type=int, default=50)
+    parser.add_argument("--samples", type=int, default=50, help="single-room publishes to time")
+    parser.add_argument("--heartbeat", type=float, default=1.0, help="heartbeat interval for the run (s)")
+    parser.add_argument("--no-pin", action="store_true", help="do not pin the process to one CPU")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    if not args.no_pin and hasattr(os, "sched_setaffinity"):
+        # Before anything starts a thread, so the pool and writer inherit it
+        os.sched_setaffinity(0, {min(os.sched_getaffinity(0))})
+
+    result = asyncio.run(run(args))
+    passed = all(result["checks"].values())
+    if args.json:
+        print(json.dumps({**result, "passed": passed}, indent=2))
+    else:
+        print(f"{result['streams']} streams over {result['rooms']} rooms on {result['cpus']} CPU(s)")
+        print(f"opened in {result['openSeconds']} s, {result['bytesPerStream']} B/stream, "
+              f"threads {result['threadsBefore']} -> {result['threadsOpen']}")
+        print(f"fan-out to one room p50 {result['roomFanoutP50Ms']} ms, p95 {result['roomFanoutP95Ms']} ms; "
+              f"to every stream {result['broadcastMs']} ms")
+        for name, ok in result["checks"].items():
+            print(f"  {'ok  ' if ok else 'FAIL'} {name}")
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
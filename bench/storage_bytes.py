@@ -0,0 +1,106 @@
+"""Bytes written to saves/ per room sync, legacy format vs snapshot + journal.
+
+Replays a classroom-like editing session on boards built from
+``static/corrige.json``: each sync moves one block (and every fifth one adds
+a label to a link), then the room is flushed so every sync costs one write.
+The legacy row reproduces the historical behaviour of rewriting the whole
+pretty-printed ``<code>.json`` on every request.
+
+    python bench/storage_bytes.py [--syncs 200] [--json]
+"""
+import argparse
+import copy
+import json
+import os
+import random
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from room_store import JournalBackend, JsonDirBackend, RoomStore  # noqa: E402
+
+
+def build_boards() -> list[dict]:
+    with open(os.path.join(ROOT, "static", "corrige.json"), "r", encoding="utf-8") as f:
+        corrige = json.load(f)
+    boards = []
+    for pid, spec in corrige.items():
+        labels = []
+        for link in spec.get("links", []):
+            for label in (link["from"], link["to"]):
+                if label not in labels:
+                    labels.append(label)
+        blocks = [{
+            "id": f"b{i}", "x": 120 + 40 * i, "y": 120 + 20 * (i % 4), "w": 220, "h": 90,
+            "title": label, "category": "Traitement",
+        } for i, label in enumerate(labels)]
+        ids = {b["title"]: b["id"] for b in blocks}
+        links = [{
+            "id": f"l{i}", "type": link.get("type", "signal"),
+            "from": ids[link["from"]], "to": ids[link["to"]],
+        } for i, link in enumerate(spec.get("links", []))]
+        boards.append({"puzzle": pid, "title": spec.get("title"), "blocks": blocks, "links": links})
+    return boards
+
+
+def run(backend, boards: list[dict], syncs: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    store = RoomStore(backend)
+    for n, board in enumerate(boards):
+        code = f"R{n:04d}"
+        state = {"blocks": copy.deepcopy(board["blocks"]), "links": copy.deepcopy(board["links"]), "draws": []}
+        store.create(code, {"roomId": code, "team": "Équipe", "state": state, "meta": {"puzzleId": board["puzzle"]}})
+    store.flush()
+    start = backend.bytes_written
+    for i in range(syncs):
+        code = f"R{rng.randrange(len(boards)):04d}"
+
+        def edit(env):
+            # What the client POSTs today: a fresh copy of the whole board
+            state = copy.deepcopy(env["state"])
+            block = rng.choice(state["blocks"])
+            block["x"] += rng.choice((-20, 20))
+            block["y"] += rng.choice((-20, 20))
+            if i % 5 == 0 and state["links"]:
+                rng.choice(state["links"])["label"] = f"{rng.randint(3, 24)} V"
+            env["state"] = state
+            env["savedAt"] = f"2026-01-01T00:00:{i % 60:02d}Z"
+
+        store.mutate(code, edit)
+        store.flush()
+    return {"bytes": backend.bytes_written - start, "per_sync": (backend.bytes_written - start) / syncs}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--syncs", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    boards = build_boards()
+    variants = {
+        "legacy (indent=2, full rewrite)": lambda d: JsonDirBackend(d, indent=2),
+        "compact snapshot": lambda d: JsonDirBackend(d),
+        "compact snapshot, gzip": lambda d: JsonDirBackend(d, compress=True),
+        "snapshot + journal": lambda d: JournalBackend(d),
+        "snapshot + journal, gzip": lambda d: JournalBackend(d, compress=True),
+    }
+    results = {}
+    for name, factory in variants.items():
+        with tempfile.TemporaryDirectory() as d:
+            results[name] = run(factory(d), boards, args.syncs, args.seed)
+
+    if args.json:
+        print(json.dumps({"syncs": args.syncs, "rooms": len(boards), "results": results}, indent=2))
+        return
+    base = results["legacy (indent=2, full rewrite)"]["per_sync"]
+    print(f"{len(boards)} rooms, {args.syncs} syncs")
+    for name, r in results.items():
+        print(f"{name:34s} {r['per_sync']:9.1f} B/sync  ({r['per_sync'] / base:6.1%} of legacy)")
+
+
+if __name__ == "__main__":
+    main()
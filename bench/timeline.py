@@ -0,0 +1,99 @@
+"""Room timeline size and seek time, against keeping every full board.
+
+Replays the editing session of ``bench/storage_bytes.py`` (one block moved
+per sync, a link label now and then) on boards built from
+``static/corrige.json``, noting every version in a ``Timeline``, then asks
+for the board at random versions of random rooms.
+
+    python bench/timeline.py [--syncs 2000] [--seeks 500] [--keyframe-every 32] [--json]
+"""
+import argparse
+import copy
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from room_timeline import Timeline, board_of  # noqa: E402
+from storage_bytes import build_boards  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--syncs", type=int, default=2000)
+    parser.add_argument("--seeks", type=int, default=500)
+    parser.add_argument("--keyframe-every", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    boards = build_boards()
+    envelopes = {}
+    for n, board in enumerate(boards):
+        code = f"R{n:04d}"
+        state = {"blocks": copy.deepcopy(board["blocks"]), "links": copy.deepcopy(board["links"]), "draws": []}
+        envelopes[code] = {"roomId": code, "team": "Équipe", "version": 1, "state": state,
+                           "meta": {"puzzleId": board["puzzle"]}}
+
+    with tempfile.TemporaryDirectory() as d:
+        timeline = Timeline(os.path.join(d, "timeline.sqlite3"), keyframe_every=args.keyframe_every)
+        full = 0
+        for env in envelopes.values():
+            timeline.note(env["roomId"], env)
+            full += len(json.dumps(board_of(env), ensure_ascii=False, separators=(",", ":")))
+        for i in range(args.syncs):
+            env = envelopes[f"R{rng.randrange(len(boards)):04d}"]
+            state = copy.deepcopy(env["state"])
+            block = rng.choice(state["blocks"])
+            block["x"] += rng.choice((-20, 20))
+            block["y"] += rng.choice((-20, 20))
+            if i % 5 == 0 and state["links"]:
+                rng.choice(state["links"])["label"] = f"{rng.randint(3, 24)} V"
+            env["state"] = state
+            env["version"] += 1
+            timeline.note(env["roomId"], env)
+            full += len(json.dumps(board_of(env), ensure_ascii=False, separators=(",", ":")))
+            if i % 100 == 99:
+                timeline.flush()
+        timeline.flush()
+
+        seeks = []
+        replayed = []
+        for _ in range(args.seeks):
+            env = rng.choice(list(envelopes.values()))
+            start = time.perf_counter()
+            board = timeline.board_at(env["roomId"], version=rng.randint(1, env["version"]))
+            seeks.append(time.perf_counter() - start)
+            replayed.append(board["replayed"])
+        frames = len(envelopes) + args.syncs
+        results = {
+            "rooms": len(envelopes),
+            "frames": frames,
+            "full_boards_bytes": full,
+            "timeline_bytes": timeline.bytes_written,
+            "database_bytes": sum(os.path.getsize(os.path.join(d, f)) for f in os.listdir(d)),
+            "seek_p50_ms": statistics.median(seeks) * 1000,
+            "seek_max_ms": max(seeks) * 1000,
+            "replayed_mean": statistics.mean(replayed),
+        }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{results['rooms']} rooms, {frames} versions, keyframe every {args.keyframe_every}")
+    print(f"full board per version   {full / frames:9.1f} B/version")
+    print(f"timeline (compressed)    {results['timeline_bytes'] / frames:9.1f} B/version  "
+          f"({results['timeline_bytes'] / full:6.1%})")
+    print(f"seek                     p50 {results['seek_p50_ms']:.2f} ms, max {results['seek_max_ms']:.2f} ms, "
+          f"{results['replayed_mean']:.1f} deltas replayed on average")
+
+
+if __name__ == "__main__":
+    main()
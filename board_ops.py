@@ -0,0 +1,141 @@
+"""Patch operations on a room board (``state.blocks`` / ``state.links``).
+
+Clients in delta mode send a list of ops instead of the whole board:
+
+    {"op": "add_block", "block": {...}}        {"op": "add_link", "link": {...}}
+    {"op": "move_block", "id": ..., "x": ..., "y": ...}
+    {"op": "update_block", "id": ..., "set": {...}}
+    {"op": "update_link", "id": ..., "set": {...}}
+    {"op": "delete_block", "id": ...}          {"op": "delete_link", "id": ...}
+
+Ops are idempotent: adding an existing id replaces it, updating or deleting
+a missing id is a no-op. Deleting a block also drops the links attached to
+it, like the board does client-side. In ``move_block`` a missing or null
+coordinate is left unchanged; in ``set`` a null value removes the key, except
+for the geometry (``x``, ``y``, ``w``, ``h``), which it leaves unchanged.
+
+Ids are strings or integers, and block geometry is numeric, both in ops and
+in full boards (``check_state``).
+"""
+
+
+class PatchError(ValueError):
+    pass
+
+
+class VersionConflict(Exception):
+    """The patch was built on another version; carries the current envelope."""
+
+    def __init__(self, snapshot: dict):
+        super().__init__(snapshot.get("version", 0))
+        self.snapshot = snapshot
+
+
+_KINDS = {"block": "blocks", "link": "links"}
+GEOMETRY = ("x", "y", "w", "h")
+
+
+def _valid_id(value) -> bool:
+    return isinstance(value, (str, int)) and not isinstance(value, bool)
+
+
+def _check_geometry(name: str, block: dict) -> dict:
+    """``block`` without its null coordinates; raises PatchError on a non-numeric one."""
+    block = dict(block)
+    for k in GEOMETRY:
+        v = block.get(k)
+        if v is None:
+            block.pop(k, None)
+        elif isinstance(v, bool) or not isinstance(v, (int, float)):
+            raise PatchError(f"{name}: {k} doit être un nombre")
+    return block
+
+
+def check_state(state) -> dict:
+    """Check a full board sent by a client; returns it, or raises PatchError."""
+    if not isinstance(state, dict):
+        raise PatchError("state doit être un objet")
+    for kind, key in _KINDS.items():
+        items = state.get(key)
+        if items is None:
+            continue
+        if not isinstance(items, list):
+            raise PatchError(f"state.{key} doit être une liste")
+        for item in items:
+            if not isinstance(item, dict) or not _valid_id(item.get("id")):
+                raise PatchError(f"state.{key}: {kind} avec id (texte ou entier) requis")
+            if kind == "block":
+                _check_geometry(f"state.{key}", item)
+    return state
+
+
+def _find(items: list, item_id) -> int | None:
+    for i, item in enumerate(items):
+        if item.get("id") == item_id:
+            return i
+    return None
+
+
+def apply_ops(state: dict, ops: list) -> dict:
+    """Return a new state with ``ops`` applied.
+
+    Only the lists touched by ``ops`` are copied, and changed items are
+    replaced rather than edited, so earlier snapshots of ``state`` handed to
+    subscribers stay untouched.
+    """
+    if not isinstance(ops, list):
+        raise PatchError("ops doit être une liste")
+    lists: dict[str, list] = {}
+
+    def items(key: str) -> list:
+        if key not in lists:
+            lists[key] = list(state.get(key) or [])
+        return lists[key]
+
+    for op in ops:
+        name = op.get("op") if isinstance(op, dict) else None
+        action, _, kind = str(name or "").partition("_")
+        key = _KINDS.get(kind)
+        if key is None:
+            raise PatchError(f"Opération inconnue: {name}")
+        seq = items(key)
+        if action == "add":
+            item = op.get(kind)
+            if not isinstance(item, dict) or not _valid_id(item.get("id")):
+                raise PatchError(f"{name}: {kind} avec id (texte ou entier) requis")
+            if kind == "block":
+                item = _check_geometry(name, item)
+            i = _find(seq, item["id"])
+            if i is None:
+                seq.append(item)
+            else:
+                seq[i] = item
+        elif action in ("move", "update"):
+            if action == "move":
+                if kind != "block":
+                    raise PatchError(f"Opération inconnue: {name}")
+                changes = {k: op.get(k) for k in ("x", "y")}
+            else:
+                changes = op.get("set")
+                if not isinstance(changes, dict):
+                    raise PatchError(f"{name}: set requis")
+                changes = {k: v for k, v in changes.items() if k != "id"}
+            if kind == "block":
+                changes = _check_geometry(name, changes)
+            i = _find(seq, op.get("id"))
+            if i is not None:
+                item = {**seq[i], **changes}
+                for k, v in changes.items():
+                    if v is None:
+                        del item[k]
+                seq[i] = item
+        elif action == "delete":
+            i = _find(seq, op.get("id"))
+            if i is not None:
+                del seq[i]
+            if kind == "block":
+                links = items("links")
+                links[:] = [L for L in links if L.get("from") != op.get("id") and L.get("to") != op.get("id")]
+        else:
+            raise PatchError(f"Opération inconnue: {name}")
+    return {**state, **lists}
@@ -0,0 +1,216 @@
+"""Server-side SVG rendering of room boards and streamed ZIP exports.
+
+Same drawing as the PNG export in ``static/app.js`` (``svgToPngFull``):
+white blocks with their category in colour, energy links solid red,
+signal links dashed blue, control links dashed green, link labels on a
+grey pill, a title band and a legend. The SVG is standalone (inline
+styles, explicit size), so it opens in a browser or converts to PDF with
+any SVG tool (``rsvg-convert -f pdf``, Inkscape).
+
+Rendered boards are cached per room until its version changes.
+``zip_stream`` writes a ZIP one member at a time and yields its bytes as
+it goes, so memory stays flat whatever the number of rooms.
+"""
+import collections
+import io
+import threading
+import time
+import zipfile
+from xml.sax.saxutils import escape, quoteattr
+
+
+FONT = "system-ui,Segoe UI,Roboto,Helvetica,Arial"
+PAD = 40
+TITLE_BAND = 48
+LEGEND_BAND = 56
+
+# Link type -> (colour, width, dash), as in the exported PNG
+LINK_STYLES = {
+    "energy": ("#d32f2f", 4.5, None),
+    "control": ("#2e7d32", 3.5, "4 3"),
+    "signal": ("#1976d2", 2.5, "6 4"),
+}
+LEGEND = (("energy", "Énergie"), ("signal", "Communication"), ("control", "Contrôle"))
+CATEGORY_COLORS = {
+    "Sources": "#b7791f",
+    "Traitement": "#2e7d32",
+    "Communication": "#1976d2",
+    "Capteurs": "#ad1457",
+    "CapteursActionneurs": "#ad1457",
+    "Usages": "#ef6c00",
+}
+
+_MARKERS = "".join(
+    f'<marker id="arrow-{name}" viewBox="0 0 10 10" refX="10" refY="5" markerWidth="{size}" markerHeight="{size}" '
+    f'orient="auto-start-reverse"><path d="M 0 0 L 10 5 L 0 10 z" fill="{LINK_STYLES[kind][0]}"/></marker>'
+    for name, kind, size in (("red", "energy", 6), ("blue", "signal", 5), ("green", "control", 5))
+)
+_MARKER_OF = {"energy": "red", "signal": "blue", "control": "green"}
+
+
+def _num(v: float) -> str:
+    return f"{v:.2f}".rstrip("0").rstrip(".")
+
+
+def _block(b) -> dict | None:
+    if not isinstance(b, dict):
+        return None
+    try:
+        x, y, w, h = (float(b.get(k) or 0) for k in ("x", "y", "w", "h"))
+    except (TypeError, ValueError):
+        return None
+    return {"x": x, "y": y, "w": w, "h": h, "title": str(b.get("title") or ""), "category": str(b.get("category") or "")}
+
+
+def _anchors(a: dict, b: dict) -> tuple[float, float, float, float]:
+    # computeAnchors() in app.js: attach on the sides facing each other
+    fcx, fcy = a["x"] + a["w"] / 2, a["y"] + a["h"] / 2
+    tcx, tcy = b["x"] + b["w"] / 2, b["y"] + b["h"] / 2
+    dx, dy = tcx - fcx, tcy - fcy
+    if abs(dx) > abs(dy):
+        return (a["x"] + a["w"] if dx >= 0 else a["x"]), fcy, (b["x"] if dx >= 0 else b["x"] + b["w"]), tcy
+    return fcx, (a["y"] + a["h"] if dy >= 0 else a["y"]), tcx, (b["y"] if dy >= 0 else b["y"] + b["h"])
+
+
+def _bbox(blocks: dict, links: list) -> tuple[float, float, float, float]:
+    # computeContentBBox() in app.js
+    if not blocks:
+        return 0, 0, 1200, 800
+    xs = [v for b in blocks.values() for v in (b["x"], b["x"] + b["w"])]
+    ys = [v for b in blocks.values() for v in (b["y"], b["y"] + b["h"])]
+    for a, b, _, _ in links:
+        xs += (a["x"] + a["w"] / 2, b["x"] + b["w"] / 2)
+        ys += (a["y"] + a["h"] / 2, b["y"] + b["h"] / 2)
+    x, y = min(xs) - PAD, min(ys) - PAD
+    return x, y, max(xs) - min(xs) + 2 * PAD, max(ys) - min(ys) + 2 * PAD
+
+
+def render_svg(envelope: dict) -> bytes:
+    """Standalone SVG of a room envelope's board."""
+    state = envelope.get("state") or {}
+    blocks = {}
+    for raw in state.get("blocks") or []:
+        b = _block(raw)
+        if b is not None:
+            blocks.setdefault(raw.get("id"), b)
+    links = []
+    for L in state.get("links") or []:
+        if not isinstance(L, dict):
+            continue
+        a, b = blocks.get(L.get("from")), blocks.get(L.get("to"))
+        if a is not None and b is not None:
+            kind = L.get("type") if L.get("type") in LINK_STYLES else "signal"
+            links.append((a, b, kind, str(L.get("label") or "")))
+    x0, y0, w, h = _bbox(blocks, links)
+    width, height = w, h + TITLE_BAND + LEGEND_BAND
+    meta = envelope.get("meta") or {}
+    title = str(meta.get("title") or "").strip() or "Schéma-bloc"
+    subtitle = " · ".join(str(v) for v in (envelope.get("team"), envelope.get("roomId")) if v)
+
+    out = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{_num(width)}" height="{_num(height)}" '
+        f'viewBox="0 0 {_num(width)} {_num(height)}" font-family={quoteattr(FONT)}>',
+        f"<defs>{_MARKERS}</defs>",
+        f'<rect width="{_num(width)}" height="{_num(height)}" fill="#ffffff"/>',
+        f'<text x="16" y="{TITLE_BAND // 2}" dominant-baseline="middle" font-size="18" font-weight="700" '
+        f'fill="#111827">{escape(title)}</text>',
+    ]
+    if subtitle:
+        out.append(f'<text x="{_num(width - 16)}" y="{TITLE_BAND // 2}" dominant-baseline="middle" text-anchor="end" '
+                   f'font-size="12" fill="#6b7280">{escape(subtitle)}</text>')
+    out.append(f'<g transform="translate({_num(-x0)} {_num(TITLE_BAND - y0)})">')
+    for a, b, kind, label in links:
+        x1, y1, x2, y2 = _anchors(a, b)
+        color, stroke, dash = LINK_STYLES[kind]
+        out.append(
+            f'<line x1="{_num(x1)}" y1="{_num(y1)}" x2="{_num(x2)}" y2="{_num(y2)}" stroke="{color}" '
+            f'stroke-width="{stroke}"' + (f' stroke-dasharray="{dash}"' if dash else "")
+            + f' marker-end="url(#arrow-{_MARKER_OF[kind]})"/>'
+        )
+        if label:
+            mx, my = (x1 + x2) / 2, (y1 + y2) / 2
+            bw = max(30, len(label) * 7)
+            out.append(
+                f'<rect x="{_num(mx - bw / 2 - 6)}" y="{_num(my - 16)}" rx="6" ry="6" width="{bw + 12}" height="24" '
+                f'fill="rgba(17,24,39,.06)" stroke="#9ca3af" stroke-width="1"/>'
+                f'<text x="{_num(mx)}" y="{_num(my)}" text-anchor="middle" dominant-baseline="middle" '
+                f'font-size="13" font-weight="700" fill="#111827">{escape(label)}</text>'
+            )
+    for b in blocks.values():
+        out.append(
+            f'<rect x="{_num(b["x"])}" y="{_num(b["y"])}" width="{_num(b["w"])}" height="{_num(b["h"])}" rx="10" ry="10" '
+            f'fill="#ffffff" stroke="#9ca3af" stroke-width="2.5"/>'
+            f'<text x="{_num(b["x"] + 12)}" y="{_num(b["y"] + 28)}" font-size="16" font-weight="700" '
+            f'fill="#111827">{escape(b["title"])}</text>'
+            f'<text x="{_num(b["x"] + 12)}" y="{_num(b["y"] + 52)}" font-size="12" font-weight="700" '
+            f'fill="{CATEGORY_COLORS.get(b["category"], "#6b7280")}">{escape(b["category"])}</text>'
+        )
+    out.append("</g>")
+    y = TITLE_BAND + h + LEGEND_BAND // 2 - 16
+    for kind, text in LEGEND:
+        color, stroke, dash = LINK_STYLES[kind]
+        out.append(
+            f'<line x1="12" y1="{_num(y)}" x2="40" y2="{_num(y)}" stroke="{color}" stroke-width="{stroke}"'
+            + (f' stroke-dasharray="{dash}"' if dash else "") + "/>"
+            f'<text x="48" y="{_num(y)}" dominant-baseline="middle" font-size="12" fill="#111827">{text}</text>'
+        )
+        y += 16
+    out.append("</svg>\n")
+    return "".join(out).encode("utf-8")
+
+
+class Renderer:
+    """Rendered SVG per room, kept until the room's version changes."""
+
+    def __init__(self, cache_size: int = 512):
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._cache: collections.OrderedDict[str, tuple[tuple, bytes]] = collections.OrderedDict()
+
+    def svg(self, room_id: str, envelope: dict) -> bytes:
+        key = (envelope.get("version", 0), envelope.get("savedAt"))
+        with self._lock:
+            hit = self._cache.get(room_id)
+            if hit is not None and hit[0] == key:
+                self._cache.move_to_end(room_id)
+                return hit[1]
+        data = render_svg(envelope)
+        with self._lock:
+            self._cache[room_id] = (key, data)
+            self._cache.move_to_end(room_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return data
+
+
+class _Sink(io.RawIOBase):
+    """Write-only, unseekable buffer: ``zipfile`` then streams with data descriptors."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def zip_stream(members):
+    """ZIP of ``(name, bytes)`` pairs, yielded chunk by chunk as members come in."""
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members:
+            info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            archive.writestr(info, data)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    yield sink.drain()
@@ -0,0 +1,178 @@
+"""Teacher dashboard: sessions of rooms and throttled room summaries.
+
+A session is a named group of room codes (one class, one lab group) kept in
+``<saves>/.sessions/<id>.json``. The dashboard opens one SSE stream per
+session instead of one per room: it gets a compact summary of every room
+(blocks, links, chosen aléa, connected clients, score, last activity) and
+the full events of the one room the teacher drills into.
+
+Summaries are built from the publish path, not by re-reading saves: every
+room change hands its envelope to ``Summaries.note``, which keeps only the
+latest one per room (a shallow copy: board updates replace nested values,
+they never change them in place). Every ``interval`` seconds the pending
+rooms are summarized and published as ``summary`` events on the room's
+summary channel (``channel``), so a room gets at most one per interval
+whatever its sync rate. Presence counts of the rooms watched by a stream
+in this process are checked at the same pace.
+"""
+import json
+import logging
+import os
+import secrets
+import string
+import threading
+import time
+
+from room_store import _atomic_write
+
+
+log = logging.getLogger(__name__)
+
+_ID_ALPHABET = string.ascii_uppercase + string.digits
+
+
+def channel(room_id: str) -> str:
+    """Bus channel carrying the summaries of ``room_id``."""
+    return f"{room_id}/summary"
+
+
+class SessionStore:
+    """Sessions as small JSON files; every read goes to disk, so workers agree."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _path(self, session_id: str) -> str:
+        return os.path.join(self.directory, f"{session_id}.json")
+
+    def get(self, session_id: str) -> dict | None:
+        if not session_id.isalnum():
+            return None
+        try:
+            with open(self._path(session_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, session: dict):
+        _atomic_write(self._path(session["id"]), json.dumps(session, ensure_ascii=False).encode("utf-8"))
+
+    def create(self, name: str, room_ids: list[str]) -> dict:
+        with self._lock:
+            while True:
+                session_id = "".join(secrets.choice(_ID_ALPHABET) for _ in range(8))
+                if not os.path.exists(self._path(session_id)):
+                    break
+            session = {
+                "id": session_id,
+                "name": name,
+                "rooms": list(dict.fromkeys(room_ids)),
+                "createdAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            }
+            self._write(session)
+        return session
+
+    def update(self, session_id: str, add=(), remove=(), name: str | None = None) -> dict | None:
+        with self._lock:
+            session = self.get(session_id)
+            if session is None:
+                return None
+            dropped = set(remove)
+            session["rooms"] = [c for c in dict.fromkeys([*session["rooms"], *add]) if c not in dropped]
+            if name is not None:
+                session["name"] = name
+            self._write(session)
+        return session
+
+
+def summarize(envelope: dict, grade: dict) -> dict:
+    """Board part of a room summary."""
+    state = envelope.get("state") or {}
+    meta = envelope.get("meta") or {}
+    return {
+        "team": envelope.get("team"),
+        "version": envelope.get("version", 0),
+        "blocks": len(state.get("blocks") or []),
+        "links": len(state.get("links") or []),
+        "alea": meta.get("alea"),
+        "score": grade.get("score") if grade.get("applicable") else None,
+        "lastActivity": envelope.get("savedAt"),
+    }
+
+
+class Summaries:
+    def __init__(self, bus, grader, interval: float = 1.0):
+        self.bus = bus
+        self.grader = grader
+        self.interval = interval
+        self._lock = threading.Lock()
+        # Latest envelope of each room changed since the last flush
+        self._pending: dict[str, dict] = {}
+        # Rooms watched by streams of this process -> number of streams, and their last presence count
+        self._watched: dict[str, int] = {}
+        self._presence: dict[str, int] = {}
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="room-summaries", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                log.exception("Room summaries flush failed")
+
+    def note(self, room_id: str, envelope: dict):
+        """Record a room change; call with the room lock held."""
+        with self._lock:
+            self._pending[room_id] = dict(envelope)
+
+    def summary(self, room_id: str, envelope: dict) -> dict:
+        return {"roomId": room_id, **summarize(envelope, self.grader.grade(room_id, envelope))}
+
+    def watch(self, room_ids):
+        with self._lock:
+            for room_id in room_ids:
+                self._watched[room_id] = self._watched.get(room_id, 0) + 1
+
+    def unwatch(self, room_ids):
+        with self._lock:
+            for room_id in room_ids:
+                n = self._watched.get(room_id, 0) - 1
+                if n > 0:
+                    self._watched[room_id] = n
+                else:
+                    self._watched.pop(room_id, None)
+                    self._presence.pop(room_id, None)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            watched = list(self._watched)
+        counts = self.bus.presence_counts(watched) if watched else {}
+        for room_id, envelope in pending.items():
+            if not self.bus.listened(channel(room_id)):
+                continue
+            data = self.summary(room_id, envelope)
+            if room_id in counts:
+                data["presence"] = counts[room_id]
+            self.bus.publish(channel(room_id), {"type": "summary", "data": data})
+        with self._lock:
+            changed = {}
+            for room_id, n in counts.items():
+                if room_id in self._watched and self._presence.get(room_id) != n:
+                    self._presence[room_id] = n
+                    if room_id not in pending:
+                        changed[room_id] = n
+        for room_id, n in changed.items():
+            self.bus.publish(channel(room_id), {"type": "summary", "data": {"roomId": room_id, "presence": n}})
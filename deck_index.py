@@ -0,0 +1,119 @@
+"""Compiled view of ``deck.json``, built once and shared by every request.
+
+``DeckIndex.get()`` returns a ``CompiledDeck`` holding the card ids, the
+per-category pools used by the draws, the alea preference sets and the
+encoded JSON body served by ``/deck``. It is rebuilt only when the file's
+mtime (or size) changes.
+"""
+import hashlib
+import json
+import os
+import string
+import threading
+
+
+# deck.json category -> card id prefix
+CATEGORY_PREFIXES = {
+    "Sources": "src",
+    "Traitement": "trt",
+    "Communication": "com",
+    "CapteursActionneurs": "cap",
+    "Usages": "use",
+}
+
+# Simple heuristic preferences per problématique: cards that help address it
+ALEA_PREFERENCES = {
+    "Ombre": [
+        ("Sources", "Batterie 12 V"), ("Sources", "Prise murale"), ("Sources", "Dynamo (vélo)"),
+        ("Traitement", "Régulateur (stabilise)"), ("Traitement", "Convertisseur DC/DC"), ("Traitement", "Onduleur (DC→AC)"),
+    ],
+    "Panne de batterie": [
+        ("Sources", "Prise murale"), ("Sources", "Soleil (panneau)"), ("Sources", "Vent (éolienne)"), ("Sources", "Dynamo (vélo)"),
+        ("Traitement", "Régulateur (stabilise)"), ("Traitement", "Disjoncteur/Fusible"),
+    ],
+    "Câble trop long (perte)": [
+        ("Communication", "Routeur Wi-Fi"), ("Communication", "Point d’accès"), ("Communication", "Antenne tour"), ("Communication", "Satellite"),
+        ("Traitement", "Convertisseur DC/DC"), ("Usages", "Répéteur d’urgence"),
+    ],
+    "Polarité inversée": [
+        ("Traitement", "Régulateur (stabilise)"), ("Traitement", "Disjoncteur/Fusible"),
+    ],
+    "Surcharge": [
+        ("Traitement", "Disjoncteur/Fusible"), ("Traitement", "Régulateur (stabilise)"),
+    ],
+    "Température élevée": [
+        ("CapteursActionneurs", "Capteur température"), ("CapteursActionneurs", "Ventilateur"),
+    ],
+}
+
+_ACCENTS = str.maketrans({
+    "é": "e", "è": "e", "ê": "e", "à": "a", "â": "a", "ô": "o", "ù": "u", "û": "u",
+    "ï": "i", "î": "i", "ç": "c",
+})
+_ALLOWED = frozenset(string.ascii_lowercase + string.digits + "- ")
+
+
+def slugify(label: str) -> str:
+    s = label.lower().translate(_ACCENTS)
+    s = "".join(ch if ch in _ALLOWED else "-" for ch in s)
+    s = s.replace(" ", "-").replace("--", "-").strip("-")
+    return s
+
+
+def card_id(prefix: str, label: str) -> str:
+    return f"{prefix}:{slugify(label)}"
+
+
+class CompiledDeck:
+    """Everything the deck and draw endpoints derive from one version of deck.json.
+
+    Cards are ``{id, label, category}`` dicts shared between requests: treat
+    them as read-only.
+    """
+
+    def __init__(self, deck: dict):
+        self.deck = deck
+        self.body = json.dumps(deck, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.etag = hashlib.sha1(self.body).hexdigest()
+        pools: dict[str, tuple[dict, ...]] = {}
+        for cat, items in deck.get("categories", {}).items():
+            prefix = CATEGORY_PREFIXES.get(cat)
+            if prefix is None:
+                continue
+            pools[cat] = tuple({"id": card_id(prefix, label), "label": label, "category": cat} for label in items)
+        self.pools = pools
+        self.cards = {c["id"]: c for pool in pools.values() for c in pool}
+        self.card_ids = frozenset(self.cards)
+        # Fourth core slot, then the pool that fills the rest of a hand
+        self.comcap = pools.get("Communication", ()) + pools.get("CapteursActionneurs", ())
+        self.balanced = self.comcap + pools.get("Usages", ())
+        self.aleas = tuple(deck.get("aleas", []))
+        self.alea_cards = {label: {"id": card_id("alea", label), "label": label} for label in self.aleas}
+        # Only items that exist in the deck are kept (robustness)
+        self.preferences = {
+            alea: frozenset(i for i in (card_id(CATEGORY_PREFIXES[cat], item) for cat, item in pairs) if i in self.card_ids)
+            for alea, pairs in ALEA_PREFERENCES.items()
+        }
+
+
+class DeckIndex:
+    """Lazily compiled ``deck.json``, recompiled when the file changes on disk."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        # (file signature, compiled deck), swapped as a whole
+        self._current: tuple[tuple[int, int], CompiledDeck] | None = None
+
+    def get(self) -> CompiledDeck:
+        st = os.stat(self.path)
+        sig = (st.st_mtime_ns, st.st_size)
+        current = self._current
+        if current is not None and current[0] == sig:
+            return current[1]
+        with self._lock:
+            current = self._current
+            if current is None or current[0] != sig:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    current = self._current = (sig, CompiledDeck(json.load(f)))
+            return current[1]
@@ -0,0 +1,374 @@
+"""Card draws shared by ``/api/draw`` and ``/api/room/<id>/draw``.
+
+A hand follows the historical recipe: one Sources card, one Traitement, one
+Usages, one Communication/Capteurs card, then the rest from the balanced
+pool (Communication + Capteurs + Usages). Every pick prefers unseen cards
+that help with the problématique (``deck.preferences``), then unseen cards,
+then any card of the pool.
+
+Cards are numbered once per compiled deck and pools are bit masks, so a
+pick is a few integer operations instead of filtered list copies.
+
+Distinct hands of a given size and problématique form a small space that
+``HandSpace`` numbers from 0 to ``size - 1``; ``draw`` samples ranks without
+replacement, so N proposals cost O(N) and asking for more than the space
+holds returns all of it. Decks the space cannot describe (overlapping
+pools, hands larger than the balanced pool) fall back to rejection sampling.
+
+Puzzle draws (``required``) leave the recipe aside: the hand holds the
+cards the puzzle's corrigé links, minus ``missing`` of them for a harder,
+near-solvable hand, and is filled with cards the corrigé does not use.
+``PuzzleSpace`` numbers those hands the same way, so they are drawn in
+constant time each. ``required_cards`` maps every puzzle to its cards once
+per compiled deck and answer key.
+"""
+import math
+import random
+import threading
+
+from deck_index import CompiledDeck
+from grading import CompiledPuzzle, normalize_label
+
+
+# Core slots filled in this order before the balanced pool, by minimum hand size
+_CORE = ("Sources", "Traitement", "Usages")
+
+_cache_lock = threading.Lock()
+_cached: tuple[CompiledDeck, "DrawEngine"] | None = None
+
+
+def for_deck(deck: CompiledDeck) -> "DrawEngine":
+    """Engine of ``deck``, reused until the deck is recompiled."""
+    global _cached
+    cached = _cached
+    if cached is not None and cached[0] is deck:
+        return cached[1]
+    with _cache_lock:
+        if _cached is None or _cached[0] is not deck:
+            _cached = (deck, DrawEngine(deck))
+        return _cached[1]
+
+
+def _mask(indices) -> int:
+    m = 0
+    for i in indices:
+        m |= 1 << i
+    return m
+
+
+def _nth_bit(mask: int, n: int) -> int:
+    """Index of the ``n``-th set bit of ``mask`` (0-based, from the low end)."""
+    for _ in range(n):
+        mask &= mask - 1
+    return (mask & -mask).bit_length() - 1
+
+
+def _bits(mask: int) -> tuple[int, ...]:
+    return tuple(i for i in range(mask.bit_length()) if mask >> i & 1)
+
+
+def _unrank_combination(items: tuple, r: int, rank: int) -> list:
+    """``rank``-th ``r``-subset of ``items`` in lexicographic order."""
+    out = []
+    n = len(items)
+    for start in range(n):
+        if not r:
+            break
+        c = math.comb(n - start - 1, r - 1)
+        if rank < c:
+            out.append(items[start])
+            r -= 1
+        else:
+            rank -= c
+    return out
+
+
+class HandSpace:
+    """Distinct hands (as card sets) of one hand size and problématique.
+
+    A hand is one Sources card, one Traitement card and a set R of balanced
+    cards. Following the picking rules, R is ``forced`` plus ``i`` cards of
+    ``usages`` and ``j`` of ``comcap`` for each ``(i, j)`` of ``blocks``, so
+    hands can be counted and unranked without listing them.
+    """
+
+    def __init__(self, sources, treatments, forced, usages, comcap, blocks, core):
+        self.sources = sources
+        self.treatments = treatments
+        self.forced = forced
+        self.usages = usages
+        self.comcap = comcap
+        self.blocks = [(i, j, math.comb(len(usages), i) * math.comb(len(comcap), j)) for i, j in blocks]
+        self.core = core
+        self.size = len(sources) * len(treatments) * sum(n for _, _, n in self.blocks)
+
+    def unrank(self, rank: int) -> list[int]:
+        """Hand number ``rank`` as card indices, in the order a draw would pick them."""
+        rank, t = divmod(rank, len(self.treatments))
+        rank, s = divmod(rank, len(self.sources))
+        for i, j, n in self.blocks:
+            if rank < n:
+                break
+            rank -= n
+        ru, rc = divmod(rank, math.comb(len(self.comcap), j))
+        rest = sorted([*self.forced, *_unrank_combination(self.usages, i, ru), *_unrank_combination(self.comcap, j, rc)])
+        # Core usage and Communication/Capteurs cards first, like a drawn hand
+        head = []
+        for pool in self.core:
+            for card in rest:
+                if pool >> card & 1:
+                    head.append(card)
+                    rest.remove(card)
+                    break
+        return [c for c in (self.sources[s], self.treatments[t]) if c is not None] + head + rest
+
+
+class PuzzleSpace:
+    """Hands of ``count`` cards holding all of ``required`` but ``missing``, the rest from ``fillers``."""
+
+    def __init__(self, required: tuple, fillers: tuple, missing: int, count: int):
+        self.required = required
+        self.fillers = fillers
+        self.missing = missing
+        self.extra = count - (len(required) - missing)
+        self.kept = math.comb(len(required), missing)
+        self.size = self.kept * math.comb(len(fillers), self.extra) if self.extra >= 0 else 0
+
+    def unrank(self, rank: int) -> list[int]:
+        rf, rk = divmod(rank, self.kept)
+        dropped = set(_unrank_combination(self.required, self.missing, rk))
+        cards = [c for c in self.required if c not in dropped]
+        return sorted(cards + _unrank_combination(self.fillers, self.extra, rf))
+
+
+class DrawEngine:
+    def __init__(self, deck: CompiledDeck):
+        self.deck = deck
+        self.cards = tuple(deck.cards.values())
+        self.index = {c["id"]: i for i, c in enumerate(self.cards)}
+        self.core = tuple(_mask(self.index[c["id"]] for c in deck.pools.get(cat, ())) for cat in _CORE)
+        self.comcap = _mask(self.index[c["id"]] for c in deck.comcap)
+        self.balanced = _mask(self.index[c["id"]] for c in deck.balanced)
+        self.aleas = deck.aleas
+        self.prefer = {alea: _mask(self.index[i] for i in ids) for alea, ids in deck.preferences.items()}
+        self._alea_by_id = {card["id"]: label for label, card in deck.alea_cards.items()}
+        usages = self.core[2]
+        # HandSpace assumes the core pools are filled and the balanced pool is usages + comcap
+        self._enumerable = all(self.core) and bool(self.comcap) and not usages & self.comcap \
+            and self.balanced == usages | self.comcap and not (self.core[0] | self.core[1]) & self.balanced
+        self._spaces: dict[tuple[int, str | None], HandSpace | None] = {}
+        # (compiled answer key, puzzle id -> card indices or None), swapped as a whole
+        self._required: tuple[dict, dict[str, tuple[int, ...] | None]] | None = None
+        self._by_label = {normalize_label(c["label"]): i for i, c in enumerate(self.cards)}
+        # Response form of each card
+        self._elements = tuple({**c, "name": c["label"], "cat": c["category"]} for c in self.cards)
+
+    # --- hands ---
+    def hand(self, rng: random.Random, count: int, alea: str | None) -> list[int]:
+        """One hand as card indices, in pick order."""
+        prefer = self.prefer.get(alea or "", 0)
+        picks: list[int] = []
+        seen = 0
+
+        def pick(pool: int):
+            nonlocal seen
+            if not pool:
+                return
+            choices = pool & prefer & ~seen or pool & ~seen or pool
+            i = _nth_bit(choices, rng.randrange(choices.bit_count()))
+            seen |= 1 << i
+            picks.append(i)
+
+        # Core categories (if available)
+        for n, pool in enumerate(self.core):
+            if count > n:
+                pick(pool)
+        if count >= 4:
+            pick(self.comcap)
+        # Fill remaining with a balanced pool (favoring Communication/Capteurs/Usages)
+        while len(picks) < count and self.balanced:
+            pick(self.balanced)
+        return picks
+
+    def space(self, count: int, alea: str | None) -> HandSpace | None:
+        """Hands of ``count`` cards for ``alea``, or None when they cannot be enumerated."""
+        if count - 2 > self.balanced.bit_count():
+            return None  # hands would repeat cards
+        key = (count, alea)
+        if key not in self._spaces:
+            self._spaces[key] = self._build_space(count, alea) if self._enumerable else None
+        return self._spaces[key]
+
+    def _build_space(self, count: int, alea: str | None) -> HandSpace | None:
+        prefer = self.prefer.get(alea or "", 0)
+        sources, treatments, usages = self.core
+        comcap = self.comcap
+
+        def allowed(pool: int) -> int:
+            return pool & prefer or pool
+
+        s = _bits(allowed(sources)) if count >= 1 else (None,)
+        t = _bits(allowed(treatments)) if count >= 2 else (None,)
+        core = (allowed(usages), allowed(comcap))
+        if count <= 2:
+            return HandSpace(s, t, (), (), (), [(0, 0)], core)
+        if count == 3:
+            return HandSpace(s, t, (), _bits(core[0]), (), [(1, 0)], core)
+        k = count - 2
+        pref_u, pref_c = usages & prefer, comcap & prefer
+        p = (pref_u | pref_c).bit_count()
+        if p - bool(pref_u) - bool(pref_c) <= k - 2:
+            # Every preferred card fits once the core usage and comcap are in: R = all of
+            # them plus free cards, with a usage and a comcap if none is preferred
+            forced = _bits(pref_u | pref_c)
+            au, ac = _bits(usages & ~prefer), _bits(comcap & ~prefer)
+            r = k - p
+            min_u, max_u = int(not pref_u), len(au)
+            min_c, max_c = int(not pref_c), len(ac)
+        else:
+            # Preferred cards fill the hand: R is preferred cards only, except a single
+            # free usage (comcap) when no usage (comcap) is preferred
+            forced = ()
+            au = _bits(pref_u or usages)
+            ac = _bits(pref_c or comcap)
+            r = k
+            min_u, max_u = (1, len(au)) if pref_u else (1, 1)
+            min_c, max_c = (1, len(ac)) if pref_c else (1, 1)
+        blocks = [(i, r - i) for i in range(max(min_u, r - max_c), min(max_u, r - min_c) + 1)]
+        space = HandSpace(s, t, forced, au, ac, blocks, core)
+        return space if space.size else None
+
+    def required_cards(self, puzzles: dict[str, CompiledPuzzle]) -> dict[str, tuple[int, ...] | None]:
+        """Card indices each puzzle's corrigé links; None when it names a card this deck lacks."""
+        cached = self._required
+        if cached is not None and cached[0] is puzzles:
+            return cached[1]
+        table = {}
+        for pid, puzzle in puzzles.items():
+            cards = [self._by_label.get(label) for label in puzzle.scope]
+            table[pid] = tuple(sorted(cards)) if cards and None not in cards else None
+        self._required = (puzzles, table)
+        return table
+
+    def puzzle_space(self, required: tuple, count: int, missing: int) -> PuzzleSpace:
+        fillers = tuple(i for i in range(len(self.cards)) if i not in required)
+        return PuzzleSpace(required, fillers, missing, count)
+
+    def possible(self, count: int) -> int | None:
+        """Number of distinct proposals of ``count`` cards, or None if unknown."""
+        spaces = [self.space(count, alea) for alea in (self.aleas or (None,))]
+        if any(sp is None for sp in spaces):
+            return None
+        return sum(sp.size for sp in spaces)
+
+    def sample(self, count: int, n: int, rng: random.Random) -> list[tuple[tuple[int, ...], str | None]]:
+        """Batch API: ``n`` independent hands as ``(card indices, alea label)``, duplicates included."""
+        aleas = self.aleas
+        hand = self.hand
+        out = []
+        for _ in range(n):
+            alea = rng.choice(aleas) if aleas else None
+            out.append((tuple(hand(rng, count, alea)), alea))
+        return out
+
+    # --- signatures ---
+    @staticmethod
+    def key(hand, alea: str | None) -> tuple:
+        return tuple(sorted(hand)), alea
+
+    def signature(self, hand, alea: str | None) -> str:
+        """Historical string form of a hand (``lastDrawSig`` in saves)."""
+        ids = sorted(self.cards[i]["id"] for i in hand)
+        if alea:
+            ids.append(self.deck.alea_cards[alea]["id"])
+        return "+".join(ids)
+
+    def parse_signature(self, sig: str) -> tuple | None:
+        """Hand key of a signature string, or None if it names cards not in this deck."""
+        parts = sig.split("+") if sig else []
+        alea = None
+        if parts and parts[-1].startswith("alea:"):
+            alea = self._alea_by_id.get(parts.pop())
+            if alea is None:
+                return None
+        try:
+            return self.key((self.index[p] for p in parts), alea)
+        except KeyError:
+            return None
+
+    # --- proposals ---
+    def proposal(self, hand, alea: str | None) -> dict:
+        return {
+            "elements": [dict(self._elements[i]) for i in hand],
+            "alea": dict(self.deck.alea_cards[alea]) if alea else None,
+        }
+
+    def draw(self, count: int, sequences: int, seed=None, avoid: str | None = None,
+             required: tuple | None = None, missing: int = 0) -> list[tuple[tuple[int, ...], str | None]]:
+        """Up to ``sequences`` distinct hands (see ``proposal``); ``avoid`` is a signature to skip.
+
+        With ``required`` (see ``required_cards``) every hand holds those
+        cards but ``missing`` of them. The same ``seed`` gives the same hands
+        for a given deck. When the hand space is known, fewer hands than
+        asked means the space is exhausted.
+        """
+        return self._draw(count, sequences, seed, avoid, required, missing)[0]
+
+    def _draw(self, count: int, sequences: int, seed, avoid: str | None,
+              required: tuple | None = None, missing: int = 0) -> tuple[list, int, str]:
+        # (hands, hands generated, "puzzle", "space" or "rejection")
+        rng = random.Random(seed)
+        wanted = max(1, sequences)
+        skipped = self.parse_signature(avoid) if avoid else None
+        aleas = self.aleas or (None,)
+        if required is not None:
+            space = self.puzzle_space(required, count, missing)
+            hands, attempts = self._draw_distinct({alea: space for alea in aleas}, wanted, rng, skipped)
+            return hands, attempts, "puzzle"
+        if self.possible(count) is not None:
+            spaces = {alea: self.space(count, alea) for alea in aleas}
+            hands, attempts = self._draw_distinct(spaces, wanted, rng, skipped)
+            return hands, attempts, "space"
+        seen = set()
+        if skipped is not None:
+            seen.add(skipped)
+        hands = []
+        # Same attempt budget as before, spent in batches
+        budget = total = max(200, sequences * 5)
+        while len(hands) < wanted and budget > 0:
+            batch = self.sample(count, min(budget, 2 * (wanted - len(hands))), rng)
+            budget -= len(batch)
+            for hand, alea in batch:
+                k = self.key(hand, alea)
+                if k in seen:
+                    continue
+                seen.add(k)
+                hands.append((hand, alea))
+                if len(hands) == wanted:
+                    break
+        return hands, total - budget, "rejection"
+
+    @staticmethod
+    def _draw_distinct(spaces: dict, wanted: int, rng: random.Random, skipped: tuple | None) -> tuple[list, int]:
+        # Problématique uniform among those with hands left, then a hand of its space
+        # never drawn before (sparse Fisher-Yates over the ranks)
+        aleas = [alea for alea, space in spaces.items() if space.size]
+        drawn = dict.fromkeys(aleas, 0)
+        swaps: dict[str | None, dict[int, int]] = {alea: {} for alea in aleas}
+        hands = []
+        attempts = 0
+        while len(hands) < wanted and aleas:
+            attempts += 1
+            alea = rng.choice(aleas)
+            space, moved, i = spaces[alea], swaps[alea], drawn[alea]
+            j = rng.randrange(i, space.size)
+            rank = moved.get(j, j)
+            moved[j] = moved.pop(i, i)
+            drawn[alea] = i + 1
+            if i + 1 == space.size:
+                aleas.remove(alea)
+            hand = tuple(space.unrank(rank))
+            if skipped is not None and DrawEngine.key(hand, alea) == skipped:
+                continue
+            hands.append((hand, alea))
+        return hands, attempts
@@ -0,0 +1,153 @@
+"""Server-side grading of room boards against ``static/corrige.json``.
+
+Same rules as ``computeCorrigeMatch()`` in ``static/app.js``: labels are
+normalized (accents, case, punctuation), links between blocks outside the
+puzzle's labels are ignored, each expected ``(from, to, type)`` link counts
+once and any other in-scope link is an extra. The score mixes 80 % answer
+key and 20 % alignment, like the client.
+
+The answer key is compiled once (reloaded when the file changes) and grades
+are cached per room until its version changes.
+"""
+import collections
+import functools
+import json
+import math
+import os
+import re
+import threading
+import unicodedata
+
+
+_MARKS = re.compile("[\u0300-\u036f]")
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+ALIGN_TOLERANCE = 12  # px, like the client
+
+
+@functools.lru_cache(maxsize=4096)
+def normalize_label(label: str) -> str:
+    s = _MARKS.sub("", unicodedata.normalize("NFD", label)).lower()
+    return _NON_ALNUM.sub(" ", s).strip()
+
+
+def _js_round(x: float) -> int:
+    # Math.round, not Python's round-half-to-even
+    return math.floor(x + 0.5)
+
+
+class CompiledPuzzle:
+    __slots__ = ("id", "title", "expected", "total", "scope")
+
+    def __init__(self, pid: str, spec: dict):
+        self.id = pid
+        self.title = spec.get("title")
+        links = [(normalize_label(str(L.get("from") or "")), normalize_label(str(L.get("to") or "")), L.get("type") or "signal")
+                 for L in spec.get("links") or []]
+        self.expected = collections.Counter(links)
+        self.total = len(links)
+        self.scope = frozenset(label for f, t, _ in links for label in (f, t))
+
+
+def grade_board(puzzle: CompiledPuzzle, state: dict) -> dict:
+    """Grade of one board (``state.blocks`` / ``state.links``) for ``puzzle``."""
+    blocks = {}
+    for b in state.get("blocks") or []:
+        if isinstance(b, dict):
+            blocks.setdefault(b.get("id"), b)
+    remaining = collections.Counter(puzzle.expected)
+    correct = extras = considered = aligned = 0
+    for link in state.get("links") or []:
+        if not isinstance(link, dict):
+            continue
+        a, b = blocks.get(link.get("from")), blocks.get(link.get("to"))
+        if a is None or b is None:
+            continue
+        f, t = normalize_label(str(a.get("title") or "")), normalize_label(str(b.get("title") or ""))
+        if f not in puzzle.scope or t not in puzzle.scope:
+            continue  # ignore outside scope
+        key = (f, t, link.get("type") or "signal")
+        if remaining[key] > 0:
+            remaining[key] -= 1
+            correct += 1
+        else:
+            extras += 1
+        considered += 1
+        try:
+            dx = (a.get("x", 0) + a.get("w", 0) / 2) - (b.get("x", 0) + b.get("w", 0) / 2)
+            dy = (a.get("y", 0) + a.get("h", 0) / 2) - (b.get("y", 0) + b.get("h", 0) / 2)
+        except TypeError:
+            continue
+        if abs(dx) <= ALIGN_TOLERANCE or abs(dy) <= ALIGN_TOLERANCE:
+            aligned += 1
+    percent = max(0, min(100, _js_round((correct - extras) / puzzle.total * 100))) if puzzle.total else 0
+    alignment = _js_round(aligned / considered * 100) if considered else 0
+    return {
+        "applicable": True,
+        "correct": correct,
+        "expected": puzzle.total,
+        "extras": extras,
+        "percent": percent,
+        "alignment": alignment,
+        "score": _js_round(0.8 * percent + 0.2 * alignment),
+    }
+
+
+class Grader:
+    """Compiled answer key and per-room grade cache."""
+
+    def __init__(self, path: str, cache_size: int = 4096):
+        self.path = path
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        # (file signature, puzzles), swapped as a whole
+        self._current: tuple[tuple, dict[str, CompiledPuzzle]] | None = None
+        self._cache: collections.OrderedDict[str, tuple[tuple, dict]] = collections.OrderedDict()
+
+    def puzzles(self) -> dict[str, CompiledPuzzle]:
+        return self._load()[1]
+
+    def _load(self) -> tuple[tuple, dict[str, CompiledPuzzle]]:
+        try:
+            st = os.stat(self.path)
+            sig = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            sig = None
+        current = self._current
+        if current is not None and current[0] == sig:
+            return current
+        with self._lock:
+            current = self._current
+            if current is None or current[0] != sig:
+                puzzles = {}
+                if sig is not None:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        puzzles = {pid: CompiledPuzzle(pid, spec) for pid, spec in json.load(f).items()}
+                current = self._current = (sig, puzzles)
+            return current
+
+    def grade(self, room_id: str, envelope: dict, puzzle_id: str | None = None) -> dict:
+        """Grade of a room envelope; ``puzzle_id`` defaults to ``meta.puzzleId``."""
+        sig, puzzles = self._load()
+        if puzzle_id is None:
+            puzzle_id = (envelope.get("meta") or {}).get("puzzleId")
+        if not isinstance(puzzle_id, str):
+            puzzle_id = None
+        key = (envelope.get("version", 0), envelope.get("savedAt"), puzzle_id, sig)
+        with self._lock:
+            hit = self._cache.get(room_id)
+            if hit is not None and hit[0] == key:
+                self._cache.move_to_end(room_id)
+                return hit[1]
+        puzzle = puzzles.get(puzzle_id) if puzzle_id else None
+        if puzzle is None or not puzzle.total:
+            result = {"applicable": False}
+        else:
+            result = grade_board(puzzle, envelope.get("state") or {})
+        result = {"roomId": room_id, "version": key[0], "puzzleId": puzzle_id, **result}
+        with self._lock:
+            self._cache[room_id] = (key, result)
+            self._cache.move_to_end(room_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
@@ -0,0 +1,306 @@
+"""Opt-in Prometheus metrics (``METRICS=1``), served at ``/metrics``.
+
+Nothing here runs unless ``install`` is called: it wraps the hot paths of
+this process once, at start-up (request handling, bus fan-out, room writes,
+draws), so with metrics off the code paths are exactly the uninstrumented
+ones. Gauges (rooms, subscribers, clients) and the bus totals are read when
+``/metrics`` is scraped.
+
+Each worker process keeps its own registry: with several workers, scrape
+each one or run a single ASGI process.
+"""
+import bisect
+import functools
+import os
+import threading
+import time
+
+from flask import Response, g, request
+
+
+ENABLED = os.environ.get("METRICS", "0") == "1"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+FANOUT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+ATTEMPT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name, self.help, self.labels = name, help, labels
+        self._lock = threading.Lock()
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *values, amount: float = 1):
+        with self._lock:
+            self._values[values] = self._values.get(values, 0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"] + [
+            f"{self.name}{_labels(self.labels, k)} {_number(v)}" for k, v in items
+        ]
+
+
+class Gauge:
+    """Gauge read from ``collect()`` at scrape time: ``{label values: value}``."""
+
+    def __init__(self, name: str, help: str, collect, labels: tuple = ()):
+        self.name, self.help, self.labels, self.collect = name, help, labels, collect
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"] + [
+            f"{self.name}{_labels(self.labels, k)} {_number(v)}" for k, v in sorted(self.collect().items())
+        ]
+
+
+class HighWater:
+    """Largest value seen since start (a gauge that never goes down)."""
+
+    def __init__(self, name: str, help: str):
+        self.name, self.help = name, help
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def update(self, value: float):
+        if value > self.value:
+            with self._lock:
+                self.value = max(self.value, value)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {_number(self.value)}"]
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: tuple, labels: tuple = ()):
+        self.name, self.help, self.labels, self.buckets = name, help, labels, buckets
+        self._lock = threading.Lock()
+        # label values -> [per-bucket counts (+Inf last), sum]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *values):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(values)
+            if entry is None:
+                entry = self._values[values] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][i] += 1
+            entry[1] += value
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted((k, (list(counts), total)) for k, (counts, total) in self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for k, (counts, total) in items:
+            running = 0
+            for bound, n in zip((*self.buckets, "+Inf"), counts):
+                running += n
+                le = 'le="{}"'.format(bound if bound == "+Inf" else _number(bound))
+                lines.append(f"{self.name}_bucket{_labels(self.labels, k, le)} {running}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, k)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labels, k)} {running}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+requests = registry.add(Histogram(
+    "http_request_duration_seconds", "Request handling time by route.", LATENCY_BUCKETS, ("endpoint", "method", "status"),
+))
+fanout = registry.add(Histogram(
+    "room_publish_subscribers", "Subscribers reached by one room event (this process).", FANOUT_BUCKETS,
+))
+fanout_seconds = registry.add(Histogram(
+    "room_publish_seconds", "Time to hand one room event to every local subscriber.", LATENCY_BUCKETS,
+))
+queue_high_water = registry.add(HighWater(
+    "sse_queue_depth_high_water", "Deepest subscriber outbox seen right after a publish.",
+))
+store_writes = registry.add(Histogram(
+    "room_store_write_seconds", "Time of one room write to storage.", LATENCY_BUCKETS, ("kind",),
+))
+store_encode = registry.add(Histogram(
+    "room_store_encode_seconds", "Time to encode one room write (snapshot or journal entry).", LATENCY_BUCKETS, ("kind",),
+))
+store_bytes = registry.add(Counter(
+    "room_store_written_bytes_total", "Bytes written to room storage.", ("kind",),
+))
+draw_attempts = registry.add(Histogram(
+    "draw_attempts", "Hands generated per draw (duplicates included), by sampling path.", ATTEMPT_BUCKETS, ("path",),
+))
+
+
+def _timed(fn, histogram: Histogram, *labels):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - start, *labels)
+    return wrapper
+
+
+def _instrument_bus(bus):
+    deliver = bus._deliver
+
+    @functools.wraps(deliver)
+    def timed_deliver(room_id, frame):
+        start = time.perf_counter()
+        reached, deepest = deliver(room_id, frame)
+        fanout_seconds.observe(time.perf_counter() - start)
+        fanout.observe(reached)
+        queue_high_water.update(deepest)
+        return reached, deepest
+
+    bus._deliver = timed_deliver
+    totals = (
+        ("room_events_published_total", "Room events handed to the bus fan-out (this process).", "published"),
+        ("room_events_delivered_total", "Frames queued to subscribers.", "delivered"),
+        ("room_events_coalesced_total", "Queued frames replaced by a newer one for a slow subscriber.", "coalesced"),
+        ("room_events_dropped_total", "Queued frames dropped on overflow (the stream resyncs).", "dropped"),
+        ("room_resyncs_total", "Streams sent back to a snapshot after an overflow.", "resyncs"),
+    )
+    for name, help, key in totals:
+        registry.add(_TotalCounter(name, help, lambda key=key: bus.totals().get(key, 0)))
+    registry.add(Gauge("room_subscribers", "Open SSE streams per room (this process).",
+                       lambda: {(room,): n for room, n in bus.subscriber_counts().items()}, ("room",)))
+    registry.add(Gauge("presence_clients", "Clients listed in room presence.",
+                       lambda: {(): bus.client_count()}))
+
+
+class _TotalCounter:
+    """Counter whose value is kept elsewhere and read at scrape time."""
+
+    def __init__(self, name: str, help: str, read):
+        self.name, self.help, self.read = name, help, read
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter", f"{self.name} {_number(self.read())}"]
+
+
+def _instrument_store(rooms):
+    backend = rooms.backend
+    # Set while a batch is written: the JSON backends batch through write_snapshot,
+    # whose bytes are then counted once, by the batch
+    batching = threading.local()
+    for method, kind in (("write_snapshot", "snapshot"), ("append", "journal")):
+        write = getattr(backend, method, None)
+        if write is None:
+            continue
+
+        def counted(code, data, write=write, kind=kind):
+            if getattr(batching, "active", False):
+                return write(code, data)
+            before = backend.bytes_written
+            start = time.perf_counter()
+            write(code, data)
+            store_writes.observe(time.perf_counter() - start, kind)
+            store_bytes.inc(kind, amount=backend.bytes_written - before)
+
+        setattr(backend, method, counted)
+    write_many = getattr(backend, "write_snapshots", None)
+    if write_many is not None:
+        @functools.wraps(write_many)
+        def counted_many(items):
+            before = backend.bytes_written
+            start = time.perf_counter()
+            batching.active = True
+            try:
+                write_many(items)
+            finally:
+                batching.active = False
+            store_writes.observe(time.perf_counter() - start, "batch")
+            store_bytes.inc("snapshot", amount=backend.bytes_written - before)
+
+        backend.write_snapshots = counted_many
+    for method, kind in (("encode_snapshot", "snapshot"), ("encode_ops", "journal")):
+        encode = getattr(backend, method, None)
+        if encode is not None:
+            setattr(backend, method, _timed(encode, store_encode, kind))
+    registry.add(Gauge("rooms_active", "Rooms held in memory.", lambda: {(): len(rooms.active())}))
+
+
+def _instrument_draws():
+    import draw_engine
+
+    draw = draw_engine.DrawEngine._draw
+
+    @functools.wraps(draw)
+    def counted(self, *args, **kwargs):
+        result = draw(self, *args, **kwargs)
+        draw_attempts.observe(result[1], result[2])
+        return result
+
+    draw_engine.DrawEngine._draw = counted
+
+
+def install(app, bus, rooms):
+    """Instrument this process and serve ``/metrics`` from ``app``."""
+    _instrument_bus(bus)
+    _instrument_store(rooms)
+    _instrument_draws()
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _observe(response):
+        start = g.pop("metrics_start", None)
+        if start is not None:
+            rule = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            requests.observe(time.perf_counter() - start, rule, request.method, response.status_code)
+        return response
+
+    app.add_url_rule("/metrics", "metrics", lambda: Response(registry.render(), mimetype="text/plain; version=0.0.4"))
+
+
+def asgi_timer(handler, route: str):
+    """``handler`` (an ASGI room route served outside Flask) timed under ``route``."""
+    @functools.wraps(handler)
+    async def timed(scope, receive, send, room_id: str):
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await handler(scope, receive, send_status, room_id)
+        finally:
+            requests.observe(time.perf_counter() - start, route, scope["method"], status)
+    return timed
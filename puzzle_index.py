@@ -0,0 +1,171 @@
+"""Inverted index over ``static/puzzles.json`` for ``/api/puzzles``.
+
+Built once (rebuilt when the file or the deck changes). Each filter maps a
+key to a bit mask of puzzle positions, so combined filters are integer
+ANDs:
+
+    tag=Serre,Capteurs      every tag (accents and case ignored)
+    difficulty=2 | 1-3      difficulty, or inclusive range
+    cards=5 | 4-6           puzzles whose min_cards–max_cards range meets it
+    card=cap:ventilateur    suggests that deck card (``deck_index.card_id``)
+    id=pz-001,pz-002        any of these ids
+
+plus ``offset``/``limit`` and ``fields=id,title,…``. Encoded pages are
+cached with their ETag until the index is rebuilt.
+"""
+import collections
+import hashlib
+import json
+import os
+import threading
+
+from deck_index import CompiledDeck, slugify
+
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+class QueryError(ValueError):
+    pass
+
+
+def _bits(mask: int):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def _values(args: dict, name: str) -> list[str]:
+    return [v.strip() for raw in args.get(name, []) for v in str(raw).split(",") if v.strip()]
+
+
+def _range(value: str, name: str) -> tuple[int, int]:
+    lo, sep, hi = value.partition("-")
+    try:
+        lo = int(lo)
+        hi = int(hi) if sep else lo
+    except ValueError:
+        raise QueryError(f"{name} invalide: {value}")
+    return (lo, hi) if lo <= hi else (hi, lo)
+
+
+class _Compiled:
+    def __init__(self, puzzles: list, deck: CompiledDeck):
+        self.puzzles = puzzles
+        self.all = (1 << len(puzzles)) - 1
+        self.by_id: dict[str, int] = {}
+        self.by_tag: dict[str, int] = collections.defaultdict(int)
+        self.by_difficulty: dict[int, int] = collections.defaultdict(int)
+        self.by_cards: dict[int, int] = collections.defaultdict(int)
+        self.by_card: dict[str, int] = collections.defaultdict(int)
+        card_ids = {c["label"]: cid for cid, c in deck.cards.items()}
+        for pos, p in enumerate(puzzles):
+            bit = 1 << pos
+            self.by_id[str(p.get("id"))] = bit
+            for tag in p.get("tags") or []:
+                self.by_tag[slugify(str(tag))] |= bit
+            if isinstance(p.get("difficulty"), int):
+                self.by_difficulty[p["difficulty"]] |= bit
+            lo, hi = p.get("min_cards"), p.get("max_cards")
+            if isinstance(lo, int) and isinstance(hi, int):
+                for n in range(lo, hi + 1):
+                    self.by_cards[n] |= bit
+            for label in p.get("suggested_blocks") or []:
+                if label in card_ids:
+                    self.by_card[card_ids[label]] |= bit
+        self.pages: collections.OrderedDict[tuple, tuple[bytes, str]] = collections.OrderedDict()
+
+    def match(self, args: dict) -> int:
+        mask = self.all
+        ids = _values(args, "id")
+        if ids:
+            found = 0
+            for pid in ids:
+                found |= self.by_id.get(pid, 0)
+            mask &= found
+        for tag in _values(args, "tag"):
+            mask &= self.by_tag.get(slugify(tag), 0)
+        for card in _values(args, "card"):
+            mask &= self.by_card.get(card, 0)
+        for value in _values(args, "difficulty"):
+            lo, hi = _range(value, "difficulty")
+            mask &= _union(self.by_difficulty, lo, hi)
+        for value in _values(args, "cards"):
+            lo, hi = _range(value, "cards")
+            mask &= _union(self.by_cards, lo, hi)
+        return mask
+
+
+def _union(index: dict[int, int], lo: int, hi: int) -> int:
+    found = 0
+    for key, mask in index.items():
+        if lo <= key <= hi:
+            found |= mask
+    return found
+
+
+class PuzzleIndex:
+    def __init__(self, path: str, deck_source, page_cache: int = 256):
+        self.path = path
+        self.deck_source = deck_source
+        self.page_cache = page_cache
+        self._lock = threading.Lock()
+        # (file signature, deck, compiled index), swapped as a whole
+        self._current: tuple[tuple, CompiledDeck, _Compiled] | None = None
+
+    def _load(self) -> _Compiled:
+        st = os.stat(self.path)
+        sig = (st.st_mtime_ns, st.st_size)
+        deck = self.deck_source()
+        current = self._current
+        if current is not None and current[0] == sig and current[1] is deck:
+            return current[2]
+        with self._lock:
+            current = self._current
+            if current is None or current[0] != sig or current[1] is not deck:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    puzzles = json.load(f)
+                if not isinstance(puzzles, list):
+                    raise ValueError("puzzles.json doit contenir une liste")
+                current = self._current = (sig, deck, _Compiled(puzzles, deck))
+            return current[2]
+
+    def query(self, args: dict) -> tuple[bytes, str]:
+        """Encoded page and ETag for query ``args`` (name -> list of values)."""
+        index = self._load()
+        try:
+            offset = max(0, int((args.get("offset") or ["0"])[0]))
+            limit = int((args.get("limit") or [str(DEFAULT_LIMIT)])[0])
+        except ValueError:
+            raise QueryError("offset/limit invalides")
+        limit = max(1, min(MAX_LIMIT, limit))
+        fields = tuple(_values(args, "fields"))
+        key = (
+            tuple(sorted(_values(args, "id"))),
+            tuple(sorted(slugify(t) for t in _values(args, "tag"))),
+            tuple(sorted(_values(args, "card"))),
+            tuple(sorted(_values(args, "difficulty"))),
+            tuple(sorted(_values(args, "cards"))),
+            fields, offset, limit,
+        )
+        with self._lock:
+            page = index.pages.get(key)
+            if page is not None:
+                index.pages.move_to_end(key)
+                return page
+        mask = index.match(args)
+        positions = list(_bits(mask))
+        items = [index.puzzles[pos] for pos in positions[offset:offset + limit]]
+        if fields:
+            keep = ("id", *fields)
+            items = [{k: p[k] for k in keep if k in p} for p in items]
+        body = json.dumps({"total": len(positions), "offset": offset, "limit": limit, "items": items},
+                          ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        page = (body, hashlib.sha1(body).hexdigest())
+        with self._lock:
+            index.pages[key] = page
+            while len(index.pages) > self.page_cache:
+                index.pages.popitem(last=False)
+        return page
@@ -0,0 +1,731 @@
+"""Room event fan-out for the SSE streams.
+
+Each published event is encoded to SSE bytes once and the same ``Frame`` is
+shared by every subscriber of the room. Subscribers have a bounded outbox:
+when it is full, frames superseded by the incoming one are coalesced away
+(a ``state_sync`` replaces queued syncs and patches, a ``presence`` replaces
+queued rosters); if that is not enough the outbox is emptied and the stream
+is told to send a fresh snapshot. Publishers never block on a slow client.
+
+``RoomBus`` delivers within one process and is the default. ``SqliteBus``
+lets several Gunicorn workers on one host share rooms: events are appended
+to a SQLite log (WAL) that every worker tails, and presence lives in a table
+of the same database.
+
+Presence changes are not broadcast one by one: joins and leaves are
+collected per room and published every ``presence_window`` seconds as one
+``presence_delta`` event (``joined`` entries, ``left`` ids) holding the
+current state of the clients that changed. Streams get the full roster
+once, when they open. Clients refresh their entry with ``touch``
+(heartbeats); entries older than ``presence_ttl`` are evicted.
+
+Every published event carries an SSE ``id:`` that increases within its
+room. ``RoomBus`` keeps the last ``replay_size`` frames of each room (until
+``presence_ttl`` after its last subscriber left) and ``SqliteBus`` reads
+them back from its log, so a reconnecting ``EventSource`` (``Last-Event-ID``)
+can be sent only what it missed; ``resume`` returns None when that is no
+longer possible and the stream falls back to a snapshot.
+
+Drags in progress and pointer positions go through ``live`` instead: the
+latest update of each client is kept and every ``live_window`` seconds the
+room gets one ``live`` event with all of them. Live frames, like every
+``EPHEMERAL`` event (dashboard summaries too), have no id, are not replayed
+and never reach room storage; ``SqliteBus`` still passes them through its
+log so streams held by other workers get them.
+"""
+import asyncio
+import collections
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+
+log = logging.getLogger(__name__)
+
+
+# Event type -> queued event types it makes obsolete
+SUPERSEDES = {
+    "state_sync": frozenset({"state_sync", "state_patch"}),
+    "presence": frozenset({"presence", "presence_delta"}),
+    "live": frozenset({"live"}),
+}
+
+# Event types that are neither numbered nor replayed
+EPHEMERAL = frozenset({"live", "summary"})
+
+PING = b": ping\n\n"
+
+
+class Frame:
+    __slots__ = ("type", "data")
+
+    def __init__(self, etype: str, data: bytes):
+        self.type = etype
+        self.data = data
+
+
+def encode(event: dict, event_id: str | None = None) -> Frame:
+    etype = event.get("type", "message")
+    data = json.dumps(event.get("data", {}), ensure_ascii=False)
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return Frame(etype, f"{head}event: {etype}\ndata: {data}\n\n".encode("utf-8"))
+
+
+# Returned by Subscriber.get when frames were dropped and the stream must resnapshot
+RESYNC = Frame("resync", b"")
+
+QUEUED, COALESCED, DROPPED = "queued", "coalesced", "dropped"
+
+
+class Subscriber:
+    """Bounded outbox of encoded frames for one stream."""
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._frames: collections.deque[Frame] = collections.deque()
+        self._cond = threading.Condition(threading.Lock())
+        self._resync = False
+        # Presence client behind the stream, kept listed while the stream is open
+        self.client: str | None = None
+
+    def offer(self, frame: Frame) -> tuple[str, int]:
+        """Queue ``frame`` without blocking; return the outcome and how many frames were discarded."""
+        with self._cond:
+            outcome, discarded = QUEUED, 0
+            if len(self._frames) >= self.maxsize:
+                stale = SUPERSEDES.get(frame.type)
+                if stale:
+                    kept = collections.deque(f for f in self._frames if f.type not in stale)
+                    discarded = len(self._frames) - len(kept)
+                    self._frames = kept
+                    outcome = COALESCED
+                if len(self._frames) >= self.maxsize:
+                    discarded += len(self._frames)
+                    self._frames.clear()
+                    self._resync = True
+                    outcome = DROPPED
+            if not self._resync:
+                self._frames.append(frame)
+            self._cond.notify()
+            return outcome, discarded
+
+    def get(self, timeout: float = 0) -> Frame | None:
+        """Next frame, ``RESYNC`` after an overflow, or None on timeout."""
+        with self._cond:
+            if not self._frames and not self._resync and timeout:
+                self._cond.wait(timeout)
+            if self._resync:
+                return RESYNC
+            if self._frames:
+                return self._frames.popleft()
+            return None
+
+    def reset(self):
+        """Forget queued frames; call while holding whatever makes the next snapshot current."""
+        with self._cond:
+            self._frames.clear()
+            self._resync = False
+
+    def depth(self) -> int:
+        return len(self._frames)
+
+
+class AsyncSubscriber(Subscriber):
+    """Subscriber drained by a coroutine on ``loop`` instead of a blocked thread.
+
+    Publishers may run on any thread; they only schedule a wake-up on the
+    loop, at most one pending per subscriber. Heartbeats come from a shared
+    timer calling ``ping`` rather than from a timeout per stream.
+    """
+
+    def __init__(self, maxsize: int, loop: asyncio.AbstractEventLoop):
+        super().__init__(maxsize)
+        self._loop = loop
+        self._ready = asyncio.Event()
+        self._wake_pending = False
+        self._ping = False
+
+    def offer(self, frame: Frame) -> tuple[str, int]:
+        result = super().offer(frame)
+        self._wake()
+        return result
+
+    def ping(self):
+        """Ask the stream for a heartbeat; call from the loop thread."""
+        self._ping = True
+        self._ready.set()
+
+    def _wake(self):
+        with self._cond:
+            if self._wake_pending:
+                return
+            self._wake_pending = True
+        try:
+            self._loop.call_soon_threadsafe(self._set_ready)
+        except RuntimeError:
+            pass  # loop already closed
+
+    def _set_ready(self):
+        self._wake_pending = False
+        self._ready.set()
+
+    async def next(self) -> Frame | None:
+        """Next frame, ``RESYNC`` after an overflow, or None when a heartbeat is due."""
+        while True:
+            frame = self.get()
+            if frame is not None:
+                return frame
+            if self._ping:
+                self._ping = False
+                return None
+            self._ready.clear()
+            # A frame offered before clear() would otherwise be missed until the next one
+            frame = self.get()
+            if frame is not None:
+                return frame
+            await self._ready.wait()
+
+
+class _Ring:
+    """Event ids and recent frames of one room; deliveries happen under ``lock`` in id order."""
+
+    __slots__ = ("lock", "seq", "frames")
+
+    def __init__(self, size: int, seq: int = 0):
+        self.lock = threading.Lock()
+        self.seq = seq
+        self.frames: collections.deque[tuple[int, Frame]] = collections.deque(maxlen=size)
+
+
+class RoomBus:
+    """In-process bus: subscribers and presence live in this process only."""
+
+    def __init__(self, queue_size: int = 256, presence_window: float = 0.25, presence_ttl: float = 60.0,
+                 replay_size: int = 512, live_window: float = 0.05):
+        self.queue_size = queue_size
+        self.presence_window = presence_window
+        self.presence_ttl = presence_ttl
+        self.replay_size = replay_size
+        self.live_window = live_window
+        # Ids are "<epoch>-<seq>": ids from before a restart are not mistaken for current ones
+        self._epoch = format(time.time_ns() // 1_000_000, "x")
+        self._rings: dict[str, _Ring] = {}
+        # A new ring starts at the microseconds elapsed since then, past any id a
+        # pruned ring of the same room handed out (one publish takes longer than
+        # that): ids are never reissued without remembering pruned rooms, and a
+        # Last-Event-ID from before the prune gets a resync
+        self._started = time.monotonic_ns()
+        self._lock = threading.Lock()
+        self._subs: dict[str, list[Subscriber]] = {}
+        self._stats: dict[str, collections.Counter] = {}
+        # Same counters for the whole process, kept when idle rooms are pruned
+        self._totals = collections.Counter()
+        self._clients: dict[str, dict[str, dict]] = {}
+        # Clients whose presence changed since the last delta, per room
+        self._pending: dict[str, set[str]] = {}
+        # Latest live update of each client since the last live event, per room
+        self._live: dict[str, dict[str, dict]] = {}
+        # Rooms without subscribers -> since when; their stats and replay frames go after presence_ttl
+        self._idle: dict[str, float] = {}
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="room-bus", daemon=True)
+        self._thread.start()
+
+    def subscribe(self, room_id: str, sub: Subscriber | None = None, client_id: str | None = None) -> Subscriber:
+        """Add ``sub`` to the room; with ``client_id`` that client stays in presence while it is subscribed."""
+        if sub is None:
+            sub = Subscriber(self.queue_size)
+        sub.client = client_id
+        with self._lock:
+            self._subs.setdefault(room_id, []).append(sub)
+            self._idle.pop(room_id, None)
+            if room_id not in self._rings:
+                self._rings[room_id] = _Ring(self.replay_size, (time.monotonic_ns() - self._started) // 1000)
+        return sub
+
+    def unsubscribe(self, room_id: str, sub: Subscriber):
+        with self._lock:
+            subs = self._subs.get(room_id, [])
+            if sub in subs:
+                subs.remove(sub)
+            if not subs:
+                self._subs.pop(room_id, None)
+                self._idle[room_id] = time.monotonic()
+
+    def publish(self, room_id: str, event: dict):
+        if event.get("type") in EPHEMERAL:
+            with self._lock:
+                if room_id not in self._subs:
+                    return
+            self._deliver(room_id, encode(event))
+            return
+        with self._lock:
+            # Rooms nobody listened to lately have no ring: nothing to encode
+            ring = self._rings.get(room_id)
+        if ring is None:
+            return
+        with ring.lock:
+            ring.seq += 1
+            frame = encode(event, f"{self._epoch}-{ring.seq}")
+            ring.frames.append((ring.seq, frame))
+            self._deliver(room_id, frame)
+
+    # --- live (drags, pointers) ---
+    def live(self, room_id: str, client_id: str, update: dict):
+        """Queue ``update`` for the next live event; it is merged into the client's pending one."""
+        with self._lock:
+            clients = self._live.setdefault(room_id, {})
+            clients[client_id] = {**clients.get(client_id, {}), **update}
+
+    def _publish_live(self, room_id: str, clients: dict[str, dict]):
+        self.publish(room_id, {"type": "live", "data": {"clients": clients}})
+
+    def flush_live(self):
+        with self._lock:
+            pending, self._live = self._live, {}
+        for room_id, clients in pending.items():
+            self._publish_live(room_id, clients)
+
+    def last_id(self, room_id: str) -> str | None:
+        """Id of the room's latest event, to stamp a snapshot with."""
+        with self._lock:
+            ring = self._rings.get(room_id)
+        if ring is None:
+            return None
+        with ring.lock:
+            return f"{self._epoch}-{ring.seq}" if ring.seq else None
+
+    def resume(self, room_id: str, sub: Subscriber, last_event_id: str) -> list[Frame] | None:
+        """Frames published after ``last_event_id``, or None if some are gone.
+
+        ``sub`` must already be subscribed; its queue is emptied so it only
+        receives what follows the returned frames.
+        """
+        epoch, _, seq = last_event_id.partition("-")
+        if epoch != self._epoch or not seq.isdigit():
+            return None
+        after = int(seq)
+        with self._lock:
+            ring = self._rings.get(room_id)
+        if ring is None:
+            return None
+        with ring.lock:
+            if after > ring.seq:
+                return None
+            oldest = ring.frames[0][0] if ring.frames else ring.seq + 1
+            if after < oldest - 1:
+                return None  # aged out of the ring
+            sub.reset()
+            return [frame for seq, frame in ring.frames if seq > after]
+
+    def _deliver(self, room_id: str, frame: Frame) -> tuple[int, int]:
+        """Queue ``frame`` to the room's subscribers; return how many, and the deepest outbox after it."""
+        with self._lock:
+            subs = list(self._subs.get(room_id, []))
+        if not subs:
+            return 0, 0
+        coalesced = dropped = resyncs = deepest = 0
+        for sub in subs:
+            outcome, discarded = sub.offer(frame)
+            if outcome == COALESCED:
+                coalesced += discarded
+            elif outcome == DROPPED:
+                dropped += discarded
+                resyncs += 1
+            deepest = max(deepest, sub.depth())
+        with self._lock:
+            for stats in (self._stats.setdefault(room_id, collections.Counter()), self._totals):
+                stats["published"] += 1
+                stats["delivered"] += len(subs)
+                stats["coalesced"] += coalesced
+                stats["dropped"] += dropped
+                stats["resyncs"] += resyncs
+        return len(subs), deepest
+
+    def stats(self, room_id: str) -> dict:
+        with self._lock:
+            subs = list(self._subs.get(room_id, []))
+            counters = dict(self._stats.get(room_id, {}))
+        return {
+            "subscribers": len(subs),
+            "maxQueueDepth": max((s.depth() for s in subs), default=0),
+            "published": counters.get("published", 0),
+            "delivered": counters.get("delivered", 0),
+            "coalesced": counters.get("coalesced", 0),
+            "dropped": counters.get("dropped", 0),
+            "resyncs": counters.get("resyncs", 0),
+        }
+
+    def listened(self, room_id: str) -> bool:
+        """False when no stream can be listening to ``room_id``."""
+        with self._lock:
+            return room_id in self._subs
+
+    def totals(self) -> dict:
+        """Fan-out counters of this process, all rooms together."""
+        with self._lock:
+            return dict(self._totals)
+
+    def subscriber_counts(self) -> dict[str, int]:
+        """Open streams per room in this process."""
+        with self._lock:
+            return {room_id: len(subs) for room_id, subs in self._subs.items() if subs}
+
+    # --- presence ---
+    def join(self, room_id: str, client_id: str, name: str):
+        with self._lock:
+            self._clients.setdefault(room_id, {})[client_id] = {"name": name, "ts": time.time()}
+        self._changed(room_id, [client_id])
+
+    def touch(self, room_id: str, client_id: str) -> bool:
+        """Refresh a client's heartbeat; False if it is not (or no longer) listed."""
+        with self._lock:
+            info = self._clients.get(room_id, {}).get(client_id)
+            if info is None:
+                return False
+            info["ts"] = time.time()
+            return True
+
+    def leave(self, room_id: str, client_id: str):
+        with self._lock:
+            clients = self._clients.get(room_id, {})
+            clients.pop(client_id, None)
+            if not clients:
+                self._clients.pop(room_id, None)
+        self._changed(room_id, [client_id])
+
+    def client_count(self) -> int:
+        with self._lock:
+            return sum(len(clients) for clients in self._clients.values())
+
+    def presence_counts(self, room_ids) -> dict[str, int]:
+        """Clients listed in each of ``room_ids``."""
+        with self._lock:
+            return {room_id: len(self._clients.get(room_id, ())) for room_id in room_ids}
+
+    def roster(self, room_id: str) -> list[dict]:
+        with self._lock:
+            clients = self._clients.get(room_id, {})
+            return [{"id": cid, "name": info.get("name") or "Invité"} for cid, info in clients.items()]
+
+    def _states(self, room_id: str, client_ids) -> dict[str, str | None]:
+        """Current name of each client, None for those who left."""
+        with self._lock:
+            clients = self._clients.get(room_id, {})
+            return {cid: (clients[cid].get("name") or "Invité") if cid in clients else None for cid in client_ids}
+
+    def _changed(self, room_id: str, client_ids):
+        with self._lock:
+            self._pending.setdefault(room_id, set()).update(client_ids)
+
+    @staticmethod
+    def _delta(states: dict[str, str | None]) -> dict:
+        return {"type": "presence_delta", "data": {
+            "joined": [{"id": cid, "name": name} for cid, name in states.items() if name is not None],
+            "left": [cid for cid, name in states.items() if name is None],
+        }}
+
+    def _publish_delta(self, room_id: str, client_ids: set[str]):
+        self.publish(room_id, self._delta(self._states(room_id, sorted(client_ids))))
+
+    def flush_presence(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for room_id, client_ids in pending.items():
+            self._publish_delta(room_id, client_ids)
+
+    def _streaming(self) -> set[tuple[str, str]]:
+        """(room, client) pairs with an open stream in this process; call with the lock held."""
+        return {(room_id, sub.client) for room_id, subs in self._subs.items() for sub in subs if sub.client}
+
+    def _evict_stale(self):
+        # Heartbeats are only needed from clients without an open stream
+        # (throttled background tabs may send them late)
+        now = time.time()
+        cutoff = now - self.presence_ttl
+        stale: dict[str, list[str]] = {}
+        with self._lock:
+            streaming = self._streaming()
+            for room_id, clients in list(self._clients.items()):
+                for cid, info in list(clients.items()):
+                    if (room_id, cid) in streaming:
+                        info["ts"] = now
+                    elif info["ts"] < cutoff:
+                        del clients[cid]
+                        stale.setdefault(room_id, []).append(cid)
+                if not clients:
+                    del self._clients[room_id]
+            idle_cutoff = time.monotonic() - self.presence_ttl
+            for room_id, since in list(self._idle.items()):
+                if since < idle_cutoff:
+                    del self._idle[room_id]
+                    self._stats.pop(room_id, None)
+                    self._rings.pop(room_id, None)
+        for room_id, client_ids in stale.items():
+            self._changed(room_id, client_ids)
+
+    def _tick(self, state: dict):
+        """Periodic work of the bus thread: live events, presence deltas, then TTL sweeps."""
+        now = time.monotonic()
+        if now >= state.get("live", 0):
+            state["live"] = now + self.live_window
+            self.flush_live()
+        if now >= state.get("flush", 0):
+            state["flush"] = now + self.presence_window
+            self.flush_presence()
+        if now >= state.get("sweep", 0):
+            state["sweep"] = now + min(5.0, self.presence_ttl / 4)
+            self._evict_stale()
+
+    def _run(self):
+        state: dict[str, float] = {}
+        while not self._stop.wait(min(self.presence_window, self.live_window)):
+            try:
+                self._tick(state)
+            except Exception:
+                log.exception("Room bus presence failed")
+
+    def close(self):
+        self._stop.set()
+
+
+class SqliteBus(RoomBus):
+    """Cross-process bus for several workers on one host, through a shared SQLite file.
+
+    ``publish`` appends the encoded frame to the ``events`` log; each process
+    tails the log every ``poll_interval`` seconds (and right after its own
+    publishes) and delivers frames to its local subscribers in log order.
+    Log row ids are the event ids, and the log (``retention`` seconds) is
+    what ``resume`` replays from. The ``listeners`` table lists the rooms
+    (and summary channels) each worker has streams for, so ``listened`` sees
+    the streams of every worker.
+    Do not combine with ``gunicorn --preload``: the tail thread must start in
+    each worker.
+    """
+
+    def __init__(self, path: str, queue_size: int = 256, poll_interval: float = 0.02, retention: float = 120.0,
+                 presence_window: float = 0.25, presence_ttl: float = 60.0, live_window: float = 0.05):
+        super().__init__(queue_size, presence_window, presence_ttl, live_window=live_window)
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._local = threading.local()
+        self._drain_lock = threading.Lock()
+        # Serializes a room's first subscribe and last unsubscribe with its listeners row
+        self._listen_lock = threading.Lock()
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                room TEXT NOT NULL,
+                type TEXT NOT NULL,
+                frame BLOB NOT NULL,
+                ts REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS events_room ON events (room, id);
+            CREATE TABLE IF NOT EXISTS presence (
+                room TEXT NOT NULL,
+                client TEXT NOT NULL,
+                name TEXT,
+                pid INTEGER NOT NULL,
+                ts REAL NOT NULL,
+                PRIMARY KEY (room, client)
+            );
+            CREATE INDEX IF NOT EXISTS presence_ts ON presence (ts);
+            CREATE TABLE IF NOT EXISTS listeners (
+                room TEXT NOT NULL,
+                pid INTEGER NOT NULL,
+                PRIMARY KEY (room, pid)
+            ) WITHOUT ROWID;
+        """)
+        # Rows left by an earlier process with our pid
+        conn.execute("DELETE FROM listeners WHERE pid = ?", (os.getpid(),))
+        self._last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def subscribe(self, room_id: str, sub: Subscriber | None = None, client_id: str | None = None) -> Subscriber:
+        with self._listen_lock:
+            sub = super().subscribe(room_id, sub, client_id)
+            with self._lock:
+                first = len(self._subs[room_id]) == 1
+            if first:
+                self._conn().execute("INSERT OR IGNORE INTO listeners (room, pid) VALUES (?, ?)", (room_id, os.getpid()))
+        return sub
+
+    def unsubscribe(self, room_id: str, sub: Subscriber):
+        with self._listen_lock:
+            super().unsubscribe(room_id, sub)
+            with self._lock:
+                last = room_id not in self._subs
+            if last:
+                self._conn().execute("DELETE FROM listeners WHERE room = ? AND pid = ?", (room_id, os.getpid()))
+
+    def publish(self, room_id: str, event: dict):
+        frame = encode(event)
+        self._conn().execute(
+            "INSERT INTO events (room, type, frame, ts) VALUES (?, ?, ?, ?)",
+            (room_id, frame.type, frame.data, time.time()),
+        )
+        # Deliver our own event (and anything before it) without waiting for the tail
+        self._drain()
+
+    def _drain(self):
+        with self._drain_lock:
+            rows = self._conn().execute(
+                "SELECT id, room, type, frame FROM events WHERE id > ? ORDER BY id", (self._last_id,),
+            ).fetchall()
+            for event_id, room_id, etype, data in rows:
+                self._last_id = event_id
+                self._deliver(room_id, Frame(etype, data if etype in EPHEMERAL else b"id: %d\n" % event_id + data))
+
+    def last_id(self, room_id: str) -> str | None:
+        with self._drain_lock:
+            row = self._conn().execute(
+                "SELECT MAX(id) FROM events WHERE room = ? AND id <= ?", (room_id, self._last_id),
+            ).fetchone()
+        return str(row[0]) if row[0] is not None else None
+
+    def resume(self, room_id: str, sub: Subscriber, last_event_id: str) -> list[Frame] | None:
+        if not last_event_id.isdigit():
+            return None
+        after = int(last_event_id)
+        # Under the drain lock: frames up to _last_id were delivered (and are
+        # dropped by reset), later ones will be by the next drain
+        with self._drain_lock:
+            conn = self._conn()
+            if after > self._last_id:
+                return None
+            oldest = conn.execute("SELECT MIN(id) FROM events").fetchone()[0]
+            if after < (oldest if oldest is not None else self._last_id + 1) - 1:
+                return None  # pruned from the log
+            rows = conn.execute(
+                "SELECT id, type, frame FROM events WHERE room = ? AND id > ? AND id <= ? ORDER BY id",
+                (room_id, after, self._last_id),
+            ).fetchall()
+            rows = [row for row in rows if row[1] not in EPHEMERAL]
+            sub.reset()
+            return [Frame(etype, b"id: %d\n" % event_id + data) for event_id, etype, data in rows]
+
+    def _evict_stale(self):
+        conn = self._conn()
+        conn.execute("DELETE FROM events WHERE ts < ?", (time.time() - self.retention,))
+        with self._lock:
+            streaming = self._streaming()
+        if streaming:
+            now = time.time()
+            conn.executemany("UPDATE presence SET ts = ? WHERE room = ? AND client = ?",
+                             [(now, room_id, cid) for room_id, cid in streaming])
+        # Presence rows past their TTL, or of workers that died without cleaning up
+        dead = []
+        for (pid,) in conn.execute("SELECT pid FROM presence UNION SELECT pid FROM listeners").fetchall():
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                dead.append(pid)
+            except PermissionError:
+                pass
+        where = f"ts < ? OR pid IN ({','.join('?' * len(dead))})" if dead else "ts < ?"
+        params = (time.time() - self.presence_ttl, *dead)
+        stale: dict[str, list[str]] = {}
+        for room_id, cid in conn.execute(f"SELECT room, client FROM presence WHERE {where}", params).fetchall():
+            stale.setdefault(room_id, []).append(cid)
+        if stale:
+            conn.execute(f"DELETE FROM presence WHERE {where}", params)
+        if dead:
+            conn.execute(f"DELETE FROM listeners WHERE pid IN ({','.join('?' * len(dead))})", dead)
+        for room_id, client_ids in stale.items():
+            self._changed(room_id, client_ids)
+        super()._evict_stale()
+
+    def _run(self):
+        state: dict[str, float] = {}
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self._drain()
+                self._tick(state)
+            except Exception:
+                log.exception("Room bus tail failed")
+
+    # --- presence ---
+    def join(self, room_id: str, client_id: str, name: str):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO presence (room, client, name, pid, ts) VALUES (?, ?, ?, ?, ?)",
+            (room_id, client_id, name, os.getpid(), time.time()),
+        )
+        self._changed(room_id, [client_id])
+
+    def touch(self, room_id: str, client_id: str) -> bool:
+        cur = self._conn().execute(
+            "UPDATE presence SET ts = ? WHERE room = ? AND client = ?", (time.time(), room_id, client_id),
+        )
+        return cur.rowcount > 0
+
+    def leave(self, room_id: str, client_id: str):
+        self._conn().execute(
+            "DELETE FROM presence WHERE room = ? AND client = ? AND pid = ?", (room_id, client_id, os.getpid()),
+        )
+        self._changed(room_id, [client_id])
+
+    def _publish_delta(self, room_id: str, client_ids: set[str]):
+        # Read the states and append the event in one write transaction, so deltas
+        # from several workers land in the log in the order the states were read
+        conn = self._conn()
+        ids = sorted(client_ids)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                f"SELECT client, name FROM presence WHERE room = ? AND client IN ({','.join('?' * len(ids))})",
+                (room_id, *ids),
+            ).fetchall()
+            names = {cid: name or "Invité" for cid, name in rows}
+            frame = encode(self._delta({cid: names.get(cid) for cid in ids}))
+            conn.execute(
+                "INSERT INTO events (room, type, frame, ts) VALUES (?, ?, ?, ?)",
+                (room_id, frame.type, frame.data, time.time()),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._drain()
+
+    def listened(self, room_id: str) -> bool:
+        if super().listened(room_id):
+            return True
+        return self._conn().execute("SELECT 1 FROM listeners WHERE room = ? LIMIT 1", (room_id,)).fetchone() is not None
+
+    def client_count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM presence").fetchone()[0]
+
+    def presence_counts(self, room_ids) -> dict[str, int]:
+        room_ids = list(room_ids)
+        counts = dict.fromkeys(room_ids, 0)
+        for i in range(0, len(room_ids), 500):
+            chunk = room_ids[i:i + 500]
+            counts.update(self._conn().execute(
+                f"SELECT room, COUNT(*) FROM presence WHERE room IN ({','.join('?' * len(chunk))}) GROUP BY room",
+                chunk,
+            ).fetchall())
+        return counts
+
+    def roster(self, room_id: str) -> list[dict]:
+        rows = self._conn().execute(
+            "SELECT client, name FROM presence WHERE room = ? ORDER BY ts", (room_id,),
+        ).fetchall()
+        return [{"id": cid, "name": name or "Invité"} for cid, name in rows]
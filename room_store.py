@@ -0,0 +1,983 @@
+"""In-memory room store with write-behind persistence.
+
+Handlers read and mutate room envelopes through ``RoomStore`` instead of
+opening ``saves/<code>.json`` on every request. Hot rooms stay in memory
+behind a per-room lock; mutated rooms are marked dirty and written out by a
+background thread every ``flush_interval`` seconds, and once more on shutdown.
+
+With ``shared=True`` several processes (Gunicorn workers) can serve the same
+rooms: writes take a cross-process lock and go straight to disk, and a room
+is reloaded whenever its files changed since this process last saw them.
+
+On disk a room is a compact snapshot (``<code>.json`` or ``<code>.json.gz``)
+replaced atomically, plus with ``JournalBackend`` an append-only
+``<code>.journal`` of JSON lines holding only what changed since the
+snapshot. The journal is folded back into the snapshot every
+``compact_every`` entries and when the room goes idle.
+
+``SqliteBackend`` keeps one row per room in a SQLite database (WAL) instead,
+with indexed creation date, write date and team, for deployments with many
+rooms. Every backend can archive or purge rooms that were not written for a
+while (``RoomStore.expire``).
+
+    python room_store.py import saves/           # saves/*.json -> SQLite
+    python room_store.py expire --days 60 [--purge]
+"""
+import argparse
+import atexit
+import copy
+import fcntl
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+
+
+log = logging.getLogger(__name__)
+
+
+class RoomNotFound(KeyError):
+    pass
+
+
+def _is_id_list(value) -> bool:
+    return isinstance(value, list) and all(isinstance(v, dict) and "id" in v for v in value)
+
+
+def diff_ops(old, new, path=None, ops=None) -> dict:
+    """Describe how to turn ``old`` into ``new`` as idempotent journal ops.
+
+    ``set`` holds ``[path, value]`` pairs and ``del`` holds paths. Lists of
+    objects carrying an ``id`` (blocks, links) are diffed per item in
+    ``items`` entries so moving one block does not rewrite the whole board.
+    """
+    if path is None:
+        path = []
+    if ops is None:
+        ops = {}
+    if isinstance(old, dict) and isinstance(new, dict):
+        for k, v in new.items():
+            if k in old:
+                diff_ops(old[k], v, path + [k], ops)
+            else:
+                ops.setdefault("set", []).append([path + [k], v])
+        for k in old:
+            if k not in new:
+                ops.setdefault("del", []).append(path + [k])
+    elif _is_id_list(old) and _is_id_list(new) and new:
+        before = {item["id"]: item for item in old}
+        changed = [item for item in new if before.get(item["id"]) != item]
+        ids = [item["id"] for item in new]
+        entry = {"path": path, "put": changed}
+        if ids != [item["id"] for item in old]:
+            entry["ids"] = ids
+        if changed or "ids" in entry:
+            ops.setdefault("items", []).append(entry)
+    elif old != new or type(old) is not type(new):
+        ops.setdefault("set", []).append([path, new])
+    return ops
+
+
+def _parent(env: dict, path: list):
+    target = env
+    for key in path[:-1]:
+        nxt = target.get(key)
+        if not isinstance(nxt, dict):
+            nxt = target[key] = {}
+        target = nxt
+    return target
+
+
+def apply_ops(env: dict, ops: dict) -> dict:
+    for path, value in ops.get("set", []):
+        if not path:
+            env = value
+            continue
+        _parent(env, path)[path[-1]] = value
+    for entry in ops.get("items", []):
+        path = entry["path"]
+        parent = _parent(env, path)
+        current = parent.get(path[-1])
+        by_id = {item["id"]: item for item in current} if _is_id_list(current) else {}
+        for item in entry.get("put", []):
+            by_id[item["id"]] = item
+        if "ids" in entry:
+            parent[path[-1]] = [by_id[i] for i in entry["ids"] if i in by_id]
+        else:
+            parent[path[-1]] = list(by_id.values())
+    for path in ops.get("del", []):
+        _parent(env, path).pop(path[-1], None)
+    return env
+
+
+def _atomic_write(path: str, data: bytes):
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _iso(ts: float) -> str:
+    """UTC timestamp in the envelopes' ``...Z`` format, with a fixed width so strings sort."""
+    return datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None).isoformat(timespec="milliseconds") + "Z"
+
+
+def _summary(envelope: dict, code: str) -> dict:
+    return {"roomId": code, "team": envelope.get("team"), "createdAt": envelope.get("createdAt"),
+            "savedAt": envelope.get("savedAt")}
+
+
+class JsonDirBackend:
+    """Whole-envelope snapshots, one ``<code>.json`` per room, replaced atomically.
+
+    ``indent=2`` reproduces the historical pretty-printed saves; the default
+    is compact. With ``compress`` snapshots go to ``<code>.json.gz``.
+    Legacy ``.json`` saves are read either way.
+    """
+
+    journaled = False
+
+    def __init__(self, directory: str, indent: int | None = None, compress: bool = False):
+        self.directory = directory
+        self.indent = indent
+        self.compress = compress
+        self.bytes_written = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, code: str, ext: str) -> str:
+        return os.path.join(self.directory, f"{code}{ext}")
+
+    def _read_snapshot(self, code: str) -> tuple[dict | None, int | None]:
+        """The snapshot envelope and the CRC-32 of its file (None, None without one)."""
+        candidates = []
+        for ext in (".json.gz", ".json"):
+            try:
+                candidates.append((os.path.getmtime(self._path(code, ext)), ext))
+            except OSError:
+                pass
+        # Both exist only if a crash hit between replace and cleanup
+        for _, ext in sorted(candidates, reverse=True):
+            with open(self._path(code, ext), "rb") as f:
+                raw = f.read()
+            data = gzip.decompress(raw) if ext == ".json.gz" else raw
+            return json.loads(data.decode("utf-8")), zlib.crc32(raw)
+        return None, None
+
+    def load(self, code: str, repair: bool = True) -> tuple[dict | None, int]:
+        """Return the envelope and how many journal entries sit on top of its snapshot."""
+        return self._read_snapshot(code)[0], 0
+
+    def signature(self, code: str) -> tuple:
+        """Cheap fingerprint of the room files, to notice writes by other processes."""
+        sig = []
+        for ext in (".json.gz", ".json", ".journal"):
+            try:
+                st = os.stat(self._path(code, ext))
+                sig.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                sig.append(None)
+        return tuple(sig)
+
+    def codes(self) -> list[str]:
+        """Codes of every room saved in the directory."""
+        found = set()
+        for name in os.listdir(self.directory):
+            if name.startswith(".") or name.endswith(".tmp"):
+                continue
+            for ext in (".json.gz", ".json", ".journal"):
+                if name.endswith(ext):
+                    found.add(name[:-len(ext)])
+                    break
+        return sorted(found)
+
+    def encode_snapshot(self, envelope: dict) -> bytes:
+        if self.indent is None:
+            text = json.dumps(envelope, ensure_ascii=False, separators=(",", ":"))
+        else:
+            text = json.dumps(envelope, ensure_ascii=False, indent=self.indent)
+        data = text.encode("utf-8")
+        if self.compress:
+            data = gzip.compress(data, mtime=0)
+        return data
+
+    def write_snapshot(self, code: str, data: bytes):
+        ext, stale = (".json.gz", ".json") if self.compress else (".json", ".json.gz")
+        _atomic_write(self._path(code, ext), data)
+        self.bytes_written += len(data)
+        try:
+            os.remove(self._path(code, stale))
+        except FileNotFoundError:
+            pass
+
+    def write_snapshots(self, items: list[tuple[str, bytes]]):
+        """Write several snapshots; one file per room, so one after the other."""
+        for code, data in items:
+            self.write_snapshot(code, data)
+
+    def _files(self, code: str, directory: str | None = None) -> list[str]:
+        directory = directory or self.directory
+        paths = (os.path.join(directory, f"{code}{ext}") for ext in (".json.gz", ".json", ".journal"))
+        return [p for p in paths if os.path.exists(p)]
+
+    def archived(self, code: str) -> bool:
+        return bool(self._files(code, os.path.join(self.directory, "archive")))
+
+    def query(self, since: str | None = None, until: str | None = None, team: str | None = None,
+              limit: int = 500) -> list[dict]:
+        """Rooms created in ``[since, until)`` (ISO prefixes), newest first; reads every save."""
+        found = []
+        for code in self.codes():
+            try:
+                envelope, _ = self.load(code, repair=False)
+            except (OSError, ValueError):
+                continue
+            if envelope is None:
+                continue
+            created = envelope.get("createdAt") or ""
+            if (since and created < since) or (until and created >= until) or (team is not None and envelope.get("team") != team):
+                continue
+            found.append(_summary(envelope, code))
+        found.sort(key=lambda r: r["createdAt"] or "", reverse=True)
+        return found[:limit]
+
+    def expire(self, before: float, archive: bool = True, keep=()) -> list[str]:
+        """Move to ``archive/`` (or delete) rooms whose files were last written before ``before``."""
+        archive_dir = os.path.join(self.directory, "archive")
+        expired = []
+        for code in self.codes():
+            if code in keep:
+                continue
+            try:
+                paths = self._files(code)
+                if not paths or max(os.path.getmtime(p) for p in paths) >= before:
+                    continue
+                for path in paths:
+                    if archive:
+                        os.makedirs(archive_dir, exist_ok=True)
+                        os.replace(path, os.path.join(archive_dir, os.path.basename(path)))
+                    else:
+                        os.remove(path)
+            except OSError:
+                continue  # another worker got there first
+            expired.append(code)
+        return expired
+
+
+class JournalBackend(JsonDirBackend):
+    """Snapshots plus an append-only ``<code>.journal`` of ``diff_ops`` lines.
+
+    Each line carries the CRC-32 of the snapshot it applies to (``base``).
+    Compaction installs the new snapshot before deleting the journal; if a
+    crash falls in between, the old lines no longer match the snapshot and
+    are skipped instead of reverting it.
+    """
+
+    journaled = True
+
+    def __init__(self, directory: str, compress: bool = False, compact_every: int = 50):
+        super().__init__(directory, compress=compress)
+        self.compact_every = compact_every
+        # code -> CRC-32 of the snapshot last read or written
+        self._bases: dict[str, int] = {}
+
+    def load(self, code: str, repair: bool = True) -> tuple[dict | None, int]:
+        envelope, base = self._read_snapshot(code)
+        # Only writers' loads (``repair``) set the base later appends refer to
+        if repair:
+            if base is None:
+                self._bases.pop(code, None)
+            else:
+                self._bases[code] = base
+        entries = 0
+        try:
+            with open(self._path(code, ".journal"), "r+b" if repair else "rb") as f:
+                good = 0
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("unterminated")
+                        ops = json.loads(line)
+                    except ValueError:
+                        # Torn tail from a crash mid-append: cut it off so the
+                        # next append starts on a clean line. Without
+                        # ``repair`` it may be another process mid-append.
+                        if repair:
+                            f.truncate(good)
+                        break
+                    good += len(line)
+                    # Lines without ``base`` predate it and always apply
+                    if ops.pop("base", base) != base:
+                        continue
+                    envelope = apply_ops(envelope if envelope is not None else {}, ops)
+                    entries += 1
+        except FileNotFoundError:
+            pass
+        return envelope, entries
+
+    def encode_ops(self, ops: dict) -> bytes:
+        return json.dumps(ops, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+    def append(self, code: str, data: bytes):
+        base = self._bases.get(code)
+        if base is not None:
+            # data is one encode_ops object: tag it with the snapshot it applies to
+            data = b'{"base":%d,' % base + data[1:]
+        with open(self._path(code, ".journal"), "ab") as f:
+            f.write(data)
+        self.bytes_written += len(data)
+
+    def write_snapshot(self, code: str, data: bytes):
+        super().write_snapshot(code, data)
+        self._bases[code] = zlib.crc32(data)
+        # Lines left by a crash before this point carry the old base and are skipped
+        try:
+            os.remove(self._path(code, ".journal"))
+        except FileNotFoundError:
+            pass
+
+
+class SqliteBackend:
+    """One row per room in a SQLite database (WAL), safe with several writer processes.
+
+    The envelope is stored whole as compact JSON (zlib-compressed with
+    ``compress``); ``team``, ``created_at`` and ``saved_at`` (time of the last
+    write) are indexed columns so rooms can be listed without reading them.
+    ``rev`` counts writes and serves as the change signature in shared mode.
+    Expired rooms move to the ``archive`` table unless purged.
+    """
+
+    journaled = False
+
+    def __init__(self, path: str, compress: bool = False):
+        self.path = path
+        # RoomStore keeps its cross-process lock file next to the database
+        self.directory = os.path.dirname(os.path.abspath(path))
+        self.compress = compress
+        self.bytes_written = 0
+        self._local = threading.local()
+        os.makedirs(self.directory, exist_ok=True)
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS rooms (
+                code TEXT PRIMARY KEY,
+                team TEXT,
+                created_at TEXT,
+                saved_at TEXT NOT NULL,
+                rev INTEGER NOT NULL DEFAULT 1,
+                envelope BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS rooms_created ON rooms (created_at);
+            CREATE INDEX IF NOT EXISTS rooms_saved ON rooms (saved_at);
+            CREATE INDEX IF NOT EXISTS rooms_team ON rooms (team, created_at);
+            CREATE TABLE IF NOT EXISTS archive (
+                code TEXT PRIMARY KEY,
+                team TEXT,
+                created_at TEXT,
+                saved_at TEXT NOT NULL,
+                archived_at TEXT NOT NULL,
+                envelope BLOB NOT NULL
+            );
+        """)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _decode(self, blob: bytes) -> dict:
+        data = bytes(blob)
+        if data[:1] != b"{":
+            data = zlib.decompress(data)
+        return json.loads(data)
+
+    def load(self, code: str, repair: bool = True) -> tuple[dict | None, int]:
+        row = self._conn().execute("SELECT envelope FROM rooms WHERE code = ?", (code,)).fetchone()
+        return (self._decode(row[0]) if row else None), 0
+
+    def signature(self, code: str) -> tuple:
+        row = self._conn().execute("SELECT rev FROM rooms WHERE code = ?", (code,)).fetchone()
+        return (row[0] if row else None,)
+
+    def codes(self) -> list[str]:
+        return [code for (code,) in self._conn().execute("SELECT code FROM rooms ORDER BY code")]
+
+    def archived(self, code: str) -> bool:
+        return self._conn().execute("SELECT 1 FROM archive WHERE code = ?", (code,)).fetchone() is not None
+
+    def encode_snapshot(self, envelope: dict) -> tuple:
+        data = json.dumps(envelope, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        if self.compress:
+            data = zlib.compress(data)
+        team = envelope.get("team")
+        return (team if isinstance(team, str) else None), envelope.get("createdAt"), data
+
+    # created_at keeps its first value: /save replaces envelopes without it
+    _UPSERT = """
+        INSERT INTO rooms (code, team, created_at, saved_at, envelope) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (code) DO UPDATE SET
+            team = excluded.team,
+            created_at = COALESCE(rooms.created_at, excluded.created_at),
+            saved_at = excluded.saved_at,
+            rev = rooms.rev + 1,
+            envelope = excluded.envelope
+    """
+
+    def write_snapshot(self, code: str, data: tuple):
+        team, created_at, blob = data
+        self._conn().execute(self._UPSERT, (code, team, created_at, _iso(time.time()), blob))
+        self.bytes_written += len(blob)
+
+    def write_snapshots(self, items: list[tuple[str, tuple]]):
+        """Write several snapshots in one transaction."""
+        now = _iso(time.time())
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(self._UPSERT, [(code, team, created_at, now, blob) for code, (team, created_at, blob) in items])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self.bytes_written += sum(len(data[2]) for _, data in items)
+
+    def query(self, since: str | None = None, until: str | None = None, team: str | None = None,
+              limit: int = 500) -> list[dict]:
+        """Rooms created in ``[since, until)`` (ISO prefixes), newest first, from the indexes."""
+        where, params = [], []
+        if since:
+            where.append("created_at >= ?")
+            params.append(since)
+        if until:
+            where.append("created_at < ?")
+            params.append(until)
+        if team is not None:
+            where.append("team = ?")
+            params.append(team)
+        sql = "SELECT code, team, created_at, saved_at FROM rooms"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        rows = self._conn().execute(sql + " ORDER BY created_at DESC LIMIT ?", (*params, limit)).fetchall()
+        return [{"roomId": code, "team": t, "createdAt": created, "savedAt": saved} for code, t, created, saved in rows]
+
+    def expire(self, before: float, archive: bool = True, keep=()) -> list[str]:
+        """Archive (or delete) rooms last written before ``before``, in one transaction."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            codes = [code for (code,) in conn.execute("SELECT code FROM rooms WHERE saved_at < ?", (_iso(before),))
+                     if code not in keep]
+            for i in range(0, len(codes), 500):
+                chunk = codes[i:i + 500]
+                marks = ",".join("?" * len(chunk))
+                if archive:
+                    conn.execute(f"""
+                        INSERT OR REPLACE INTO archive (code, team, created_at, saved_at, archived_at, envelope)
+                        SELECT code, team, created_at, saved_at, ?, envelope FROM rooms WHERE code IN ({marks})
+                    """, (_iso(time.time()), *chunk))
+                conn.execute(f"DELETE FROM rooms WHERE code IN ({marks})", chunk)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return codes
+
+    def import_dir(self, directory: str) -> int:
+        """Copy every room saved in ``directory`` (json, gz, journal) that is not here yet."""
+        source = JournalBackend(directory)
+        rows = []
+        for code in source.codes():
+            try:
+                envelope, _ = source.load(code, repair=False)
+            except (OSError, ValueError) as e:
+                log.warning("Skipping room %s: %s", code, e)
+                continue
+            if envelope is None:
+                continue
+            team, created_at, blob = self.encode_snapshot(envelope)
+            mtime = max(os.path.getmtime(p) for p in source._files(code))
+            rows.append((code, team, created_at, _iso(mtime), blob))
+        conn = self._conn()
+        before = conn.total_changes
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO rooms (code, team, created_at, saved_at, envelope) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (code) DO NOTHING", rows,
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return conn.total_changes - before
+
+
+class _ProcessLocks:
+    """Striped cross-process room locks: POSIX record locks on bytes of one file.
+
+    Record locks belong to the process, not the thread, so each stripe is also
+    guarded by a thread lock.
+    """
+
+    def __init__(self, path: str, stripes: int = 1024):
+        self.stripes = stripes
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._threads = [threading.Lock() for _ in range(stripes)]
+
+    def _stripe(self, code: str) -> int:
+        return zlib.crc32(code.encode("utf-8")) % self.stripes
+
+    def acquire(self, code: str):
+        i = self._stripe(code)
+        self._threads[i].acquire()
+        try:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, i)
+        except BaseException:
+            self._threads[i].release()
+            raise
+
+    def release(self, code: str):
+        self._unlock(self._stripe(code))
+
+    def _unlock(self, i: int):
+        fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, i)
+        self._threads[i].release()
+
+    def acquire_many(self, codes) -> list[int]:
+        """Lock the stripes of all ``codes`` (each once, in order); pass the result to ``release_many``."""
+        stripes = sorted({self._stripe(code) for code in codes})
+        held = []
+        try:
+            for i in stripes:
+                self._threads[i].acquire()
+                try:
+                    fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, i)
+                except BaseException:
+                    self._threads[i].release()
+                    raise
+                held.append(i)
+        except BaseException:
+            self.release_many(held)
+            raise
+        return held
+
+    def release_many(self, stripes: list[int]):
+        for i in reversed(stripes):
+            self._unlock(i)
+
+
+class _Room:
+    __slots__ = ("lock", "io_lock", "envelope", "loaded", "dirty", "touched", "evicted", "persisted", "journal", "sig")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Serializes writes of this room so an older snapshot never lands last
+        self.io_lock = threading.Lock()
+        self.envelope: dict | None = None
+        self.loaded = False
+        self.dirty = False
+        self.touched = time.monotonic()
+        self.evicted = False
+        # What is on disk: last written envelope and journal entries on top
+        # of the snapshot (None while the room has no snapshot yet)
+        self.persisted: dict | None = None
+        self.journal: int | None = None
+        # Backend signature of the files we last read or wrote (shared mode)
+        self.sig: tuple | None = None
+
+
+class RoomStore:
+    def __init__(self, backend, flush_interval: float = 1.0, idle_ttl: float = 600.0, shared: bool = False,
+                 retention: float | None = None, archive: bool = True):
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.idle_ttl = idle_ttl
+        self.shared = shared
+        # Rooms not written for ``retention`` seconds are archived (or purged) hourly
+        self.retention = retention
+        self.archive = archive
+        self._next_expire = 0.0
+        self._xlocks = _ProcessLocks(os.path.join(backend.directory, ".rooms.lock")) if shared else None
+        self._rooms: dict[str, _Room] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    # --- access ---
+    def _entry(self, code: str) -> _Room:
+        with self._lock:
+            room = self._rooms.get(code)
+            if room is None:
+                room = self._rooms[code] = _Room()
+            return room
+
+    def _load(self, code: str, room: _Room, repair: bool):
+        if self.shared:
+            sig = self.backend.signature(code)
+            if room.loaded and sig == room.sig:
+                return
+            room.sig = sig
+        elif room.loaded:
+            return
+        room.envelope, journal = self.backend.load(code, repair=repair)
+        room.journal = journal if room.envelope is not None else None
+        room.persisted = copy.deepcopy(room.envelope) if self.backend.journaled else None
+        room.dirty = False
+        room.loaded = True
+
+    def _acquire(self, code: str, write: bool = False) -> _Room:
+        """Return the room entry for ``code`` with its lock held and envelope loaded."""
+        while True:
+            room = self._entry(code)
+            room.lock.acquire()
+            if room.evicted:
+                # Raced with the idle sweeper; pick up the fresh entry
+                room.lock.release()
+                continue
+            xlocked = False
+            try:
+                if self.shared and write:
+                    self._xlocks.acquire(code)
+                    xlocked = True
+                self._load(code, room, repair=write or not self.shared)
+            except BaseException:
+                if xlocked:
+                    self._xlocks.release(code)
+                room.lock.release()
+                raise
+            room.touched = time.monotonic()
+            return room
+
+    def _release(self, code: str, room: _Room, write: bool = False):
+        try:
+            if self.shared and write:
+                try:
+                    # Other processes only see what is on disk: write through
+                    if room.dirty:
+                        self._commit(code, room, self._prepare(room), locked=True)
+                finally:
+                    self._xlocks.release(code)
+        finally:
+            room.lock.release()
+
+    def view(self, code: str, fn):
+        """Run ``fn(envelope)`` under the room lock without marking it dirty."""
+        room = self._acquire(code)
+        try:
+            if room.envelope is None:
+                raise RoomNotFound(code)
+            return fn(room.envelope)
+        finally:
+            self._release(code, room)
+
+    def peek(self, code: str, fn):
+        """Like ``view``, but a room not held in memory is read from storage and not kept."""
+        with self._lock:
+            held = code in self._rooms
+        if held:
+            return self.view(code, fn)
+        envelope, _ = self.backend.load(code, repair=False)
+        if envelope is None:
+            raise RoomNotFound(code)
+        return fn(envelope)
+
+    def get(self, code: str) -> dict | None:
+        try:
+            return self.view(code, copy.deepcopy)
+        except RoomNotFound:
+            return None
+
+    def exists(self, code: str) -> bool:
+        try:
+            return self.view(code, lambda env: True)
+        except RoomNotFound:
+            return False
+
+    def codes(self) -> set[str]:
+        """Codes in use: saved rooms and rooms so far only held in memory (archived ones excluded)."""
+        return set(self.backend.codes()) | set(self.active())
+
+    def active(self) -> list[str]:
+        """Codes of the rooms currently held in memory."""
+        with self._lock:
+            return sorted(code for code, room in self._rooms.items() if room.envelope is not None)
+
+    def mutate(self, code: str, fn, create=None):
+        """Run ``fn(envelope)`` under the room lock and schedule a write.
+
+        ``create`` builds the envelope when the room does not exist yet;
+        without it a missing room raises ``RoomNotFound``. If ``fn`` raises,
+        the room is not marked dirty, and a room it was creating is not kept.
+        """
+        room = self._acquire(code, write=True)
+        try:
+            envelope = room.envelope
+            if envelope is None:
+                if create is None:
+                    raise RoomNotFound(code)
+                envelope = create()
+            result = fn(envelope)
+            room.envelope = envelope
+            room.dirty = True
+            return result
+        finally:
+            self._release(code, room, write=True)
+
+    def put(self, code: str, envelope: dict):
+        """Replace the whole envelope of ``code``."""
+        self.mutate(code, lambda env: (env.clear(), env.update(envelope)), create=dict)
+
+    def create(self, code: str, envelope: dict) -> bool:
+        """Store ``envelope`` under ``code`` unless that room already exists."""
+        room = self._acquire(code, write=True)
+        try:
+            # Archived codes stay reserved so the room can be restored
+            if room.envelope is not None or self.backend.archived(code):
+                return False
+            room.envelope = envelope
+            room.dirty = True
+            return True
+        finally:
+            self._release(code, room, write=True)
+
+    def create_many(self, envelopes: dict[str, dict]) -> list[str]:
+        """Store several new rooms with one batched write; return the codes created.
+
+        Codes already in use (saved, archived or in memory) are skipped. The
+        new rooms stay in memory, so their first requests find them loaded.
+        """
+        codes = sorted(envelopes)
+        held, batch = [], []
+        try:
+            for code in codes:
+                while True:
+                    room = self._entry(code)
+                    # io_lock first, as in _flush_room: the batch is written before any later change
+                    room.io_lock.acquire()
+                    room.lock.acquire()
+                    if not room.evicted:
+                        break
+                    room.lock.release()
+                    room.io_lock.release()
+                held.append(room)
+            stripes = self._xlocks.acquire_many(codes) if self.shared else None
+            try:
+                for code, room in zip(codes, held):
+                    self._load(code, room, repair=True)
+                    room.touched = time.monotonic()
+                    if room.envelope is not None or self.backend.archived(code):
+                        continue
+                    room.envelope = envelopes[code]
+                    batch.append((code, room, self._prepare(room)))
+                self._commit_many(batch)
+            finally:
+                if stripes is not None:
+                    self._xlocks.release_many(stripes)
+        finally:
+            for room in held:
+                room.lock.release()
+                room.io_lock.release()
+        return [code for code, _, _ in batch]
+
+    # --- persistence ---
+    def _prepare(self, room: _Room, compact: bool = False):
+        """Encode what has to be written for ``room``; call with its lock held."""
+        backend = self.backend
+        snapshot = (not backend.journaled or compact or room.journal is None
+                    or room.journal >= backend.compact_every)
+        data = None
+        if not snapshot:
+            try:
+                ops = diff_ops(room.persisted, room.envelope)
+            except Exception:
+                # Leave the journal alone; a snapshot needs no diff
+                log.exception("Could not diff room, writing a snapshot instead")
+                snapshot = True
+            else:
+                if ops:
+                    data = backend.encode_ops(ops)
+        if snapshot:
+            data = backend.encode_snapshot(room.envelope)
+        rollback = (room.persisted, room.journal)
+        if backend.journaled:
+            room.persisted = copy.deepcopy(room.envelope)
+        room.journal = 0 if snapshot else room.journal + (data is not None)
+        room.dirty = False
+        return snapshot, data, rollback
+
+    def _commit(self, code: str, room: _Room, prepared: tuple, locked: bool):
+        """Write what ``_prepare`` encoded; ``locked`` tells whether the room lock is held."""
+        snapshot, data, rollback = prepared
+        try:
+            if snapshot:
+                self.backend.write_snapshot(code, data)
+            elif data is not None:
+                self.backend.append(code, data)
+        except Exception:
+            log.exception("Could not persist room %s", code)
+            if not locked:
+                room.lock.acquire()
+            try:
+                room.persisted, room.journal = rollback
+                room.dirty = True
+            finally:
+                if not locked:
+                    room.lock.release()
+            return
+        if self.shared:
+            room.sig = self.backend.signature(code)
+
+    def _commit_many(self, batch: list[tuple]):
+        """Write new-room snapshots from ``_prepare`` together; call with their locks held."""
+        if not batch:
+            return
+        try:
+            self.backend.write_snapshots([(code, prepared[1]) for code, _, prepared in batch])
+        except Exception:
+            log.exception("Could not persist %d new room(s)", len(batch))
+            for _, room, (_, _, rollback) in batch:
+                room.persisted, room.journal = rollback
+                room.dirty = True
+            return
+        if self.shared:
+            for code, room, _ in batch:
+                room.sig = self.backend.signature(code)
+
+    def _flush_room(self, code: str, room: _Room, compact: bool = False):
+        if self.shared:
+            # Writes already went through; only compaction is left to do here
+            if not compact:
+                return
+            with room.lock:
+                if room.evicted or not room.journal:
+                    return
+                self._xlocks.acquire(code)
+                try:
+                    if self.backend.signature(code) != room.sig:
+                        # Another process wrote since; let the next access reload
+                        room.loaded = False
+                        return
+                    self._commit(code, room, self._prepare(room, compact=True), locked=True)
+                finally:
+                    self._xlocks.release(code)
+            return
+        with room.io_lock:
+            with room.lock:
+                if room.envelope is None:
+                    return
+                if not room.dirty and not (compact and room.journal):
+                    return
+                prepared = self._prepare(room, compact)
+            self._commit(code, room, prepared, locked=False)
+
+    def flush(self):
+        with self._lock:
+            entries = list(self._rooms.items())
+        for code, room in entries:
+            if room.dirty:
+                # One room that cannot be written must not hold back the others
+                try:
+                    self._flush_room(code, room)
+                except Exception:
+                    log.exception("Could not flush room %s", code)
+
+    def _evict_idle(self):
+        cutoff = time.monotonic() - self.idle_ttl
+        with self._lock:
+            idle = [(code, room) for code, room in self._rooms.items() if room.touched <= cutoff]
+        for code, room in idle:
+            # Fold the journal into a snapshot before letting the room go cold
+            if room.journal:
+                try:
+                    self._flush_room(code, room, compact=True)
+                except Exception:
+                    log.exception("Could not compact room %s", code)
+        with self._lock:
+            for code, room in idle:
+                if room.touched > cutoff or room.dirty or (room.journal and room.loaded):
+                    continue
+                if not room.lock.acquire(blocking=False):
+                    continue
+                try:
+                    if not room.dirty and self._rooms.get(code) is room:
+                        room.evicted = True
+                        del self._rooms[code]
+                finally:
+                    room.lock.release()
+
+    def query(self, since: str | None = None, until: str | None = None, team: str | None = None,
+              limit: int = 500) -> list[dict]:
+        """Saved rooms created in ``[since, until)``, newest first (see the backends)."""
+        self.flush()
+        return self.backend.query(since, until, team, limit)
+
+    def expire(self, max_idle: float, archive: bool = True) -> list[str]:
+        """Archive (or purge) saved rooms not written for ``max_idle`` seconds, except rooms in memory."""
+        self.flush()
+        return self.backend.expire(time.time() - max_idle, archive, keep=set(self.active()))
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+                self._evict_idle()
+                if self.retention and time.monotonic() >= self._next_expire:
+                    self._next_expire = time.monotonic() + 3600
+                    expired = self.expire(self.retention, self.archive)
+                    if expired:
+                        log.info("%s %d idle room(s)", "Archived" if self.archive else "Purged", len(expired))
+            except Exception:
+                log.exception("Room writer iteration failed")
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="room-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def close(self):
+        """Stop the background writer and flush every dirty room."""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Room storage maintenance (SQLite backend).")
+    parser.add_argument("--db", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "saves", ".rooms.sqlite3"))
+    commands = parser.add_subparsers(dest="command", required=True)
+    imp = commands.add_parser("import", help="copy saves/*.json (and journals) into the database")
+    imp.add_argument("directory")
+    exp = commands.add_parser("expire", help="archive rooms not written for --days days")
+    exp.add_argument("--days", type=float, required=True)
+    exp.add_argument("--purge", action="store_true", help="delete instead of archiving")
+    args = parser.parse_args()
+
+    backend = SqliteBackend(args.db)
+    if args.command == "import":
+        print(f"{backend.import_dir(args.directory)} room(s) imported into {args.db}")
+    else:
+        expired = backend.expire(time.time() - args.days * 86400, archive=not args.purge)
+        print(f"{len(expired)} room(s) {'purged' if args.purge else 'archived'}")
+
+
+if __name__ == "__main__":
+    main()
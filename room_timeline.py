@@ -0,0 +1,346 @@
+"""Per-room edit timeline: keyframes plus deltas, seekable by time or version.
+
+Every published room change (``app._publish``) hands the room's board
+(``team``, ``state``, ``meta``) to ``Timeline.note``; a background thread
+writes what piled up every ``interval`` seconds, in one transaction, to a
+SQLite database (``<saves>/.timeline.sqlite3``, WAL):
+
+- ``frames``: one row per recorded version, keyed by ``(room, version)`` and
+  indexed by ``(room, at)``. A frame is either a keyframe (hash of a whole
+  board) or a delta (``room_store.diff_ops`` from the previous frame).
+- ``snapshots``: keyframe boards, zlib-compressed, keyed by the SHA-256 of
+  their canonical JSON, so identical boards (new rooms, rooms provisioned
+  from the same draw, a board undone to an earlier state) are stored once.
+
+A keyframe is written every ``keyframe_every`` frames, or sooner once the
+deltas since the last one outweigh it. The board at a time or version is
+then two index lookups (the frame, the keyframe at or before it) and at most
+``keyframe_every`` deltas replayed.
+
+Several processes may record into the same database: a frame not newer than
+the latest one recorded for its room (another worker wrote a later version
+first) is dropped, since that later version already includes it. Within a
+process, flushes (from the writer and from readers) run one at a time, so
+batches are written in the order they were noted.
+
+With ``retention`` (seconds) or ``max_versions``, an hourly pass drops the
+history of rooms idle for longer than ``retention`` and, in other rooms,
+frames before the latest keyframe older than ``retention`` or more than
+``max_versions`` versions behind the last one; boards no frame refers to
+any more are dropped with them.
+"""
+import atexit
+import collections
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+
+from room_store import _iso, apply_ops, diff_ops
+
+
+log = logging.getLogger(__name__)
+
+# Envelope fields replayed by the timeline (not draw bookkeeping like lastDrawSig)
+BOARD_KEYS = ("team", "state", "meta")
+
+# Frames fetched per query while playing back
+_PAGE = 256
+
+
+def board_of(envelope: dict) -> dict:
+    return {key: envelope.get(key) for key in BOARD_KEYS}
+
+
+def parse_time(value: str) -> float:
+    """Epoch seconds from epoch seconds or an ISO date/time (UTC unless it says otherwise)."""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    dt = datetime.fromisoformat(value.strip().removesuffix("Z"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def _canonical(board: dict) -> bytes:
+    return json.dumps(board, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+class _Head:
+    """Last frame written for a room: its board and the cost of replaying up to it."""
+    __slots__ = ("version", "board", "deltas", "delta_bytes", "key_bytes")
+
+    def __init__(self, version: int, board: dict, deltas: int, delta_bytes: int, key_bytes: int):
+        self.version = version
+        self.board = board
+        self.deltas = deltas
+        self.delta_bytes = delta_bytes
+        self.key_bytes = key_bytes
+
+
+class Timeline:
+    def __init__(self, path: str, interval: float = 2.0, keyframe_every: int = 32, cache_size: int = 1024,
+                 retention: float | None = None, max_versions: int | None = None):
+        self.path = path
+        self.interval = interval
+        self.keyframe_every = keyframe_every
+        self.cache_size = cache_size
+        self.retention = retention
+        self.max_versions = max_versions
+        self.bytes_written = 0
+        self._next_expire = 0.0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # Held from taking the pending frames until they are committed
+        self._flush_lock = threading.Lock()
+        # Changes noted since the last flush: room -> [(version, at, board)]
+        self._pending: dict[str, list[tuple[int, float, dict]]] = {}
+        # Recently written rooms; a miss is rebuilt from the database
+        self._heads: collections.OrderedDict[str, _Head] = collections.OrderedDict()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS snapshots (
+                hash TEXT PRIMARY KEY,
+                data BLOB NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS frames (
+                room TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                at REAL NOT NULL,
+                snapshot TEXT,
+                ops BLOB,
+                PRIMARY KEY (room, version)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS frames_at ON frames (room, at, version);
+        """)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # --- recording ---
+    def note(self, room_id: str, envelope: dict):
+        """Record a room change; call with the room lock held.
+
+        The board is not copied: room updates replace nested values, they
+        never change them in place.
+        """
+        version = envelope.get("version")
+        if not isinstance(version, int):
+            return
+        with self._lock:
+            self._pending.setdefault(room_id, []).append((version, time.time(), board_of(envelope)))
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for room_id, frames in pending.items():
+                    self._record(conn, room_id, frames)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                with self._lock:
+                    # The cached heads may be ahead of what was rolled back
+                    for room_id in pending:
+                        self._heads.pop(room_id, None)
+                raise
+
+    def _record(self, conn: sqlite3.Connection, room_id: str, frames: list[tuple[int, float, dict]]):
+        latest = conn.execute("SELECT MAX(version) FROM frames WHERE room = ?", (room_id,)).fetchone()[0]
+        with self._lock:
+            head = self._heads.get(room_id)
+        if latest is not None and (head is None or head.version != latest):
+            head = self._replay(conn, room_id, latest)[0]
+        for version, at, board in frames:
+            if head is not None and version <= head.version:
+                continue
+            try:
+                ops = diff_ops(head.board, board) if head is not None else None
+            except Exception:
+                # A board that cannot be diffed is still recorded, as a keyframe
+                log.exception("Could not diff room %s at version %d", room_id, version)
+                ops = None
+            else:
+                if head is not None and not ops:
+                    continue
+            data = json.dumps(ops, ensure_ascii=False, separators=(",", ":")).encode("utf-8") if ops else b""
+            if (head is None or ops is None or head.deltas >= self.keyframe_every
+                    or head.delta_bytes + len(data) > head.key_bytes):
+                canonical = _canonical(board)
+                digest = hashlib.sha256(canonical).hexdigest()
+                blob = zlib.compress(canonical)
+                if conn.execute("INSERT OR IGNORE INTO snapshots (hash, data) VALUES (?, ?)", (digest, blob)).rowcount:
+                    self.bytes_written += len(blob)
+                conn.execute("INSERT INTO frames (room, version, at, snapshot) VALUES (?, ?, ?, ?)",
+                             (room_id, version, at, digest))
+                head = _Head(version, board, 0, 0, len(canonical))
+            else:
+                conn.execute("INSERT INTO frames (room, version, at, ops) VALUES (?, ?, ?, ?)",
+                             (room_id, version, at, data))
+                self.bytes_written += len(data)
+                head = _Head(version, board, head.deltas + 1, head.delta_bytes + len(data), head.key_bytes)
+        if head is not None:
+            with self._lock:
+                self._heads[room_id] = head
+                self._heads.move_to_end(room_id)
+                while len(self._heads) > self.cache_size:
+                    self._heads.popitem(last=False)
+
+    # --- reading ---
+    def _replay(self, conn: sqlite3.Connection, room_id: str, version: int) -> tuple[_Head, int]:
+        """Board at ``version`` (a recorded frame) and the version of the keyframe it was rebuilt from."""
+        key_version, blob = conn.execute("""
+            SELECT f.version, s.data FROM frames f JOIN snapshots s ON s.hash = f.snapshot
+            WHERE f.room = ? AND f.version <= ? AND f.snapshot IS NOT NULL
+            ORDER BY f.version DESC LIMIT 1
+        """, (room_id, version)).fetchone()
+        canonical = zlib.decompress(blob)
+        board = json.loads(canonical)
+        deltas = delta_bytes = 0
+        for (ops,) in conn.execute("SELECT ops FROM frames WHERE room = ? AND version > ? AND version <= ? ORDER BY version",
+                                   (room_id, key_version, version)):
+            board = apply_ops(board, json.loads(ops))
+            deltas += 1
+            delta_bytes += len(ops)
+        return _Head(version, board, deltas, delta_bytes, len(canonical)), key_version
+
+    def frames(self, room_id: str) -> list[dict]:
+        """Index of a room's timeline: version, time and kind of every frame."""
+        self.flush()
+        rows = self._conn().execute("SELECT version, at, snapshot IS NOT NULL FROM frames WHERE room = ? ORDER BY version",
+                                    (room_id,))
+        return [{"version": v, "at": _iso(at), "keyframe": bool(key)} for v, at, key in rows]
+
+    def _frame_at(self, conn: sqlite3.Connection, room_id: str, at: float | None, version: int | None):
+        if version is not None:
+            return conn.execute("SELECT version, at FROM frames WHERE room = ? AND version <= ? ORDER BY version DESC LIMIT 1",
+                                (room_id, version)).fetchone()
+        if at is not None:
+            return conn.execute("SELECT version, at FROM frames WHERE room = ? AND at <= ? ORDER BY at DESC, version DESC LIMIT 1",
+                                (room_id, at)).fetchone()
+        return conn.execute("SELECT version, at FROM frames WHERE room = ? ORDER BY version LIMIT 1", (room_id,)).fetchone()
+
+    def board_at(self, room_id: str, at: float | None = None, version: int | None = None) -> dict | None:
+        """The room as of time ``at`` (epoch seconds) or ``version``, None before its first frame.
+
+        With neither, the first recorded frame.
+        """
+        self.flush()
+        conn = self._conn()
+        row = self._frame_at(conn, room_id, at, version)
+        if row is None:
+            return None
+        head, key_version = self._replay(conn, room_id, row[0])
+        return {"version": row[0], "at": _iso(row[1]), "keyframe": key_version, "replayed": head.deltas, **head.board}
+
+    def play(self, room_id: str, at: float | None = None, version: int | None = None):
+        """Boards from ``at``/``version`` (or the start) to the latest frame, as ``(epoch seconds, board)``.
+
+        Rows are read a page at a time and each board is built from the one
+        before it, so a long session costs one replay, not one per frame; a
+        board is only valid until the next one is produced.
+        """
+        self.flush()
+        conn = self._conn()
+        row = self._frame_at(conn, room_id, at, version)
+        if row is None:
+            return
+        current, stamp = row
+        head = self._replay(conn, room_id, current)[0]
+        board = head.board
+        yield stamp, {"version": current, "at": _iso(stamp), **board}
+        while True:
+            rows = conn.execute("""
+                SELECT f.version, f.at, f.ops, s.data FROM frames f LEFT JOIN snapshots s ON s.hash = f.snapshot
+                WHERE f.room = ? AND f.version > ? ORDER BY f.version LIMIT ?
+            """, (room_id, current, _PAGE)).fetchall()
+            for current, stamp, ops, blob in rows:
+                board = json.loads(zlib.decompress(blob)) if blob is not None else apply_ops(board, json.loads(ops))
+                yield stamp, {"version": current, "at": _iso(stamp), **board}
+            if len(rows) < _PAGE:
+                return
+
+    # --- retention ---
+    def expire(self, before: float | None = None, max_versions: int | None = None) -> int:
+        """Drop history older than ``before`` (epoch seconds) or ``max_versions`` behind; returns frames deleted.
+
+        A room idle since ``before`` loses its whole history. Other rooms keep
+        the latest keyframe at or before the limit and everything after it,
+        so every version still recorded can be rebuilt.
+        """
+        with self._flush_lock:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                deleted = 0
+                idle = []
+                for room_id, latest, last_at in conn.execute(
+                        "SELECT room, MAX(version), MAX(at) FROM frames GROUP BY room").fetchall():
+                    if before is not None and last_at < before:
+                        deleted += conn.execute("DELETE FROM frames WHERE room = ?", (room_id,)).rowcount
+                        idle.append(room_id)
+                        continue
+                    start = conn.execute("""
+                        SELECT MAX(version) FROM frames WHERE room = ? AND snapshot IS NOT NULL AND (at <= ? OR version <= ?)
+                    """, (room_id, before, latest - max_versions if max_versions else None)).fetchone()[0]
+                    if start is not None:
+                        deleted += conn.execute("DELETE FROM frames WHERE room = ? AND version < ?",
+                                                (room_id, start)).rowcount
+                if deleted:
+                    conn.execute("""
+                        DELETE FROM snapshots WHERE hash NOT IN (SELECT snapshot FROM frames WHERE snapshot IS NOT NULL)
+                    """)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            with self._lock:
+                for room_id in idle:
+                    self._heads.pop(room_id, None)
+            return deleted
+
+    # --- background writer ---
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+                if (self.retention or self.max_versions) and time.monotonic() >= self._next_expire:
+                    self._next_expire = time.monotonic() + 3600
+                    before = time.time() - self.retention if self.retention else None
+                    deleted = self.expire(before, self.max_versions)
+                    if deleted:
+                        log.info("Dropped %d old timeline frame(s)", deleted)
+            except Exception:
+                log.exception("Room timeline writer iteration failed")
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="room-timeline", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def close(self):
+        """Stop the background writer and write what is pending."""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self.flush()
@@ -96,9 +96,11 @@
   const linksLayer = document.createElementNS(svgNS, 'g');
   const blocksLayer = document.createElementNS(svgNS, 'g');
   const uiLayer = document.createElementNS(svgNS, 'g');
+  const cursorsLayer = document.createElementNS(svgNS, 'g'); // other clients' pointers
   svg.appendChild(linksLayer);
   svg.appendChild(blocksLayer);
   svg.appendChild(uiLayer);
+  svg.appendChild(cursorsLayer);
 
   // Helpers
   const id = () => Math.random().toString(36).slice(2,10);
@@ -135,9 +137,12 @@
     catch { state.deck = await api('/deck'); }
   }
 
+  // Only ids and titles up front; the rest of a puzzle is fetched when it is chosen
   async function loadPuzzles(){
     try{
-      const list = await api('/puzzles.json');
+      let list;
+      try{ list = (await api('/api/puzzles?fields=title&limit=500')).items; }
+      catch{ list = (await api('/puzzles.json')).map(p=>({ ...p, full: true })); }
       if(Array.isArray(list)){
         state.puzzles = list;
         // populate select
@@ -203,10 +208,15 @@ async function drawCards(){
     const count = parseInt((drawCount && drawCount.value) || '4', 10);
     const seq = parseInt((drawSequences && drawSequences.value) || '1', 10);
     if(state.roomId && state.roomId !== 'SOLO' && state.roomId !== 'SANDBOX'){
-      await api(`/api/room/${state.roomId}/draw`, { method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify({ count, sequences: seq })});
+      // With a puzzle selected, the server deals hands that can build its corrigé
+      const body = { count, sequences: seq };
+      if(state.puzzle && state.puzzle.id) body.puzzleId = state.puzzle.id;
+      const res = await api(`/api/room/${state.roomId}/draw`, { method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify(body)});
+      if(res && res.message) showToast(res.message);
       return; // SSE will update UI
     }
     const res = await api('/api/draw', { method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify({ roomId: state.roomId||'SOLO', count, sequences: seq })});
+    if(res.message) showToast(res.message);
     if(res.proposals){ state.drawn.proposals = res.proposals; renderProposals(); return; }
     state.drawn.cards = res.elements || [];
     state.drawn.alea = (res.alea && res.alea.label) || null;
@@ -345,8 +355,35 @@ function renderDrawn(){
     lastTap = { t: now, x: pt.x, y: pt.y, id: blockId };
     return isDouble;
   }
-  let liveSyncAt = 0; // throttle timestamp for live sync during drag
-  const LIVE_SYNC_EVERY_MS = 160;
+  // Drags in progress and pointer positions go to the ephemeral live channel;
+  // the board itself is synced once, on drop
+  let liveSentAt = 0; // throttle timestamp for live updates
+  const LIVE_EVERY_MS = 50; // while dragging
+  const CURSOR_EVERY_MS = 120; // pointer only
+  let liveBusy = false, livePending = null;
+  function sendLive(update, force=false){
+    if(!state.roomId || state.roomId==='SOLO' || state.roomId==='SANDBOX') return;
+    const now = Date.now();
+    if(!force && now - liveSentAt < (update.blocks ? LIVE_EVERY_MS : CURSOR_EVERY_MS)) return;
+    liveSentAt = now;
+    const body = { client: clientId, name: state.team || 'Invité', ...update };
+    // One request in flight; newer updates replace the one waiting
+    if(liveBusy){ livePending = body; return; }
+    postLive(body);
+  }
+  function postLive(body){
+    liveBusy = true;
+    fetch(`/api/room/${state.roomId}/live`, { method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify(body) })
+      .catch(()=>{})
+      .finally(()=>{
+        liveBusy = false;
+        if(livePending){ const next = livePending; livePending = null; postLive(next); }
+      });
+  }
+  function draggedBlocks(){
+    const ids = dragging.type==='multi' ? dragging.ids : [dragging.id];
+    return ids.map(idb=>state.board.blocks.find(b=>b.id===idb)).filter(Boolean).map(b=>({ id:b.id, x:b.x, y:b.y }));
+  }
 
   function viewScale(){ const rect = svg.getBoundingClientRect(); const vb = svg.viewBox.baseVal; return { sx: rect.width/vb.width, sy: rect.height/vb.height, rect }; }
   function openTitleEditor(B){
@@ -665,9 +702,8 @@ function renderDrawn(){
       B.x = snap(pt.x - dragging.dx);
       B.y = snap(pt.y - dragging.dy);
       renderBoard();
-      // live sync (throttled) for classroom mode
-      const now = Date.now();
-      if(state.roomId && state.roomId!=='SOLO' && now - liveSyncAt > LIVE_SYNC_EVERY_MS){ liveSyncAt = now; syncIfRoom(); }
+      // live positions (throttled) for classroom mode
+      sendLive({ cursor:{ x:pt.x, y:pt.y }, blocks: draggedBlocks() });
     } else if(dragging && dragging.type==='multi'){
       dragging.ids.forEach(idb=>{
         const bb = state.board.blocks.find(b=>b.id===idb);
@@ -675,14 +711,17 @@ function renderDrawn(){
         if(bb && off){ bb.x = snap(pt.x - off.dx); bb.y = snap(pt.y - off.dy); }
       });
       renderBoard();
-      const now = Date.now();
-      if(state.roomId && state.roomId!=='SOLO' && now - liveSyncAt > LIVE_SYNC_EVERY_MS){ liveSyncAt = now; syncIfRoom(); }
+      sendLive({ cursor:{ x:pt.x, y:pt.y }, blocks: draggedBlocks() });
     } else if(linkDraft){
       linkDraft.x2 = pt.x; linkDraft.y2 = pt.y; renderBoard();
+      sendLive({ cursor:{ x:pt.x, y:pt.y } });
     } else if(rubber){
       rubber.x2 = pt.x; rubber.y2 = pt.y;
       applyRubberSelection(true);
       drawRubber();
+      sendLive({ cursor:{ x:pt.x, y:pt.y } });
+    } else {
+      sendLive({ cursor:{ x:pt.x, y:pt.y } });
     }
   });
   svg.addEventListener('pointerup', (e)=>{
@@ -690,6 +729,8 @@ function renderDrawn(){
     if(longPress){ try{ clearTimeout(longPress.timer); }catch{} longPress = null; }
     if(dragging){
       if(moveStartSnapshot){ pushHistoryFrom(moveStartSnapshot); moveStartSnapshot=null; }
+      // Final positions on the live channel, then the one durable sync
+      sendLive({ cursor:{ x:pt.x, y:pt.y }, blocks: draggedBlocks(), done: true }, true);
       dragging = null; syncIfRoom();
     }
     if(linkDraft){
@@ -925,9 +966,9 @@ function renderDrawn(){
 
   // Puzzles events
   if(puzzleSelect){
-    puzzleSelect.addEventListener('change', ()=>{
+    puzzleSelect.addEventListener('change', async ()=>{
       const selId = puzzleSelect.value;
-      state.puzzle = state.puzzles.find(p=>p.id===selId) || null;
+      state.puzzle = selId ? await fullPuzzle(selId) : null;
       renderPuzzleDetails();
       if(state.puzzle){
         if(drawCount && state.puzzle.min_cards){ drawCount.value = String(state.puzzle.min_cards); }
@@ -997,6 +1038,15 @@ function renderDrawn(){
 
   async function ensureDeck(){ if(!state.deck) await loadDeck(); }
   async function ensurePuzzles(){ if(!state.puzzles.length) await loadPuzzles(); }
+  async function fullPuzzle(puzzleId){
+    const p = state.puzzles.find(x=>x.id===puzzleId) || null;
+    if(!p || p.full) return p;
+    try{
+      const res = await api(`/api/puzzles?id=${encodeURIComponent(puzzleId)}`);
+      if(res.items && res.items[0]) Object.assign(p, res.items[0], { full: true });
+    }catch{}
+    return p;
+  }
   async function setPuzzleById(puzzleId, { fromRemote=false } = {}){
     if(!puzzleId){
       state.puzzle = null;
@@ -1007,7 +1057,7 @@ function renderDrawn(){
       return;
     }
     await ensurePuzzles();
-    const p = state.puzzles.find(x=>x.id===puzzleId) || null;
+    const p = await fullPuzzle(puzzleId);
     state.puzzle = p;
     if(puzzleSelect){ puzzleSelect.value = p ? p.id : ''; }
     renderPuzzleDetails();
@@ -1157,6 +1207,8 @@ function renderDrawn(){
       const data = await api(`/load/${state.roomId}`);
       state.team = data.team || state.team;
       state.board = data.state || state.board;
+      roomVersion = data.version || 0;
+      syncedBoard = cloneBoard(state.board);
       state.drawn.alea = (data.meta && data.meta.alea) || state.drawn.alea;
       setNotes((data.meta && data.meta.notes) || '');
       if(data.meta && data.meta.puzzleId){ await setPuzzleById(data.meta.puzzleId, { fromRemote:true }); }
@@ -1329,30 +1381,42 @@ function renderDrawn(){
 
   // --- Room sync via SSE ---
   let es = null;
+  let heartbeatTimer = null;
+  const HEARTBEAT_EVERY_MS = 20000; // server drops clients silent for PRESENCE_TTL (60 s)
   function connectRoomStream(){
     try{ if(es){ es.close(); } }catch{}
+    clearInterval(heartbeatTimer); heartbeatTimer = null;
+    syncedBoard = null; roomVersion = 0; syncedMeta = '';
+    remoteCursors.clear(); renderCursors();
     if(!state.roomId || state.roomId==='SOLO') return;
     const name = encodeURIComponent(state.team || 'Invité');
     es = new EventSource(`/api/room/${state.roomId}/events?client=${clientId}&name=${name}`);
+    const roomId = state.roomId;
+    heartbeatTimer = setInterval(()=>{
+      if(!es || es.readyState === EventSource.CLOSED) return;
+      fetch(`/api/room/${roomId}/heartbeat`, { method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify({ client: clientId, name: state.team || 'Invité' }) }).catch(()=>{});
+    }, HEARTBEAT_EVERY_MS);
     es.addEventListener('state_sync', (e)=>{
+      try{ applyRoomSnapshot(JSON.parse(e.data||'{}')); }catch{}
+    });
+    es.addEventListener('state_patch', (e)=>{
       try{
         const data = JSON.parse(e.data||'{}');
+        if(data.origin === clientId){ confirmOwnPatch(data.version, data.ops||[]); return; }
+        if(!syncedBoard || data.baseVersion !== roomVersion){ resyncRoom(); return; }
+        roomVersion = data.version;
+        applyBoardOps(syncedBoard, data.ops||[]);
+        applyBoardOps(state.board, data.ops||[]);
         if(data.team) state.team = data.team;
-        if(data.state){ state.board = data.state; }
-        if(data.meta){
-          state.drawn.alea = data.meta.alea || state.drawn.alea;
-          setNotes(data.meta.notes || '');
-          if(boardTitle) boardTitle.value = data.meta.title || '';
-          if(data.meta.puzzleId){ setPuzzleById(data.meta.puzzleId, { fromRemote:true }); }
-        }
+        if(data.meta) applyRoomMeta(data.meta);
         if(teamDisplay) teamDisplay.textContent = state.team||'–';
-        aleaDisplay.textContent = state.drawn.alea||'–';
         renderBoard();
       }catch{}
     });
     es.addEventListener('draws_updated', (e)=>{
       try{
         const data = JSON.parse(e.data||'{}');
+        advanceRoomVersion(data);
         state.drawn.proposals = data.proposals||[];
         renderProposals();
       }catch{}
@@ -1360,6 +1424,7 @@ function renderDrawn(){
     es.addEventListener('draw_chosen', (e)=>{
       try{
         const data = JSON.parse(e.data||'{}');
+        advanceRoomVersion(data);
         const p = data.proposal || {};
         state.drawn.cards = p.elements || [];
         state.drawn.alea = (p.alea && p.alea.label) || null;
@@ -1374,16 +1439,201 @@ function renderDrawn(){
         renderRoomIndicator();
       }catch{}
     });
+    es.addEventListener('presence_delta', (e)=>{
+      try{
+        const data = JSON.parse(e.data||'{}');
+        const joined = data.joined || [];
+        const gone = new Set([...(data.left||[]), ...joined.map(p=>p.id)]);
+        roomPresence = (roomPresence||[]).filter(p=>!gone.has(p.id)).concat(joined);
+        (data.left||[]).forEach(cid=>remoteCursors.delete(cid));
+        renderRoomIndicator();
+        renderCursors();
+      }catch{}
+    });
+    es.addEventListener('live', (e)=>{
+      try{ applyLive(JSON.parse(e.data||'{}')); }catch{}
+    });
+  }
+
+  // --- Live drags and pointers of the other clients (never saved) ---
+  const remoteCursors = new Map(); // clientId -> {x, y, name, t}
+  const CURSOR_TTL_MS = 3000;
+  function applyLive(data){
+    let moved = false;
+    Object.entries(data.clients||{}).forEach(([cid, u])=>{
+      if(cid === clientId || !u) return;
+      (u.blocks||[]).forEach(p=>{
+        if(dragging && (dragging.id===p.id || (dragging.ids||[]).includes(p.id))) return;
+        // Moved in syncedBoard too, so our next diff does not claim their drag
+        [state.board, syncedBoard].forEach(board=>{
+          const B = board && (board.blocks||[]).find(b=>b.id===p.id);
+          if(B){ B.x = p.x; B.y = p.y; moved = true; }
+        });
+      });
+      if(u.cursor) remoteCursors.set(cid, { x:u.cursor.x, y:u.cursor.y, name:u.name||'Invité', t:Date.now() });
+    });
+    if(moved) renderBoard();
+    renderCursors();
+  }
+  function renderCursors(){
+    cursorsLayer.innerHTML = '';
+    const now = Date.now();
+    remoteCursors.forEach((c, cid)=>{
+      if(now - c.t > CURSOR_TTL_MS){ remoteCursors.delete(cid); return; }
+      const g = document.createElementNS(svgNS, 'g');
+      g.setAttribute('class', 'remote-cursor');
+      g.setAttribute('transform', `translate(${c.x},${c.y})`);
+      const dot = document.createElementNS(svgNS, 'circle');
+      dot.setAttribute('r', 5);
+      const label = document.createElementNS(svgNS, 'text');
+      label.setAttribute('x', 8); label.setAttribute('y', -8);
+      label.textContent = c.name;
+      g.appendChild(dot); g.appendChild(label);
+      cursorsLayer.appendChild(g);
+    });
+  }
+  setInterval(()=>{ if(remoteCursors.size) renderCursors(); }, 1000);
+
+  // --- Versioned delta sync ---
+  // syncedBoard mirrors the server board at roomVersion; local edits are sent
+  // as ops diffed against it, tagged with the version they were built on.
+  let roomVersion = 0;
+  let syncedBoard = null;
+  let syncedMeta = '';
+  let syncBusy = false, syncQueued = false;
+  function cloneBoard(b){ return JSON.parse(JSON.stringify({ blocks: (b&&b.blocks)||[], links: (b&&b.links)||[] })); }
+
+  function diffBoard(prev, next){
+    const ops = [];
+    const removed = []; // block deletions go last: they cascade to attached links
+    [['block','blocks'], ['link','links']].forEach(([kind, key])=>{
+      const before = new Map((prev[key]||[]).map(x=>[x.id, x]));
+      const seen = new Set();
+      (next[key]||[]).forEach(item=>{
+        seen.add(item.id);
+        const old = before.get(item.id);
+        if(!old){ ops.push({ op:'add_'+kind, [kind]: item }); return; }
+        const set = {};
+        new Set([...Object.keys(old), ...Object.keys(item)]).forEach(k=>{
+          if(JSON.stringify(item[k]) !== JSON.stringify(old[k])) set[k] = item[k] === undefined ? null : item[k];
+        });
+        const keys = Object.keys(set);
+        if(!keys.length) return;
+        // Only the keys that changed: a missing coordinate means "unchanged" on the server
+        if(kind==='block' && keys.every(k=>k==='x'||k==='y')) ops.push({ op:'move_block', id:item.id, ...set });
+        else ops.push({ op:'update_'+kind, id:item.id, set });
+      });
+      before.forEach((_, id)=>{ if(!seen.has(id)) (kind==='block' ? removed : ops).push({ op:'delete_'+kind, id }); });
+    });
+    return JSON.parse(JSON.stringify(ops.concat(removed)));
+  }
+
+  // Same semantics as board_ops.apply_ops on the server (edits board in place)
+  function applyBoardOps(board, ops){
+    board.blocks = board.blocks || []; board.links = board.links || [];
+    ops.forEach(op=>{
+      const [action, kind] = String(op.op||'').split('_');
+      const key = kind==='block' ? 'blocks' : kind==='link' ? 'links' : null;
+      if(!key) return;
+      const list = board[key];
+      const targetId = action==='add' ? (op[kind]||{}).id : op.id;
+      const idx = list.findIndex(x=>x.id===targetId);
+      if(action==='add'){
+        const item = JSON.parse(JSON.stringify(op[kind]));
+        if(idx===-1) list.push(item); else list[idx] = item;
+      } else if(action==='move'){
+        if(idx!==-1) ['x','y'].forEach(k=>{ if(op[k]!=null) list[idx][k] = op[k]; });
+      } else if(action==='update'){
+        if(idx!==-1) Object.entries(JSON.parse(JSON.stringify(op.set||{}))).forEach(([k, v])=>{
+          if(v!=null) list[idx][k] = v;
+          else if(!['x','y','w','h'].includes(k)) delete list[idx][k];
+        });
+      } else if(action==='delete'){
+        if(idx!==-1) list.splice(idx, 1);
+        if(kind==='block') board.links = board.links.filter(L => L.from!==op.id && L.to!==op.id);
+      }
+    });
+    return board;
+  }
+
+  function applyRoomMeta(meta){
+    state.drawn.alea = meta.alea || state.drawn.alea;
+    setNotes(meta.notes || '');
+    if(boardTitle) boardTitle.value = meta.title || '';
+    if(meta.puzzleId){ setPuzzleById(meta.puzzleId, { fromRemote:true }); }
+    aleaDisplay.textContent = state.drawn.alea||'–';
+  }
+
+  function applyRoomSnapshot(data){
+    if(data.team) state.team = data.team;
+    if(data.state){ state.board = data.state; }
+    roomVersion = data.version || 0;
+    syncedBoard = cloneBoard(state.board);
+    if(data.meta){ applyRoomMeta(data.meta); }
+    if(teamDisplay) teamDisplay.textContent = state.team||'–';
+    aleaDisplay.textContent = state.drawn.alea||'–';
+    renderBoard();
+  }
+
+  async function resyncRoom(){
+    try{ applyRoomSnapshot(await api(`/load/${state.roomId}`)); }catch{}
+  }
+
+  // Events that bump the room version without touching the board
+  function advanceRoomVersion(data){
+    if(typeof data.version !== 'number') return;
+    if(data.baseVersion === roomVersion) roomVersion = data.version;
+    else if(data.version > roomVersion) resyncRoom();
+  }
+
+  function confirmOwnPatch(version, ops){
+    if(!syncedBoard || !(version > roomVersion)) return;
+    roomVersion = version;
+    applyBoardOps(syncedBoard, ops);
   }
 
   async function syncIfRoom(){
     if(!state.roomId || state.roomId==='SOLO') return;
+    if(syncBusy){ syncQueued = true; return; }
+    syncBusy = true;
     try{
       const meta = { alea: state.drawn.alea, notes: getNotes() };
       if(state.puzzle && state.puzzle.id){ meta.puzzleId = state.puzzle.id; }
       if(boardTitle && boardTitle.value) meta.title = boardTitle.value;
-      await api(`/api/room/${state.roomId}/sync`, { method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify({ team: state.team, state: state.board, meta }) });
+      const metaJson = JSON.stringify([state.team, meta]);
+      const url = `/api/room/${state.roomId}/sync`;
+      if(!syncedBoard){
+        // No server baseline yet: send the whole board once
+        const sent = cloneBoard(state.board);
+        const res = await api(url, { method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify({ team: state.team, state: state.board, meta }) });
+        if(!syncedBoard){ syncedBoard = sent; roomVersion = res.version || 0; }
+        syncedMeta = metaJson;
+        return;
+      }
+      const ops = diffBoard(syncedBoard, state.board);
+      const body = { client: clientId, baseVersion: roomVersion, ops };
+      if(metaJson !== syncedMeta){ body.team = state.team; body.meta = meta; }
+      if(!ops.length && !body.meta) return;
+      const res = await fetch(url, { method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify(body) });
+      if(res.status === 409){
+        // Someone else changed the room first: replay our pending edits on top of theirs
+        const snap = (await res.json()).snapshot || {};
+        const pending = diffBoard(syncedBoard, state.board);
+        syncedBoard = cloneBoard(snap.state);
+        roomVersion = snap.version || 0;
+        state.board = applyBoardOps(cloneBoard(snap.state), pending);
+        renderBoard();
+        syncQueued = true;
+      } else if(res.ok){
+        const j = await res.json();
+        confirmOwnPatch(j.version, ops);
+        syncedMeta = metaJson;
+      }
     }catch{}
+    finally{
+      syncBusy = false;
+      if(syncQueued){ syncQueued = false; syncIfRoom(); }
+    }
   }
 
   function renderRoomIndicator(){
@@ -0,0 +1,143 @@
+"""Content-hashed, precompressed static assets.
+
+``app.js``, ``styles.css``, ``puzzles.json`` and ``corrige.json`` are read
+once at start-up (and again when one of them or ``index.html`` changes):
+each gets a fingerprinted URL (``/assets/app.3f2a9c1e0b.js``), the
+references to them in ``index.html`` and ``app.js`` are rewritten to those
+URLs, and gzip (plus brotli when the ``brotli`` package is installed)
+variants are compressed ahead of time. Requests then only pick a ready
+variant from ``Accept-Encoding``: no compression at request time.
+
+Fingerprinted files never change, so they are served ``immutable``;
+``index.html`` and the plain URLs revalidate with their ETag. The previous
+build stays available so a page loaded just before an edit still gets its
+assets.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+
+# Referenced files before the files that reference them (app.js fetches the JSON files)
+ASSETS = ("puzzles.json", "corrige.json", "styles.css", "app.js")
+INDEX = "index.html"
+
+# Smaller than this, compressing is not worth a variant
+MIN_COMPRESS = 512
+
+
+class Asset:
+    __slots__ = ("body", "variants", "etag", "mimetype")
+
+    def __init__(self, body: bytes, mimetype: str):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = hashlib.sha256(body).hexdigest()[:20]
+        # Content-Encoding -> body, only kept when smaller than the original
+        self.variants: dict[str, bytes] = {}
+        if len(body) >= MIN_COMPRESS:
+            candidates = {"gzip": gzip.compress(body, 9, mtime=0)}
+            if brotli is not None:
+                candidates["br"] = brotli.compress(body)
+            self.variants = {enc: data for enc, data in candidates.items() if len(data) < len(body)}
+
+
+def _mimetype(name: str) -> str:
+    mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    return f"{mimetype}; charset=utf-8" if mimetype.startswith("text/") or mimetype.endswith(("javascript", "json")) else mimetype
+
+
+def _rewrite(text: str, urls: dict[str, str]) -> str:
+    """Replace quoted absolute references ``"/name"`` / ``'/name'`` by their fingerprinted URL."""
+    for name, url in urls.items():
+        text = re.sub(r"""(["'])/%s\1""" % re.escape(name), lambda m: f"{m.group(1)}{url}{m.group(1)}", text)
+    return text
+
+
+class _Build:
+    def __init__(self, directory: str, names: tuple[str, ...]):
+        self.urls: dict[str, str] = {}
+        self.plain: dict[str, Asset] = {}
+        self.hashed: dict[str, Asset] = {}
+        for name in names:
+            with open(os.path.join(directory, name), "r", encoding="utf-8") as f:
+                text = _rewrite(f.read(), self.urls)
+            asset = Asset(text.encode("utf-8"), _mimetype(name))
+            stem, ext = os.path.splitext(name)
+            hashed = f"{stem}.{asset.etag[:10]}{ext}"
+            self.plain[name] = self.hashed[hashed] = asset
+            self.urls[name] = f"/assets/{hashed}"
+        with open(os.path.join(directory, INDEX), "r", encoding="utf-8") as f:
+            self.index = Asset(_rewrite(f.read(), self.urls).encode("utf-8"), _mimetype(INDEX))
+
+
+class StaticAssets:
+    def __init__(self, directory: str, names: tuple[str, ...] = ASSETS):
+        self.directory = directory
+        self.names = names
+        self._lock = threading.Lock()
+        # (file signatures, build, previous build's fingerprinted files), swapped as a whole
+        self._current: tuple[tuple, _Build, dict[str, Asset]] | None = None
+
+    def _signature(self) -> tuple:
+        sig = []
+        for name in (*self.names, INDEX):
+            st = os.stat(os.path.join(self.directory, name))
+            sig.append((st.st_mtime_ns, st.st_size))
+        return tuple(sig)
+
+    def _load(self) -> tuple[tuple, _Build, dict[str, Asset]]:
+        sig = self._signature()
+        current = self._current
+        if current is not None and current[0] == sig:
+            return current
+        with self._lock:
+            current = self._current
+            if current is None or current[0] != sig:
+                previous = current[1].hashed if current is not None else {}
+                current = self._current = (sig, _Build(self.directory, self.names), previous)
+            return current
+
+    def index(self) -> Asset:
+        return self._load()[1].index
+
+    def plain(self, name: str) -> Asset | None:
+        """Current content of an asset under its original name."""
+        return self._load()[1].plain.get(name)
+
+    def hashed(self, name: str) -> Asset | None:
+        """Asset behind a fingerprinted name, from this build or the one before."""
+        _, build, previous = self._load()
+        return build.hashed.get(name) or previous.get(name)
+
+    def urls(self) -> dict[str, str]:
+        return dict(self._load()[1].urls)
+
+
+def pick_encoding(accept_encoding: str, available) -> str | None:
+    """Best of the ``available`` encodings the client accepts (brotli first), None for identity."""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding:
+            accepted[coding.strip().lower()] = q
+    for coding in ("br", "gzip"):
+        if coding in available and accepted.get(coding, accepted.get("*", 0)) > 0:
+            return coding
+    return None